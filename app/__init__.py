@@ -8,7 +8,7 @@ import os
 from flask import Flask, jsonify, send_from_directory
 from flask_cors import CORS
 from app.config import config
-from app.api.analysis import analysis_bp
+from app.api.analysis import analysis_bp, prewarm_ai_service, get_job_queue
 from app.api.projects import projects_bp
 from app.api.auth import auth_bp
 from app.api.user_projects import user_projects_bp
@@ -58,6 +58,20 @@ def create_app(config_override=None):
     # Add global endpoints
     register_global_endpoints(app)
     
+    # The AI service can only start with a key, unless it uses the local stub
+    ai_configured = bool(app_config.GEMINI_API_KEY) or getattr(app_config, 'AI_PROVIDER', 'gemini') != 'gemini'
+    
+    # Warm up model discovery and AI clients off the request path
+    if getattr(app_config, 'AI_PREWARM', False) and ai_configured:
+        prewarm_ai_service()
+    
+    # Start job workers so jobs left over from a previous run resume
+    if getattr(app_config, 'ANALYSIS_JOBS_ENABLED', False) and ai_configured:
+        try:
+            get_job_queue()
+        except Exception as e:
+            print(f"Analysis job queue unavailable: {str(e)}")
+    
     return app
 
 
@@ -129,7 +143,7 @@ app = create_app()
 if __name__ == '__main__':
     print(f"Starting Code Critique Engine API...")
     print(f"Debug mode: {config.DEBUG}")
-    print(f"AI Model: {config.GEMINI_MODEL}")
+    print(f"AI Model: {config.GEMINI_MODEL or 'auto-discover'}")
     print(f"PocketBase URL: {config.POCKETBASE_URL}")
     
     app.run(
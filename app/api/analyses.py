@@ -115,6 +115,7 @@ def get_analysis(current_user, analysis_id):
             'reports': result.reports,
             'refactored_code': result.refactored_code,
             'roadmap': result.roadmap,
+            'stages': getattr(result, 'stages', None),
             'project_id': result.project_id
         }
         
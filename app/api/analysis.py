@@ -4,14 +4,29 @@ Analysis API Endpoints
 This module handles code analysis requests with proper validation,
 error handling, and response formatting with optional project context.
 """
-from flask import Blueprint, request, jsonify
-from app.services.ai_service import AIAnalysisService
+import json
+import math
+import threading
+import time
+from flask import Blueprint, Response, request, jsonify, stream_with_context, url_for
+from app.config import config
+from app.services.ai_service import AIAnalysisService, ANALYSIS_STAGES, REPORT_KEYS
+from app.services.ai_executor import AIExecutorSaturatedError, AIDeadlineExceededError, PRIORITY_BATCH
+from app.services.circuit_breaker import CircuitOpenError
+from app.services.job_queue import AnalysisJobQueue, JOB_QUEUED
 from app.services.pocketbase_service import PocketBaseService
-from app.utils.validation import validate_code_input, validate_prompt_input, ValidationError
+from app.utils.code_metrics import compute_code_metrics
+from app.utils.code_minifier import TokenBudgetExceededError
+from app.utils.validation import (
+    validate_code_input, validate_id_parameter, validate_prompt_input, validate_stages_input, ValidationError
+)
 from app.api.auth import require_auth
 
 analysis_bp = Blueprint('analysis', __name__)
 ai_service = None  # Lazy initialization
+_ai_service_lock = threading.Lock()
+job_queue = None  # Lazy initialization
+_job_queue_lock = threading.Lock()
 pb_service = PocketBaseService()
 
 
@@ -19,10 +34,272 @@ def get_ai_service():
     """Get or initialize the AI service"""
     global ai_service
     if ai_service is None:
-        ai_service = AIAnalysisService()
+        with _ai_service_lock:
+            if ai_service is None:
+                ai_service = AIAnalysisService()
     return ai_service
 
 
+def prewarm_ai_service():
+    """Initialize the AI service in the background so the first request doesn't pay for it"""
+    def run():
+        try:
+            get_ai_service()
+        except Exception as e:
+            print(f"AI service prewarm failed: {str(e)}")
+
+    threading.Thread(target=run, name='ai-service-prewarm', daemon=True).start()
+
+
+def get_job_queue():
+    """Get or start the background analysis job queue and its workers"""
+    global job_queue
+    if job_queue is None:
+        with _job_queue_lock:
+            if job_queue is None:
+                job_queue = AnalysisJobQueue(
+                    db_path=config.ANALYSIS_JOBS_DB,
+                    handler=_run_analysis_job,
+                    workers=config.ANALYSIS_JOB_WORKERS,
+                    lease_seconds=config.AI_ANALYSIS_DEADLINE + 60,
+                    max_attempts=config.ANALYSIS_JOB_MAX_ATTEMPTS,
+                    retention_seconds=config.ANALYSIS_JOB_RETENTION,
+                    retry_on=(AIExecutorSaturatedError, CircuitOpenError)
+                )
+    return job_queue
+
+
+def _run_analysis_job(payload):
+    """
+    Run a queued analysis job and persist its result
+    
+    Args:
+        payload: Job payload with the authenticated user, their auth token and
+            the validated request
+        
+    Returns:
+        Tuple of (results, analysis_id)
+        
+    Raises:
+        Exception: If the results could not be saved, so the job is marked failed
+    """
+    current_user = payload['user']
+    analysis_request = payload['request']
+    results = get_ai_service().analyze_code(
+        analysis_request['prompt'],
+        analysis_request['code'],
+        project_context=analysis_request['project_context'],
+        project_id=analysis_request['project_id'],
+        user_id=current_user['id'],
+        priority=PRIORITY_BATCH,
+        stages=analysis_request['stages']
+    )
+    analysis_id = _save_analysis(current_user, analysis_request, results, token=payload.get('token'))
+    if analysis_id is None:
+        raise Exception("Failed to save analysis results")
+    return results, analysis_id
+
+
+def _validate_analysis_payload(data, current_user, project_contexts=None, token=None):
+    """
+    Validate one analysis payload and resolve its optional project context
+    
+    Args:
+        data: Payload dict with prompt, code and optional project_id and stages
+        current_user: Authenticated user record
+        project_contexts: Optional dict caching resolved contexts by project id
+        token: User auth token to read the project as
+        
+    Returns:
+        Tuple of (request dict, None) on success or (None, (message, status))
+    """
+    # Extract and validate inputs
+    try:
+        prompt = validate_prompt_input(data.get('prompt', ''))
+        max_code_length = config.MAX_CHUNKED_CODE_LENGTH if config.AI_CHUNKING_ENABLED else config.MAX_CODE_LENGTH
+        code = validate_code_input(data.get('code', ''), max_length=max_code_length)
+        project_id = data.get('project_id')
+        stages = validate_stages_input(data.get('stages'), ANALYSIS_STAGES)
+    except ValidationError as e:
+        return None, (f"Validation error: {str(e)}", 400)
+
+    # Fetch project context if project_id provided
+    project_context = None
+    if project_id and project_contexts is not None and project_id in project_contexts:
+        project_context = project_contexts[project_id]
+    elif project_id:
+        try:
+            project = pb_service.get_record('projects', project_id, token=token)
+        except Exception as e:
+            print(f"Failed to fetch project context: {str(e)}")
+            # Continue without context rather than failing
+            project = None
+        else:
+            if project is None:
+                return None, ("Project not found", 404)
+            # Verify ownership
+            if project.get('user_id') != current_user['id']:
+                return None, ("Unauthorized access to project", 403)
+        
+        if project is not None:
+            # Build context string
+            project_context = f"""
+Project Context:
+- Name: {project.get('name')}
+- Description: {project.get('description') or 'No description'}
+- Stack: {', '.join(project['stack']) if project.get('stack') else 'Not specified'}
+- Architecture: {project.get('architecture_type') or 'Not specified'}
+- Code Style Preferences: {project.get('code_style') or 'Not specified'}
+
+Given this project context, please provide analysis that aligns with the project's architecture and coding patterns.
+"""
+        
+        if project_contexts is not None:
+            project_contexts[project_id] = project_context
+
+    return {
+        'prompt': prompt,
+        'code': code,
+        'project_id': project_id,
+        'project_context': project_context,
+        'stages': stages
+    }, None
+
+
+def _prepare_analysis_request(current_user):
+    """
+    Validate the analysis request body and resolve optional project context
+    
+    Args:
+        current_user: Authenticated user record
+        
+    Returns:
+        Tuple of (request dict, None) on success or (None, error response)
+    """
+    # Parse and validate request data
+    data = request.get_json()
+    if not data:
+        return None, (jsonify({"error": "No JSON data received"}), 400)
+    if 'stages' not in data and request.args.get('stages'):
+        data = dict(data, stages=request.args['stages'])
+
+    analysis_request, error = _validate_analysis_payload(data, current_user, token=request.token)
+    if error:
+        message, status = error
+        return None, (jsonify({"error": message}), status)
+
+    prompt = analysis_request['prompt']
+
+    # Log the request (for monitoring)
+    print("-" * 50)
+    print(f"Analysis Request:")
+    print(f"  User: {current_user['email']}")
+    print(f"  Project ID: {analysis_request['project_id'] or 'None'}")
+    print(f"  Prompt: {prompt[:100]}..." if len(prompt) > 100 else f"  Prompt: {prompt}")
+    print(f"  Code length: {len(analysis_request['code'])} characters")
+    print(f"  Stages: {', '.join(analysis_request['stages'])}")
+    print("-" * 50)
+
+    return analysis_request, None
+
+
+# analyses record fields filled by each stage
+RECORD_STAGE_FIELDS = {
+    'scores': ('scores',),
+    'reports': ('reports',),
+    'refactor': ('refactored_code', 'roadmap')
+}
+
+
+def _build_analysis_record(current_user, analysis_request, results):
+    """Build the analyses collection record for a completed analysis"""
+    return {
+        'user_id': current_user['id'],
+        'project_id': analysis_request['project_id'],
+        'prompt': analysis_request['prompt'],
+        'code': analysis_request['code'],
+        'scores': {
+            key: results[key]
+            for key in ('total_score', 'reliability_score', 'mastery_score', 'explanation_summary')
+            if key in results
+        },
+        # The service flattens the report into top-level keys
+        'reports': {key: results[key] for key in REPORT_KEYS if key in results},
+        'refactored_code': results.get('refactored_code'),
+        'roadmap': results.get('project_roadmap', []),
+        'stages': results.get('stages', [])
+    }
+
+
+def _save_analysis(current_user, analysis_request, results, token=None):
+    """
+    Persist an analysis result and attach its record id to the results
+    
+    Args:
+        current_user: Authenticated user record
+        analysis_request: Validated request dict from _prepare_analysis_request
+        results: Combined AI analysis results (updated in place)
+        token: User auth token to create the record as
+        
+    Returns:
+        The saved record id, or None if saving failed
+    """
+    analysis_id = None
+    try:
+        analysis_data = _build_analysis_record(current_user, analysis_request, results)
+        saved_analysis = pb_service.create_record('analyses', analysis_data, token=token)
+        analysis_id = saved_analysis['id']
+        results['analysis_id'] = analysis_id
+        print(f"Saved analysis: {analysis_id}")
+    except Exception as e:
+        print(f"Failed to save analysis: {str(e)}")
+        # Continue without saving rather than failing
+    
+    # Log successful analysis
+    print(f"Analysis completed successfully")
+    print(f"  Total score: {results.get('total_score', 'N/A')}")
+    print(f"  Reliability: {results.get('reliability_score', 'N/A')}")
+    print(f"  Mastery: {results.get('mastery_score', 'N/A')}")
+    
+    return analysis_id
+
+
+def _analysis_error_response(error):
+    """Map an AI service failure to an HTTP error response"""
+    if isinstance(error, AIExecutorSaturatedError):
+        print(f"AI analysis rejected: {str(error)}")
+        return jsonify({
+            "error": "Analysis service is busy",
+            "details": "Too many analyses in progress, please retry shortly"
+        }), 503
+    if isinstance(error, CircuitOpenError):
+        print(f"AI analysis rejected: {str(error)}")
+        response = jsonify({
+            "error": "Analysis service is temporarily unavailable",
+            "details": "The AI model is failing, please retry shortly",
+            "retry_after": round(error.retry_after, 1)
+        })
+        response.headers['Retry-After'] = str(max(1, math.ceil(error.retry_after)))
+        return response, 503
+    if isinstance(error, TokenBudgetExceededError):
+        print(f"AI analysis rejected: {str(error)}")
+        return jsonify({
+            "error": "Code is too large to analyze",
+            "details": str(error)
+        }), 413
+    if isinstance(error, AIDeadlineExceededError):
+        print(f"AI analysis timed out: {str(error)}")
+        return jsonify({
+            "error": "Analysis timed out",
+            "details": str(error)
+        }), 504
+    print(f"AI analysis failed: {str(error)}")
+    return jsonify({
+        "error": "Analysis failed",
+        "details": str(error)
+    }), 500
+
+
 @analysis_bp.route('/analyze', methods=['POST'])
 @require_auth
 def analyze_code(current_user):
@@ -33,111 +310,460 @@ def analyze_code(current_user):
     {
         "prompt": "The original AI prompt",
         "code": "The AI-generated code to analyze",
-        "project_id": "optional_project_id_for_context"
+        "project_id": "optional_project_id_for_context",
+        "stages": ["scores", "reports", "refactor"]
     }
     
+    "stages" (or ?stages=scores,reports) limits the analysis to those stages;
+    it defaults to all. The saved record lists the stages it holds, and
+    POST /analyze/<analysis_id>/complete fills in the rest later.
+    
+    With ?async=1 the analysis is queued as a background job instead and the
+    response is 202 with a job id; poll GET /analyze/jobs/<job_id> for status.
+    
+    With ?mode=quick only local static metrics are computed (no AI call, no
+    project lookup, nothing saved); "prompt" and "project_id" are ignored.
+    
     Returns:
         JSON response with analysis results or error information
     """
     try:
-        # Parse and validate request data
-        data = request.get_json()
-        if not data:
-            return jsonify({"error": "No JSON data received"}), 400
+        mode = request.args.get('mode', 'full').lower()
+        if mode == 'quick':
+            return _quick_analysis()
+        if mode != 'full':
+            return jsonify({"error": "mode must be 'full' or 'quick'"}), 400
+
+        analysis_request, error_response = _prepare_analysis_request(current_user)
+        if error_response:
+            return error_response
 
-        # Extract and validate inputs
+        if request.args.get('async', '').lower() in ('1', 'true', 'yes'):
+            return _enqueue_analysis_job(current_user, analysis_request)
+
+        # Perform AI analysis with optional context
         try:
-            prompt = validate_prompt_input(data.get('prompt', ''))
-            code = validate_code_input(data.get('code', ''))
-            project_id = data.get('project_id')
+            service = get_ai_service()
+            results = service.analyze_code(
+                analysis_request['prompt'],
+                analysis_request['code'],
+                project_context=analysis_request['project_context'],
+                project_id=analysis_request['project_id'],
+                user_id=current_user['id'],
+                stages=analysis_request['stages']
+            )
+        except Exception as e:
+            return _analysis_error_response(e)
+        
+        # Save analysis to database
+        _save_analysis(current_user, analysis_request, results, token=request.token)
+        
+        return jsonify(results), 200
+
+    except Exception as e:
+        print(f"Unexpected error in analyze_code: {str(e)}")
+        return jsonify({
+            "error": "Internal server error",
+            "details": "An unexpected error occurred during analysis"
+        }), 500
+
+
+def _quick_analysis():
+    """Compute local static metrics for the submitted code, without calling the AI"""
+    data = request.get_json()
+    if not data:
+        return jsonify({"error": "No JSON data received"}), 400
+
+    try:
+        max_code_length = config.MAX_CHUNKED_CODE_LENGTH if config.AI_CHUNKING_ENABLED else config.MAX_CODE_LENGTH
+        # The metrics parse the code themselves and report whether it parsed
+        code = validate_code_input(data.get('code', ''), max_length=max_code_length, check_syntax=False)
+    except ValidationError as e:
+        return jsonify({"error": f"Validation error: {str(e)}"}), 400
+
+    started_at = time.perf_counter()
+    metrics = compute_code_metrics(code)
+    return jsonify({
+        "mode": "quick",
+        "metrics": metrics,
+        "elapsed_ms": round((time.perf_counter() - started_at) * 1000, 2)
+    }), 200
+
+
+def _enqueue_analysis_job(current_user, analysis_request):
+    """Queue an analysis as a background job and return 202 with its id"""
+    if not config.ANALYSIS_JOBS_ENABLED:
+        return jsonify({"error": "Background analysis jobs are disabled"}), 400
+
+    try:
+        job_id = get_job_queue().enqueue(current_user['id'], {
+            'user': {'id': current_user['id'], 'email': current_user.get('email')},
+            # The worker saves the result as the user, outside the request
+            'token': request.token,
+            'request': analysis_request
+        })
+    except Exception as e:
+        print(f"Failed to enqueue analysis job: {str(e)}")
+        return jsonify({
+            "error": "Analysis job queue unavailable",
+            "details": "Could not queue the analysis, please retry"
+        }), 503
+
+    print(f"Queued analysis job {job_id} for {current_user['email']}")
+    return jsonify({
+        "job_id": job_id,
+        "status": JOB_QUEUED,
+        "status_url": url_for('analysis.get_analysis_job', job_id=job_id)
+    }), 202
+
+
+@analysis_bp.route('/analyze/jobs/<job_id>', methods=['GET'])
+@require_auth
+def get_analysis_job(current_user, job_id):
+    """
+    Report the status of a background analysis job
+    
+    Returns:
+        JSON response with job status, and the results/analysis_id once it
+        has succeeded or the error once it has failed
+    """
+    try:
+        job = get_job_queue().get(job_id)
+    except Exception as e:
+        print(f"Failed to read analysis job {job_id}: {str(e)}")
+        return jsonify({"error": "Analysis job queue unavailable"}), 503
+
+    # Other users' jobs are indistinguishable from missing ones
+    if job is None or job['user_id'] != current_user['id']:
+        return jsonify({"error": "Job not found"}), 404
+
+    response = {
+        "job_id": job['id'],
+        "status": job['status'],
+        "attempts": job['attempts'],
+        "created_at": job['created_at'],
+        "updated_at": job['updated_at']
+    }
+    if job['result'] is not None:
+        response['result'] = job['result']
+        response['analysis_id'] = job['analysis_id']
+    if job['error']:
+        response['error'] = job['error']
+
+    return jsonify(response), 200
+
+
+@analysis_bp.route('/analyze/async', methods=['POST'])
+@require_auth
+async def analyze_code_async(current_user):
+    """
+    Async variant of /analyze that awaits the AI stages instead of blocking on them
+    
+    Accepts the same JSON payload and returns the same response as /analyze.
+    
+    Returns:
+        JSON response with analysis results or error information
+    """
+    try:
+        analysis_request, error_response = _prepare_analysis_request(current_user)
+        if error_response:
+            return error_response
+
+        try:
+            service = get_ai_service()
+            results = await service.analyze_code_async(
+                analysis_request['prompt'],
+                analysis_request['code'],
+                project_context=analysis_request['project_context'],
+                project_id=analysis_request['project_id'],
+                user_id=current_user['id'],
+                stages=analysis_request['stages']
+            )
+        except Exception as e:
+            return _analysis_error_response(e)
+        
+        _save_analysis(current_user, analysis_request, results, token=request.token)
+        
+        return jsonify(results), 200
+
+    except Exception as e:
+        print(f"Unexpected error in analyze_code_async: {str(e)}")
+        return jsonify({
+            "error": "Internal server error",
+            "details": "An unexpected error occurred during analysis"
+        }), 500
+
+
+def _sse_event(event, data):
+    """Format a single Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@analysis_bp.route('/analyze/stream', methods=['POST'])
+@require_auth
+def analyze_code_stream(current_user):
+    """
+    Analyze code and stream each stage as a Server-Sent Event as it completes
+    
+    Accepts the same JSON payload as /analyze. Emits one event per requested
+    stage ("scores", "reports", "refactor") in completion order, then a "complete"
+    event with the combined results and analysis_id, or an "error" event.
+    While the refactor stage is generated, "refactor_delta" events carry the
+    refactored code as it arrives ({"text": ...}) and "refactor_reset" means a
+    retry started over; the "refactor" event holds the final, validated text,
+    which is what gets saved.
+    
+    Returns:
+        text/event-stream response
+    """
+    analysis_request, error_response = _prepare_analysis_request(current_user)
+    if error_response:
+        return error_response
+    token = request.token
+
+    def generate():
+        try:
+            service = get_ai_service()
+            for stage, payload in service.analyze_code_stream(
+                analysis_request['prompt'],
+                analysis_request['code'],
+                project_context=analysis_request['project_context'],
+                project_id=analysis_request['project_id'],
+                user_id=current_user['id'],
+                stages=analysis_request['stages']
+            ):
+                if stage == 'complete':
+                    _save_analysis(current_user, analysis_request, payload, token=token)
+                yield _sse_event(stage, payload)
+        except Exception as e:
+            response, status = _analysis_error_response(e)
+            yield _sse_event('error', dict(response.get_json(), status=status))
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@analysis_bp.route('/analyze/batch', methods=['POST'])
+@require_auth
+def analyze_batch(current_user):
+    """
+    Analyze many snippets in one request, streaming results as NDJSON
+    
+    Expected JSON payload:
+    {
+        "items": [
+            {"prompt": "...", "code": "...", "project_id": "optional", "stages": ["optional"]},
+            ...
+        ]
+    }
+    
+    Each output line is a JSON object: {"type": "result", "index": i, "result": {...}}
+    or {"type": "error", "index": i, "error": "...", "status": code}, in completion
+    order. Successful analyses are persisted in groups of up to
+    BATCH_SAVE_CHUNK_SIZE records as they complete (and whatever is left when the
+    client disconnects), reported in a final {"type": "summary",
+    "analysis_ids": {index: id}} line.
+    
+    Returns:
+        application/x-ndjson response
+    """
+    data = request.get_json()
+    items = data.get('items') if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "Request must include a non-empty 'items' list"}), 400
+    if len(items) > config.MAX_BATCH_ITEMS:
+        return jsonify({"error": f"Batch exceeds maximum of {config.MAX_BATCH_ITEMS} items"}), 400
+
+    # Validate every item up front; invalid items are reported, not analyzed
+    project_contexts = {}
+    valid = []
+    rejected = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            rejected.append((index, ("Item must be a JSON object", 400)))
+            continue
+        analysis_request, error = _validate_analysis_payload(item, current_user, project_contexts, token=request.token)
+        if error:
+            rejected.append((index, error))
+        else:
+            valid.append((index, analysis_request))
+
+    print(f"Batch analysis request: {len(valid)} valid, {len(rejected)} rejected ({current_user['email']})")
+    token = request.token
+
+    def generate():
+        for index, (message, status) in rejected:
+            yield json.dumps({"type": "error", "index": index, "error": message, "status": status}) + "\n"
+
+        completed = 0
+        unsaved = []
+        analysis_ids = {}
+
+        def save_unsaved():
+            """Persist the results not saved yet"""
+            records = unsaved[:]
+            del unsaved[:]
+            ids = pb_service.create_records('analyses', [record for _, record in records], token=token)
+            analysis_ids.update({index: record_id for (index, _), record_id in zip(records, ids)})
+
+        try:
+            if valid:
+                service = get_ai_service()
+                batch = [dict(analysis_request, user_id=current_user['id']) for _, analysis_request in valid]
+                for position, outcome in service.analyze_batch(batch):
+                    index, analysis_request = valid[position]
+                    if isinstance(outcome, Exception):
+                        response, status = _analysis_error_response(outcome)
+                        yield json.dumps(dict(response.get_json(), type="error", index=index, status=status)) + "\n"
+                        continue
+                    completed += 1
+                    unsaved.append((index, _build_analysis_record(current_user, analysis_request, outcome)))
+                    yield json.dumps({"type": "result", "index": index, "result": outcome}, ensure_ascii=False) + "\n"
+                    if len(unsaved) >= config.BATCH_SAVE_CHUNK_SIZE:
+                        save_unsaved()
+        finally:
+            # Also runs when the client disconnects mid-stream, so finished
+            # analyses are not lost
+            if unsaved:
+                save_unsaved()
+            print(f"Batch analysis saved {sum(1 for i in analysis_ids.values() if i)} of {completed} results")
+
+        yield json.dumps({
+            "type": "summary",
+            "succeeded": completed,
+            "failed": len(items) - completed,
+            "analysis_ids": analysis_ids
+        }) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+def _record_stages(record):
+    """Get the stages a saved analysis holds, inferring them for records saved before stages were tracked"""
+    stages = record.get('stages')
+    if isinstance(stages, list):
+        return [stage for stage in ANALYSIS_STAGES if stage in stages]
+
+    present = {
+        'scores': (record.get('scores') or {}).get('total_score') is not None,
+        'reports': bool(record.get('reports')),
+        'refactor': bool(record.get('refactored_code'))
+    }
+    return [stage for stage in ANALYSIS_STAGES if present[stage]]
+
+
+@analysis_bp.route('/analyze/<analysis_id>/complete', methods=['POST'])
+@require_auth
+def complete_analysis(current_user, analysis_id):
+    """
+    Run the stages a saved analysis is missing and add them to its record
+    
+    Optional JSON payload (or ?stages=reports,refactor):
+    {
+        "stages": ["reports", "refactor"]
+    }
+    
+    Requested stages the analysis already holds are skipped; by default every
+    missing stage runs. Prompt, code and project context come from the saved
+    analysis.
+    
+    Returns:
+        JSON response with the new stage results, the stages filled in
+        ("filled") and every stage the analysis now holds ("stages")
+    """
+    try:
+        try:
+            analysis_id = validate_id_parameter(analysis_id, "Analysis ID")
+            data = request.get_json(silent=True) or {}
+            requested = validate_stages_input(data.get('stages', request.args.get('stages')), ANALYSIS_STAGES)
         except ValidationError as e:
             return jsonify({"error": f"Validation error: {str(e)}"}), 400
 
-        # Fetch project context if project_id provided
-        project_context = None
-        if project_id:
-            try:
-                project = pb_service.pb.collection('projects').get_one(project_id)
-                # Verify ownership
-                if project.user_id != current_user['id']:
-                    return jsonify({"error": "Unauthorized access to project"}), 403
-                
-                # Build context string
-                project_context = f"""
-Project Context:
-- Name: {project.name}
-- Description: {project.description or 'No description'}
-- Stack: {', '.join(project.stack) if project.stack else 'Not specified'}
-- Architecture: {project.architecture_type or 'Not specified'}
-- Code Style Preferences: {project.code_style if project.code_style else 'Not specified'}
+        record = pb_service.get_record('analyses', analysis_id, token=request.token)
+        if record is None:
+            return jsonify({"error": "Analysis not found"}), 404
+        if record.get('user_id') != current_user['id']:
+            return jsonify({"error": "Unauthorized access to analysis"}), 403
 
-Given this project context, please provide analysis that aligns with the project's architecture and coding patterns.
-"""
-            except Exception as e:
-                print(f"Failed to fetch project context: {str(e)}")
-                # Continue without context rather than failing
-
-        # Log the request (for monitoring)
-        print("-" * 50)
-        print(f"Analysis Request:")
-        print(f"  User: {current_user['email']}")
-        print(f"  Project ID: {project_id or 'None'}")
-        print(f"  Prompt: {prompt[:100]}..." if len(prompt) > 100 else f"  Prompt: {prompt}")
-        print(f"  Code length: {len(code)} characters")
-        print("-" * 50)
+        present = _record_stages(record)
+        missing = [stage for stage in requested if stage not in present]
+        if not missing:
+            return jsonify({"analysis_id": analysis_id, "filled": [], "stages": present}), 200
 
-        # Perform AI analysis with optional context
+        analysis_request, error = _validate_analysis_payload({
+            'prompt': record.get('prompt', ''),
+            'code': record.get('code', ''),
+            'project_id': record.get('project_id') or None,
+            'stages': missing
+        }, current_user, token=request.token)
+        if error:
+            message, status = error
+            return jsonify({"error": message}), status
+
+        print(f"Completing analysis {analysis_id} with stages: {', '.join(missing)}")
         try:
-            service = get_ai_service()
-            results = service.analyze_code(prompt, code, project_context=project_context)
-            
-            # Save analysis to database
+            results = get_ai_service().analyze_code(
+                analysis_request['prompt'],
+                analysis_request['code'],
+                project_context=analysis_request['project_context'],
+                project_id=analysis_request['project_id'],
+                user_id=current_user['id'],
+                stages=analysis_request['stages']
+            )
+        except Exception as e:
+            return _analysis_error_response(e)
+
+        # Stages that failed stay missing so they can be requested again
+        filled = [stage for stage in results.get('stages', []) if stage in missing]
+        fields = _build_analysis_record(current_user, analysis_request, results)
+        update = {field: fields[field] for stage in filled for field in RECORD_STAGE_FIELDS[stage]}
+        update['stages'] = [stage for stage in ANALYSIS_STAGES if stage in present or stage in filled]
+        if filled:
             try:
-                analysis_data = {
-                    'user_id': current_user['id'],
-                    'project_id': project_id,
-                    'prompt': prompt,
-                    'code': code,
-                    'scores': {
-                        'total_score': results.get('total_score'),
-                        'reliability_score': results.get('reliability_score'),
-                        'mastery_score': results.get('mastery_score'),
-                        'explanation_summary': results.get('explanation_summary')
-                    },
-                    'reports': results.get('reports', {}),
-                    'refactored_code': results.get('refactored_code'),
-                    'roadmap': results.get('project_roadmap', [])
-                }
-                saved_analysis = pb_service.pb.collection('analyses').create(analysis_data)
-                results['analysis_id'] = saved_analysis.id
-                print(f"Saved analysis: {saved_analysis.id}")
+                pb_service.update_record('analyses', analysis_id, update, token=request.token)
             except Exception as e:
-                print(f"Failed to save analysis: {str(e)}")
-                # Continue without saving rather than failing
-            
-            # Log successful analysis
-            print(f"Analysis completed successfully")
-            print(f"  Total score: {results.get('total_score', 'N/A')}")
-            print(f"  Reliability: {results.get('reliability_score', 'N/A')}")
-            print(f"  Mastery: {results.get('mastery_score', 'N/A')}")
-            
-            return jsonify(results), 200
-            
-        except Exception as e:
-            print(f"AI analysis failed: {str(e)}")
-            return jsonify({
-                "error": "Analysis failed",
-                "details": str(e)
-            }), 500
+                print(f"Failed to update analysis {analysis_id}: {str(e)}")
+
+        results.update(analysis_id=analysis_id, filled=filled, stages=update['stages'])
+        return jsonify(results), 200
 
     except Exception as e:
-        print(f"Unexpected error in analyze_code: {str(e)}")
+        print(f"Unexpected error in complete_analysis: {str(e)}")
         return jsonify({
             "error": "Internal server error",
-            "details": "An unexpected error occurred during analysis"
+            "details": "An unexpected error occurred while completing the analysis"
         }), 500
 
 
+@analysis_bp.route('/analyze/scheduler', methods=['GET'])
+@require_auth
+def scheduler_metrics(current_user):
+    """
+    Scheduler queue metrics for the current user's tenants
+    
+    Returns:
+        JSON response with per-priority metrics and the caller's per-tenant
+        queue depth and queue-time percentiles
+    """
+    try:
+        metrics = get_ai_service().executor.metrics()
+    except Exception as e:
+        return jsonify({"error": "AI service unavailable", "details": str(e)}), 503
+
+    user_id = current_user['id']
+    return jsonify({
+        "priorities": metrics['priorities'],
+        "tenants": {
+            tenant: stats
+            for tenant, stats in metrics['tenants'].items()
+            if tenant == user_id or tenant.startswith(f"{user_id}/")
+        }
+    }), 200
+
+
 @analysis_bp.route('/health', methods=['GET'])
 def health_check():
     """
@@ -152,15 +778,28 @@ def health_check():
             service = get_ai_service()
             ai_available = "available"
             model = service.model_name
+            cache_stats = service.cache.stats() if service.cache else None
+            executor_stats = service.executor.metrics()
+            # Per-tenant figures identify users; they are served by /analyze/scheduler
+            executor_stats['tenants'] = len(executor_stats['tenants'])
+            executor_stats['hedging'] = service.hedging.stats()
+            executor_stats['circuits'] = service.circuit_stats()
+            executor_stats['routing'] = service.router.stats()
+            executor_stats['single_flight'] = service.in_flight.stats()
+            executor_stats['micro_batching'] = service.micro_batcher.stats() if service.micro_batcher else None
         except Exception as e:
             ai_available = f"unavailable: {str(e)}"
             model = "none"
+            cache_stats = None
+            executor_stats = None
         
         health_status = {
             "status": "healthy",
             "service": "analysis",
             "ai_service": ai_available,
-            "model": model
+            "model": model,
+            "cache": cache_stats,
+            "executor": executor_stats
         }
         
         return jsonify(health_status), 200
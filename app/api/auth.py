@@ -4,7 +4,7 @@ Authentication API Endpoints
 Handles user registration, login, logout, and profile management
 using PocketBase authentication.
 """
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from app.services.pocketbase_service import PocketBaseService
 from app.utils.validation import validate_auth_input
 from functools import wraps
@@ -43,7 +43,8 @@ def require_auth(f):
         request.token = token
         
         # Pass user as first argument to the decorated function
-        return f(user, *args, **kwargs)
+        # (ensure_sync lets the decorator wrap async views as well)
+        return current_app.ensure_sync(f)(user, *args, **kwargs)
     
     return decorated_function
 
@@ -5,8 +5,9 @@ This module provides centralized configuration management for the Code Critique
 Supports environment-based configuration with validation and defaults.
 """
 import os
+import tempfile
 from dataclasses import dataclass, field
-from typing import Optional, List
+from typing import Dict, Optional, List
 
 
 @dataclass
@@ -18,10 +19,91 @@ class Config:
     DEBUG: bool = os.getenv('FLASK_DEBUG', 'False').lower() in ('true', '1', 'yes')
     
     # AI Service Configuration
+    AI_PROVIDER: str = os.getenv('AI_PROVIDER', 'gemini').lower()  # 'gemini' or 'stub' (offline load testing)
     GEMINI_API_KEY: str = os.getenv('GEMINI_API_KEY', '')
-    GEMINI_MODEL: str = os.getenv('GEMINI_MODEL', 'models/gemini-1.5-flash')
+    GEMINI_MODEL: str = os.getenv('GEMINI_MODEL', '')  # Explicit model; empty means discover
+    MODEL_CACHE_FILE: str = os.getenv('MODEL_CACHE_FILE', os.path.join(tempfile.gettempdir(), 'code-critique-models.json'))
+    MODEL_CACHE_TTL: int = int(os.getenv('MODEL_CACHE_TTL', '86400'))
+    AI_PREWARM: bool = os.getenv('AI_PREWARM', 'True').lower() in ('true', '1', 'yes')
     AI_REQUEST_TIMEOUT: int = int(os.getenv('AI_REQUEST_TIMEOUT', '30'))
     MAX_CONCURRENT_AI_REQUESTS: int = int(os.getenv('MAX_CONCURRENT_AI_REQUESTS', '3'))
+    AI_EXECUTOR_WORKERS: int = int(os.getenv('AI_EXECUTOR_WORKERS', os.getenv('MAX_CONCURRENT_AI_REQUESTS', '3')))
+    AI_EXECUTOR_MAX_QUEUE: int = int(os.getenv('AI_EXECUTOR_MAX_QUEUE', '100'))
+    AI_INTERACTIVE_RESERVE: int = int(os.getenv('AI_INTERACTIVE_RESERVE', '1'))  # Workers kept free of batch calls (capped at workers - 1)
+    AI_TENANT_MAX_QUEUE: int = int(os.getenv('AI_TENANT_MAX_QUEUE', '50'))  # 0 disables the per-tenant cap
+    # Fair-share weights as "user_id=2,user_id/project_id=0.5"; unlisted tenants weigh 1
+    AI_TENANT_WEIGHTS: Dict[str, float] = field(default_factory=lambda: {
+        tenant.strip(): float(weight)
+        for tenant, _, weight in (
+            item.partition('=') for item in os.getenv('AI_TENANT_WEIGHTS', '').split(',') if '=' in item
+        )
+    })
+    AI_ANALYSIS_DEADLINE: int = int(os.getenv('AI_ANALYSIS_DEADLINE', '120'))
+    AI_ANALYSIS_MODE: str = os.getenv('AI_ANALYSIS_MODE', 'fanout').lower()  # 'fanout' or 'consolidated'
+    AI_MINIFY_WHITESPACE: bool = os.getenv('AI_MINIFY_WHITESPACE', 'True').lower() in ('true', '1', 'yes')
+    AI_MINIFY_SCORES_DOCS: bool = os.getenv('AI_MINIFY_SCORES_DOCS', 'True').lower() in ('true', '1', 'yes')
+    AI_STATIC_METRICS_IN_PROMPT: bool = os.getenv('AI_STATIC_METRICS_IN_PROMPT', 'True').lower() in ('true', '1', 'yes')
+    AI_MAX_INPUT_TOKENS: int = int(os.getenv('AI_MAX_INPUT_TOKENS', '30000'))
+    AI_FANOUT_MAX_TOKENS: int = int(os.getenv('AI_FANOUT_MAX_TOKENS', '0'))  # 0 disables routing
+    AI_CHUNKING_ENABLED: bool = os.getenv('AI_CHUNKING_ENABLED', 'True').lower() in ('true', '1', 'yes')  # Chunks only code over MAX_CODE_LENGTH
+    AI_CHUNK_SIZE: int = int(os.getenv('AI_CHUNK_SIZE', '8000'))
+    MAX_CHUNKED_CODE_LENGTH: int = int(os.getenv('MAX_CHUNKED_CODE_LENGTH', '100000'))
+    AI_INCREMENTAL_ENABLED: bool = os.getenv('AI_INCREMENTAL_ENABLED', 'False').lower() in ('true', '1', 'yes')
+    AI_INCREMENTAL_MAX_UNITS: int = int(os.getenv('AI_INCREMENTAL_MAX_UNITS', '25'))
+    INCREMENTAL_STORE_MAX_ENTRIES: int = int(os.getenv('INCREMENTAL_STORE_MAX_ENTRIES', '5000'))
+    INCREMENTAL_STORE_TTL: int = int(os.getenv('INCREMENTAL_STORE_TTL', '604800'))
+    INCREMENTAL_STORE_DIR: str = os.getenv('INCREMENTAL_STORE_DIR', '')
+    INCREMENTAL_STORE_DISK_MAX_ENTRIES: int = int(os.getenv('INCREMENTAL_STORE_DISK_MAX_ENTRIES', '20000'))
+    AI_BATCH_CONCURRENCY: int = int(os.getenv('AI_BATCH_CONCURRENCY', '4'))
+    MAX_BATCH_ITEMS: int = int(os.getenv('MAX_BATCH_ITEMS', '100'))
+    BATCH_SAVE_CHUNK_SIZE: int = int(os.getenv('BATCH_SAVE_CHUNK_SIZE', '10'))
+    AI_HEDGING_ENABLED: bool = os.getenv('AI_HEDGING_ENABLED', 'False').lower() in ('true', '1', 'yes')
+    AI_HEDGE_PERCENTILE: float = float(os.getenv('AI_HEDGE_PERCENTILE', '0.95'))
+    AI_HEDGE_MAX_RATE: float = float(os.getenv('AI_HEDGE_MAX_RATE', '0.1'))
+    AI_HEDGE_MIN_SAMPLES: int = int(os.getenv('AI_HEDGE_MIN_SAMPLES', '20'))
+    AI_SINGLE_FLIGHT_ENABLED: bool = os.getenv('AI_SINGLE_FLIGHT_ENABLED', 'True').lower() in ('true', '1', 'yes')
+    AI_ASYNC_MAX_IN_FLIGHT: int = int(os.getenv('AI_ASYNC_MAX_IN_FLIGHT', '200'))
+    AI_RETRY_ATTEMPTS: int = int(os.getenv('AI_RETRY_ATTEMPTS', '3'))
+    AI_RETRY_BASE_DELAY: float = float(os.getenv('AI_RETRY_BASE_DELAY', '0.5'))
+    AI_RETRY_MAX_DELAY: float = float(os.getenv('AI_RETRY_MAX_DELAY', '8'))
+    AI_CIRCUIT_FAILURE_THRESHOLD: int = int(os.getenv('AI_CIRCUIT_FAILURE_THRESHOLD', '5'))
+    AI_CIRCUIT_RECOVERY_TIMEOUT: float = float(os.getenv('AI_CIRCUIT_RECOVERY_TIMEOUT', '30'))
+    AI_FAST_MODEL: str = os.getenv('AI_FAST_MODEL', '')  # Empty disables per-stage routing to a fast model
+    AI_STRONG_MODEL: str = os.getenv('AI_STRONG_MODEL', '')  # Empty means the default (GEMINI_MODEL or discovered) model
+    AI_ROUTING_SMALL_TOKENS: int = int(os.getenv('AI_ROUTING_SMALL_TOKENS', '1500'))
+    AI_ROUTING_FAST_STAGES: List[str] = field(default_factory=lambda: [
+        stage.strip() for stage in os.getenv('AI_ROUTING_FAST_STAGES', 'scores,reports').split(',') if stage.strip()
+    ])
+    AI_ROUTING_LATENCY_SLACK: float = float(os.getenv('AI_ROUTING_LATENCY_SLACK', '1.5'))
+    AI_ROUTING_MIN_SAMPLES: int = int(os.getenv('AI_ROUTING_MIN_SAMPLES', '10'))
+    AI_MICRO_BATCH_ENABLED: bool = os.getenv('AI_MICRO_BATCH_ENABLED', 'False').lower() in ('true', '1', 'yes')
+    AI_MICRO_BATCH_MAX_SIZE: int = int(os.getenv('AI_MICRO_BATCH_MAX_SIZE', '8'))
+    AI_MICRO_BATCH_WINDOW_MS: float = float(os.getenv('AI_MICRO_BATCH_WINDOW_MS', '20'))
+    AI_MICRO_BATCH_MAX_TOKENS: int = int(os.getenv('AI_MICRO_BATCH_MAX_TOKENS', '400'))  # Largest code batched
+    AI_STREAM_REFACTOR_TOKENS: bool = os.getenv('AI_STREAM_REFACTOR_TOKENS', 'True').lower() in ('true', '1', 'yes')
+    
+    # Stub AI Provider (AI_PROVIDER=stub)
+    AI_STUB_LATENCY_MS: float = float(os.getenv('AI_STUB_LATENCY_MS', '800'))  # Median latency
+    AI_STUB_LATENCY_SIGMA: float = float(os.getenv('AI_STUB_LATENCY_SIGMA', '0.5'))  # Log-normal spread
+    AI_STUB_ERROR_RATE: float = float(os.getenv('AI_STUB_ERROR_RATE', '0'))
+    AI_STUB_SEED: int = int(os.getenv('AI_STUB_SEED', '0'))
+    
+    # Background Analysis Jobs
+    ANALYSIS_JOBS_ENABLED: bool = os.getenv('ANALYSIS_JOBS_ENABLED', 'True').lower() in ('true', '1', 'yes')
+    ANALYSIS_JOBS_DB: str = os.getenv('ANALYSIS_JOBS_DB', os.path.join(tempfile.gettempdir(), 'code-critique-jobs.sqlite3'))
+    ANALYSIS_JOB_WORKERS: int = int(os.getenv('ANALYSIS_JOB_WORKERS', '2'))
+    ANALYSIS_JOB_MAX_ATTEMPTS: int = int(os.getenv('ANALYSIS_JOB_MAX_ATTEMPTS', '3'))
+    ANALYSIS_JOB_RETENTION: int = int(os.getenv('ANALYSIS_JOB_RETENTION', '86400'))
+    
+    # Analysis Result Cache
+    ANALYSIS_CACHE_ENABLED: bool = os.getenv('ANALYSIS_CACHE_ENABLED', 'True').lower() in ('true', '1', 'yes')
+    ANALYSIS_CACHE_MAX_ENTRIES: int = int(os.getenv('ANALYSIS_CACHE_MAX_ENTRIES', '512'))
+    ANALYSIS_CACHE_TTL: int = int(os.getenv('ANALYSIS_CACHE_TTL', '3600'))
+    ANALYSIS_CACHE_DIR: str = os.getenv('ANALYSIS_CACHE_DIR', '')
+    ANALYSIS_CACHE_DISK_MAX_ENTRIES: int = int(os.getenv('ANALYSIS_CACHE_DISK_MAX_ENTRIES', '2048'))
+    ANALYSIS_CACHE_FINGERPRINT: bool = os.getenv('ANALYSIS_CACHE_FINGERPRINT', 'True').lower() in ('true', '1', 'yes')
+    ANALYSIS_CACHE_RENAME_LOCALS: bool = os.getenv('ANALYSIS_CACHE_RENAME_LOCALS', 'False').lower() in ('true', '1', 'yes')
+    ANALYSIS_CACHE_STALE_TTL: int = int(os.getenv('ANALYSIS_CACHE_STALE_TTL', '86400'))  # Served while a circuit is open
     
     # PocketBase Configuration
     POCKETBASE_URL: str = os.getenv('POCKETBASE_URL', 'http://127.0.0.1:8090')
@@ -41,15 +123,76 @@ class Config:
         """Validate configuration settings"""
         errors = []
         
-        if not self.GEMINI_API_KEY:
+        if self.AI_PROVIDER not in ('gemini', 'stub'):
+            errors.append("AI_PROVIDER must be 'gemini' or 'stub'")
+            
+        if self.AI_PROVIDER == 'gemini' and not self.GEMINI_API_KEY:
             errors.append("GEMINI_API_KEY is required")
             
+        if not 0 <= self.AI_STUB_ERROR_RATE <= 1:
+            errors.append("AI_STUB_ERROR_RATE must be between 0 and 1")
+            
         if self.AI_REQUEST_TIMEOUT < 1:
             errors.append("AI_REQUEST_TIMEOUT must be >= 1")
             
         if self.MAX_CONCURRENT_AI_REQUESTS < 1:
             errors.append("MAX_CONCURRENT_AI_REQUESTS must be >= 1")
             
+        if self.AI_EXECUTOR_WORKERS < 1:
+            errors.append("AI_EXECUTOR_WORKERS must be >= 1")
+            
+        if self.AI_INTERACTIVE_RESERVE < 0:
+            errors.append("AI_INTERACTIVE_RESERVE must be >= 0")
+            
+        if any(weight <= 0 for weight in self.AI_TENANT_WEIGHTS.values()):
+            errors.append("AI_TENANT_WEIGHTS must all be > 0")
+            
+        if self.AI_ANALYSIS_DEADLINE < 1:
+            errors.append("AI_ANALYSIS_DEADLINE must be >= 1")
+            
+        if self.AI_ANALYSIS_MODE not in ('fanout', 'consolidated'):
+            errors.append("AI_ANALYSIS_MODE must be 'fanout' or 'consolidated'")
+            
+        if self.AI_RETRY_ATTEMPTS < 1:
+            errors.append("AI_RETRY_ATTEMPTS must be >= 1")
+            
+        if self.AI_CIRCUIT_FAILURE_THRESHOLD < 1:
+            errors.append("AI_CIRCUIT_FAILURE_THRESHOLD must be >= 1")
+            
+        if self.AI_ROUTING_LATENCY_SLACK < 1:
+            errors.append("AI_ROUTING_LATENCY_SLACK must be >= 1")
+            
+        unknown_stages = set(self.AI_ROUTING_FAST_STAGES) - {'scores', 'reports', 'refactor', 'consolidated'}
+        if unknown_stages:
+            errors.append(f"AI_ROUTING_FAST_STAGES has unknown stages: {', '.join(sorted(unknown_stages))}")
+            
+        if self.AI_MICRO_BATCH_MAX_SIZE < 1:
+            errors.append("AI_MICRO_BATCH_MAX_SIZE must be >= 1")
+            
+        if self.AI_MICRO_BATCH_WINDOW_MS < 0 or self.AI_MICRO_BATCH_WINDOW_MS >= self.AI_ANALYSIS_DEADLINE * 1000:
+            errors.append("AI_MICRO_BATCH_WINDOW_MS must be >= 0 and shorter than AI_ANALYSIS_DEADLINE")
+            
+        if self.AI_CHUNK_SIZE < 1000:
+            errors.append("AI_CHUNK_SIZE must be >= 1000")
+            
+        if self.AI_BATCH_CONCURRENCY < 1:
+            errors.append("AI_BATCH_CONCURRENCY must be >= 1")
+            
+        if self.BATCH_SAVE_CHUNK_SIZE < 1:
+            errors.append("BATCH_SAVE_CHUNK_SIZE must be >= 1")
+            
+        if self.ANALYSIS_JOB_WORKERS < 1:
+            errors.append("ANALYSIS_JOB_WORKERS must be >= 1")
+            
+        if self.ANALYSIS_CACHE_MAX_ENTRIES < 1:
+            errors.append("ANALYSIS_CACHE_MAX_ENTRIES must be >= 1")
+            
+        if self.ANALYSIS_CACHE_DISK_MAX_ENTRIES < 1:
+            errors.append("ANALYSIS_CACHE_DISK_MAX_ENTRIES must be >= 1")
+            
+        if self.INCREMENTAL_STORE_DISK_MAX_ENTRIES < 1:
+            errors.append("INCREMENTAL_STORE_DISK_MAX_ENTRIES must be >= 1")
+            
         if errors:
             print("Configuration validation errors:")
             for error in errors:
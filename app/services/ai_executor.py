@@ -0,0 +1,360 @@
+"""
+Shared AI Executor
+
+This module provides a single long-lived, bounded worker pool for outbound
+AI calls. Every analysis submits its stage calls here, which caps the number
+of concurrent upstream requests process-wide and exposes queue metrics.
+
+Queued calls are dispatched by priority class and, within a class, by
+weighted fair queuing across tenants (user/project), so one tenant's large
+batch cannot starve everyone else's interactive requests.
+"""
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union
+
+PRIORITY_INTERACTIVE = 'interactive'
+PRIORITY_BATCH = 'batch'
+
+# Priority classes in dispatch order
+PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_BATCH)
+
+DEFAULT_TENANT = 'anonymous'
+
+
+class AIExecutorSaturatedError(Exception):
+    """Raised when the executor queue is full and cannot accept more work"""
+    pass
+
+
+class AIDeadlineExceededError(Exception):
+    """Raised when a queued AI call reaches its deadline before it can run"""
+    pass
+
+
+def make_tenant(user_id: Optional[str] = None, project_id: Optional[str] = None) -> str:
+    """
+    Build the fair-queuing tenant key for a user and optional project
+
+    Args:
+        user_id: Requesting user's id
+        project_id: Optional project id
+
+    Returns:
+        Tenant key ("user" or "user/project")
+    """
+    tenant = user_id or DEFAULT_TENANT
+    return f"{tenant}/{project_id}" if project_id else tenant
+
+
+class _Task:
+    """A queued call and its scheduling metadata"""
+    __slots__ = ('fn', 'args', 'kwargs', 'future', 'deadline', 'tenant', 'tenants', 'share', 'priority',
+                 'enqueued_at')
+
+    def __init__(self, fn, args, kwargs, deadline, tenants, priority):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+        self.deadline = deadline
+        # Queue the task waits in; set on submit
+        self.tenant = tenants[0]
+        # Every tenant the call is made for, each charged an equal share
+        self.tenants = tenants
+        self.share = 1.0 / len(tenants)
+        self.priority = priority
+        self.enqueued_at = time.monotonic()
+
+
+class AIExecutor:
+    """Bounded, process-wide executor with weighted fair queuing and wait-time metrics"""
+
+    def __init__(self, max_workers: int = 3, max_queue: int = 100, metrics_window: int = 500,
+                 interactive_reserve: int = 1, max_tenant_queue: int = 0,
+                 tenant_weights: Optional[Dict[str, float]] = None, max_tracked_tenants: int = 200):
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        # Workers batch calls may never occupy, kept free for interactive calls
+        self.interactive_reserve = min(max(0, interactive_reserve), self.max_workers - 1)
+        self.max_tenant_queue = max(0, max_tenant_queue)
+        self.tenant_weights = dict(tenant_weights or {})
+        self._metrics_window = metrics_window
+        self._max_tracked_tenants = max_tracked_tenants
+
+        self._lock = threading.Lock()
+        self._work_available = threading.Condition(self._lock)
+        self._shutdown = False
+
+        # priority -> tenant -> [pass value, deque of tasks] (stride scheduling)
+        self._queues: Dict[str, Dict[str, list]] = {priority: {} for priority in PRIORITIES}
+        # priority -> pass value of the most recently dispatched tenant
+        self._virtual_time: Dict[str, float] = {priority: 0.0 for priority in PRIORITIES}
+        self._running_by_priority: Dict[str, int] = {priority: 0 for priority in PRIORITIES}
+        self._wait_by_priority: Dict[str, deque] = {
+            priority: deque(maxlen=metrics_window) for priority in PRIORITIES
+        }
+        self._tenant_stats: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+        self._queued = 0
+        self._running = 0
+        self._completed = 0
+        self._rejected = 0
+        self._expired = 0
+        self._wait_times: deque = deque(maxlen=metrics_window)
+
+        self._workers: List[threading.Thread] = []
+        for index in range(self.max_workers):
+            worker = threading.Thread(target=self._work, name=f'ai-worker_{index}', daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, fn: Callable[..., Any], *args, deadline: Optional[float] = None,
+               tenant: Union[str, Sequence[str], None] = None, priority: str = PRIORITY_INTERACTIVE,
+               **kwargs) -> Future:
+        """
+        Queue a call on the shared pool
+
+        Args:
+            fn: Callable to execute
+            deadline: Optional absolute time.monotonic() deadline; calls that have
+                not started by then fail with AIDeadlineExceededError
+            tenant: Fair-queuing key, usually from make_tenant(); a sequence of
+                keys for one call made on behalf of several tenants (a
+                micro-batch), which splits its fair-queuing cost and completed
+                count evenly between them
+            priority: PRIORITY_INTERACTIVE or PRIORITY_BATCH
+            args/kwargs: Arguments forwarded to fn
+
+        Returns:
+            Future for the call result; once the call starts running, its
+            started_at attribute holds the time.monotonic() start time
+
+        Raises:
+            AIExecutorSaturatedError: If the global or per-tenant queue is full
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority class: {priority}")
+        if tenant is None or isinstance(tenant, str):
+            tenants = [tenant or DEFAULT_TENANT]
+        else:
+            tenants = list(dict.fromkeys(name or DEFAULT_TENANT for name in tenant)) or [DEFAULT_TENANT]
+        task = _Task(fn, args, kwargs, deadline, tenants, priority)
+
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("AI executor has been shut down")
+            all_stats = [self._get_tenant_stats(name) for name in tenants]
+            if self._queued + self._running >= self.max_workers + self.max_queue:
+                self._rejected += 1
+                for stats in all_stats:
+                    stats['rejected'] += 1
+                raise AIExecutorSaturatedError(
+                    f"AI executor queue is full ({self._queued} pending)"
+                )
+            # A shared call is refused only if none of its tenants has room,
+            # so one busy account cannot fail the others' requests
+            if self.max_tenant_queue and all(stats['queued'] >= self.max_tenant_queue for stats in all_stats):
+                self._rejected += 1
+                for stats in all_stats:
+                    stats['rejected'] += 1
+                raise AIExecutorSaturatedError(
+                    f"Too many pending AI calls for this account ({all_stats[0]['queued']} pending)"
+                )
+
+            queues = self._queues[priority]
+            # A shared call waits in the queue of the tenant due soonest
+            task.tenant = min(
+                tenants,
+                key=lambda name: queues[name][0] if name in queues else self._virtual_time[priority]
+            )
+            entry = queues.get(task.tenant)
+            if entry is None:
+                # A newly active tenant starts at the current virtual time, so
+                # idle periods cannot be banked as credit
+                entry = queues[task.tenant] = [self._virtual_time[priority], deque()]
+            entry[1].append(task)
+
+            self._queued += 1
+            for name in tenants:
+                self._get_tenant_stats(name)['queued'] += 1
+            self._work_available.notify()
+
+        return task.future
+
+    def _get_tenant_stats(self, tenant: str) -> Dict[str, Any]:
+        """Get (or start tracking) a tenant's counters; caller holds the lock"""
+        stats = self._tenant_stats.get(tenant)
+        if stats is None:
+            stats = {
+                'queued': 0, 'running': 0, 'completed': 0, 'rejected': 0,
+                'wait_times': deque(maxlen=100)
+            }
+            self._tenant_stats[tenant] = stats
+            self._evict_idle_tenants()
+        else:
+            self._tenant_stats.move_to_end(tenant)
+        return stats
+
+    def _evict_idle_tenants(self) -> None:
+        """Drop the least recently seen idle tenants beyond the tracking cap"""
+        excess = len(self._tenant_stats) - self._max_tracked_tenants
+        for name in list(self._tenant_stats):
+            if excess <= 0:
+                break
+            stats = self._tenant_stats[name]
+            if not stats['queued'] and not stats['running']:
+                del self._tenant_stats[name]
+                excess -= 1
+
+    def _get_weight(self, tenant: str) -> float:
+        """Weight for a tenant, falling back to its user's weight"""
+        weight = self.tenant_weights.get(tenant)
+        if weight is None:
+            weight = self.tenant_weights.get(tenant.split('/', 1)[0], 1.0)
+        return max(weight, 0.01)
+
+    def _next_task(self) -> Optional[_Task]:
+        """Pick the next task to run, or None if nothing is eligible; caller holds the lock"""
+        for priority in PRIORITIES:
+            if (priority != PRIORITY_INTERACTIVE
+                    and self._running_by_priority[priority] >= self.max_workers - self.interactive_reserve):
+                continue
+            queues = self._queues[priority]
+            if not queues:
+                continue
+
+            # Lowest pass value goes next; each dispatch advances it by 1/weight
+            tenant = min(queues, key=lambda name: queues[name][0])
+            entry = queues[tenant]
+            task = entry[1].popleft()
+            self._virtual_time[priority] = entry[0]
+            # A shared call advances each of its active tenants by their share
+            for name in task.tenants:
+                if name in queues:
+                    queues[name][0] += task.share / self._get_weight(name)
+            if not entry[1]:
+                del queues[tenant]
+            return task
+        return None
+
+    def _work(self) -> None:
+        """Worker loop: run queued tasks in fair order until shutdown"""
+        while True:
+            with self._lock:
+                task = self._next_task()
+                while task is None:
+                    if self._shutdown:
+                        return
+                    self._work_available.wait()
+                    task = self._next_task()
+
+                started_at = time.monotonic()
+                wait_time = started_at - task.enqueued_at
+                all_stats = [self._get_tenant_stats(name) for name in task.tenants]
+                self._queued -= 1
+                self._running += 1
+                self._running_by_priority[task.priority] += 1
+                self._wait_times.append(wait_time)
+                self._wait_by_priority[task.priority].append(wait_time)
+                for stats in all_stats:
+                    stats['queued'] -= 1
+                    stats['running'] += 1
+                    stats['wait_times'].append(wait_time)
+
+            try:
+                self._run(task, started_at)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._running_by_priority[task.priority] -= 1
+                    self._completed += 1
+                    for stats in all_stats:
+                        stats['running'] -= 1
+                        stats['completed'] += task.share
+                    # A freed batch slot may make a queued batch task eligible
+                    self._work_available.notify()
+
+    def _run(self, task: _Task, started_at: float) -> None:
+        """Execute a task and settle its future"""
+        if not task.future.set_running_or_notify_cancel():
+            return
+        task.future.started_at = started_at
+
+        if task.deadline is not None and started_at >= task.deadline:
+            with self._lock:
+                self._expired += 1
+            task.future.set_exception(AIDeadlineExceededError("AI call deadline passed while queued"))
+            return
+
+        try:
+            result = task.fn(*task.args, **task.kwargs)
+        except BaseException as e:
+            task.future.set_exception(e)
+        else:
+            task.future.set_result(result)
+
+    @staticmethod
+    def _wait_stats(waits: List[float]) -> Optional[Dict[str, float]]:
+        """Summarize wait times in milliseconds"""
+        if not waits:
+            return None
+        waits = sorted(waits)
+        return {
+            "avg": round(sum(waits) / len(waits) * 1000, 2),
+            "p50": round(waits[len(waits) // 2] * 1000, 2),
+            "p95": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000, 2),
+            "max": round(waits[-1] * 1000, 2),
+        }
+
+    def metrics(self) -> Dict[str, Any]:
+        """Return queue depth and wait-time statistics, overall, per priority and per tenant"""
+        with self._lock:
+            waits = list(self._wait_times)
+            metrics = {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "interactive_reserve": self.interactive_reserve,
+                "queue_depth": max(0, self._queued),
+                "running": self._running,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "expired": self._expired,
+            }
+            priorities = {
+                priority: {
+                    "queued": sum(len(entry[1]) for entry in self._queues[priority].values()),
+                    "running": self._running_by_priority[priority],
+                    "waits": list(self._wait_by_priority[priority]),
+                }
+                for priority in PRIORITIES
+            }
+            tenants = {
+                name: {
+                    "queued": stats['queued'],
+                    "running": stats['running'],
+                    "completed": round(stats['completed'], 2),
+                    "rejected": stats['rejected'],
+                    "waits": list(stats['wait_times']),
+                }
+                for name, stats in self._tenant_stats.items()
+            }
+
+        metrics["wait_ms"] = self._wait_stats(waits)
+        for group in (priorities, tenants):
+            for stats in group.values():
+                stats["wait_ms"] = self._wait_stats(stats.pop("waits"))
+        metrics["priorities"] = priorities
+        metrics["tenants"] = tenants
+        return metrics
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop accepting work and release the worker threads once the queue drains"""
+        with self._lock:
+            self._shutdown = True
+            self._work_available.notify_all()
+        if wait:
+            for worker in self._workers:
+                worker.join()
@@ -0,0 +1,346 @@
+"""
+AI Providers
+
+This module defines the text-generation backend interface used by the AI
+analysis service, the Google Gemini implementation, and a deterministic local
+stub that returns schema-valid analysis JSON with configurable latency and
+error rate, for load testing without network access or API quota. Providers
+may also stream responses as they are generated.
+"""
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from typing import Any, Dict, Iterator, Optional
+import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+from google.generativeai import types
+
+from app.config import config
+from app.services.model_discovery import FALLBACK_MODEL
+from app.utils.code_minifier import estimate_tokens
+
+# genai.configure mutates process-global client state; only do it once
+_client_lock = threading.Lock()
+_configured_api_key: Optional[str] = None
+
+
+class AIProviderError(Exception):
+    """Raised by a provider when a generation request fails"""
+    pass
+
+
+class AIProvider:
+    """Interface every AI backend implements"""
+
+    # Provider name, as used by the AI_PROVIDER setting
+    name = ''
+    # Whether discovered model names should be persisted by ModelDiscoveryCache
+    cache_discovery = False
+    # Errors worth retrying and counting against the model's circuit breaker
+    transient_errors: tuple = (TimeoutError, ConnectionError, AIProviderError)
+
+    def is_transient(self, error: BaseException) -> bool:
+        """Check whether an error means the upstream is unhealthy rather than the request invalid"""
+        return isinstance(error, self.transient_errors)
+
+    def discover_model(self, mode: str) -> str:
+        """
+        Pick a model to use
+
+        Args:
+            mode: 'free_tier' or 'best'
+
+        Returns:
+            Model name
+        """
+        raise NotImplementedError
+
+    def generate(self, model_name: str, prompt: str, generation_config: Dict[str, Any], timeout: float) -> str:
+        """
+        Generate a completion for a prompt
+
+        Args:
+            model_name: Model to call
+            prompt: Fully rendered prompt
+            generation_config: Generation settings (e.g. response_mime_type)
+            timeout: Request timeout in seconds
+
+        Returns:
+            Raw response text
+        """
+        raise NotImplementedError
+
+    def generate_stream(self, model_name: str, prompt: str, generation_config: Dict[str, Any],
+                        timeout: float) -> Iterator[str]:
+        """
+        Generate a completion, yielding its text as it is produced
+
+        Takes the same arguments as generate. Providers without streaming
+        yield the whole response at once.
+
+        Yields:
+            Consecutive pieces of the raw response text
+        """
+        yield self.generate(model_name, prompt, generation_config, timeout)
+
+    def count_tokens(self, model_name: str, text: str) -> int:
+        """Count the input tokens of a prompt (estimated unless the provider can do better)"""
+        return estimate_tokens(text)
+
+
+class GeminiProvider(AIProvider):
+    """Google Gemini backend using the google.generativeai client"""
+
+    name = 'gemini'
+    cache_discovery = True
+    transient_errors = AIProvider.transient_errors + (
+        google_exceptions.ServerError,
+        google_exceptions.TooManyRequests
+    )
+
+    FREE_TIER_MODELS = (
+        'models/gemini-1.5-flash',
+        'models/gemini-1.5-flash-latest',
+        'models/gemini-2.5-flash',
+        'models/gemini-pro'
+    )
+
+    def __init__(self, api_key: str):
+        self._models: Dict[tuple, genai.GenerativeModel] = {}
+        self._models_lock = threading.Lock()
+        self._configure_client(api_key)
+
+    def _configure_client(self, api_key: str) -> None:
+        """Configure the process-wide AI client once so its connections are reused"""
+        global _configured_api_key
+
+        if not api_key:
+            raise ValueError("GEMINI_API_KEY is required but not set")
+
+        with _client_lock:
+            if _configured_api_key != api_key:
+                genai.configure(api_key=api_key)
+                _configured_api_key = api_key
+
+    def _get_model(self, model_name: str, generation_config: Dict[str, Any]) -> genai.GenerativeModel:
+        """
+        Get a cached model client for the given model and generation config
+
+        Model objects hold no per-request state, so one instance per
+        (model, config) pair is shared by all worker threads.
+
+        Args:
+            model_name: Fully qualified model name
+            generation_config: GenerationConfig keyword arguments
+
+        Returns:
+            Shared GenerativeModel instance
+        """
+        key = (model_name, tuple(sorted(generation_config.items())))
+
+        with self._models_lock:
+            model = self._models.get(key)
+            if model is None:
+                model = self._new_model(model_name, generation_config)
+                self._models[key] = model
+            return model
+
+    def _new_model(self, model_name: str, generation_config: Dict[str, Any]) -> genai.GenerativeModel:
+        """Create a GenerativeModel client"""
+        return genai.GenerativeModel(
+            model_name,
+            generation_config=types.GenerationConfig(**generation_config)
+        )
+
+    def discover_model(self, mode: str) -> str:
+        """Discover the best free-tier model, or the first model supporting generateContent"""
+        if mode == 'free_tier':
+            available_models = {m.name: m for m in genai.list_models()}
+            for model_name in self.FREE_TIER_MODELS:
+                model = available_models.get(model_name)
+                if model is not None and 'generateContent' in model.supported_generation_methods:
+                    return model_name
+            return FALLBACK_MODEL
+
+        for model in genai.list_models():
+            if 'generateContent' in model.supported_generation_methods:
+                return model.name
+        return FALLBACK_MODEL
+
+    def generate(self, model_name: str, prompt: str, generation_config: Dict[str, Any], timeout: float) -> str:
+        """Call generate_content with a request timeout"""
+        model = self._get_model(model_name, generation_config)
+        response = model.generate_content(prompt, request_options={'timeout': timeout})
+        return response.text
+
+    def generate_stream(self, model_name: str, prompt: str, generation_config: Dict[str, Any],
+                        timeout: float) -> Iterator[str]:
+        """Call generate_content with stream=True and yield each chunk's text"""
+        model = self._get_model(model_name, generation_config)
+        response = model.generate_content(prompt, stream=True, request_options={'timeout': timeout})
+        for chunk in response:
+            # The closing chunk may only carry the finish reason
+            if chunk.parts:
+                yield chunk.text
+
+    def count_tokens(self, model_name: str, text: str) -> int:
+        """Count tokens with the model tokenizer"""
+        return self._get_model(model_name, {}).count_tokens(text).total_tokens
+
+
+class StubProvider(AIProvider):
+    """
+    Deterministic local backend for load testing
+
+    Latency is log-normally distributed around a median, and a configurable
+    fraction of calls fail. Both are drawn from a random stream seeded by the
+    prompt and how many times it has been sent, so a run is reproducible
+    regardless of thread scheduling. Responses contain every key the prompt
+    asks for, keyed by submission id for micro-batched prompts.
+    """
+
+    name = 'stub'
+    MODEL_NAME = 'stub/analysis-v1'
+    # Submission headers of a micro-batched prompt
+    BATCH_SECTION_PATTERN = re.compile(r'\n=== SUBMISSION (\S+) ===\n')
+    # Streamed responses: share of the latency before the first piece, and piece size
+    STREAM_FIRST_CHUNK_SHARE = 0.1
+    STREAM_CHUNK_CHARS = 16
+
+    def __init__(self, latency_ms: float = 800.0, latency_sigma: float = 0.5,
+                 error_rate: float = 0.0, seed: int = 0):
+        self.latency_ms = max(0.0, latency_ms)
+        self.latency_sigma = max(0.0, latency_sigma)
+        self.error_rate = min(max(error_rate, 0.0), 1.0)
+        self.seed = seed
+        self._sent: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def discover_model(self, mode: str) -> str:
+        """The stub has a single model"""
+        return self.MODEL_NAME
+
+    def _rng(self, prompt: str) -> random.Random:
+        """Random stream for this prompt's next call"""
+        digest = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+        with self._lock:
+            if len(self._sent) > 10000:
+                self._sent.clear()
+            attempt = self._sent.get(digest, 0)
+            self._sent[digest] = attempt + 1
+        return random.Random(f"{self.seed}:{digest}:{attempt}")
+
+    def generate(self, model_name: str, prompt: str, generation_config: Dict[str, Any], timeout: float) -> str:
+        """Sleep for a sampled latency, then fail or return schema-valid JSON"""
+        rng = self._rng(prompt)
+        latency = self.latency_ms / 1000.0 * math.exp(rng.gauss(0.0, self.latency_sigma))
+        failed = rng.random() < self.error_rate
+
+        if latency > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f"Stub request timed out after {timeout:.1f}s")
+        time.sleep(latency)
+        if failed:
+            raise AIProviderError("503 Stub provider injected failure")
+
+        return json.dumps(self._build_response(prompt, rng), ensure_ascii=False)
+
+    def generate_stream(self, model_name: str, prompt: str, generation_config: Dict[str, Any],
+                        timeout: float) -> Iterator[str]:
+        """
+        Yield the response in small pieces spread over the sampled latency
+
+        The first piece arrives after STREAM_FIRST_CHUNK_SHARE of the latency,
+        as the first tokens of a real model do.
+        """
+        rng = self._rng(prompt)
+        latency = self.latency_ms / 1000.0 * math.exp(rng.gauss(0.0, self.latency_sigma))
+        failed = rng.random() < self.error_rate
+
+        first_chunk_delay = latency * self.STREAM_FIRST_CHUNK_SHARE
+        if first_chunk_delay > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f"Stub request timed out after {timeout:.1f}s")
+        time.sleep(first_chunk_delay)
+        if failed:
+            raise AIProviderError("503 Stub provider injected failure")
+
+        text = json.dumps(self._build_response(prompt, rng), ensure_ascii=False)
+        pieces = [text[i:i + self.STREAM_CHUNK_CHARS] for i in range(0, len(text), self.STREAM_CHUNK_CHARS)]
+        interval = (latency - first_chunk_delay) / len(pieces)
+        for index, piece in enumerate(pieces):
+            if index:
+                time.sleep(interval)
+            yield piece
+
+    @staticmethod
+    def _build_response(prompt: str, rng: random.Random) -> Dict[str, Any]:
+        """Build a response containing the keys the prompt asks for"""
+        sections = StubProvider.BATCH_SECTION_PATTERN.split(prompt)
+        if len(sections) > 1:
+            instructions = sections[0]
+            return {
+                item_id: StubProvider._build_response(instructions + section, rng)
+                for item_id, section in zip(sections[1::2], sections[2::2])
+            }
+
+        code = prompt.rsplit('CODE:', 1)[-1].strip()
+        response: Dict[str, Any] = {}
+
+        if '"total_score"' in prompt:
+            reliability = rng.randint(3, 10)
+            mastery = rng.randint(5, 15)
+            response.update({
+                'total_score': reliability + mastery,
+                'reliability_score': reliability,
+                'mastery_score': mastery,
+                'explanation_summary': f"Stub summary of {len(code.splitlines())} lines of code.",
+                'debug_prognosis': "Stub prognosis: no bugs were actually looked for."
+            })
+
+        if '"report"' in prompt:
+            response['report'] = {
+                key: f"Stub {key} report."
+                for key in ('clarity', 'modularity', 'efficiency', 'security', 'documentation')
+            }
+
+        if '"refactored_code"' in prompt:
+            response.update({
+                'refactored_code': code,
+                'project_roadmap': (
+                    "Your Architectural Next Steps:\n"
+                    "1. Split the code into modules.\n"
+                    "2. Move settings into configuration.\n"
+                    "3. Add an initialization entry point."
+                )
+            })
+
+        return response
+
+
+def create_provider(name: Optional[str] = None) -> AIProvider:
+    """
+    Build the provider selected by AI_PROVIDER
+
+    Args:
+        name: Provider name; defaults to config.AI_PROVIDER
+
+    Returns:
+        Configured provider instance
+    """
+    name = (name or config.AI_PROVIDER).lower()
+
+    if name == GeminiProvider.name:
+        return GeminiProvider(config.GEMINI_API_KEY)
+    if name == StubProvider.name:
+        return StubProvider(
+            latency_ms=config.AI_STUB_LATENCY_MS,
+            latency_sigma=config.AI_STUB_LATENCY_SIGMA,
+            error_rate=config.AI_STUB_ERROR_RATE,
+            seed=config.AI_STUB_SEED
+        )
+    raise ValueError(f"Unknown AI provider: {name}")
@@ -2,208 +2,1637 @@
 AI Analysis Service
 
 This module handles all interactions with AI providers for code analysis.
-Provides concurrent processing, error handling, and response validation.
+Provides concurrent processing on a shared executor, error handling, and response validation.
 """
-import json
-import re
-from concurrent.futures import ThreadPoolExecutor
-from typing import Dict, Any, Optional
-import google.generativeai as genai
-from google.generativeai import types
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future, FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from typing import Callable, Dict, Any, Iterable, Iterator, List, Optional, Tuple
+from tenacity import Retrying, retry_if_exception, stop_after_attempt, wait_random_exponential
 
 from app.config import config
+from app.services.ai_providers import create_provider
+from app.services.analysis_cache import AnalysisCache, make_cache_key
+from app.services.model_discovery import ModelDiscoveryCache
+from app.services.ai_executor import (
+    AIExecutor, AIExecutorSaturatedError, AIDeadlineExceededError, PRIORITY_BATCH, PRIORITY_INTERACTIVE, make_tenant
+)
+from app.services.circuit_breaker import CircuitBreaker, CircuitOpenError, STATE_OPEN
+from app.services.hedging import HedgingPolicy
+from app.services.micro_batcher import MicroBatcher
+from app.services.model_router import ModelRouter
+from app.services.single_flight import SingleFlight, SingleFlightAbandonedError
+from app.utils.code_chunker import CodeChunk, split_code_into_chunks, split_code_into_units
+from app.utils.code_fingerprint import semantic_fingerprint
+from app.utils.code_metrics import compute_code_metrics, format_metrics_for_prompt
+from app.utils.code_minifier import TokenBudgetExceededError, estimate_tokens, minify_code, parse_code
+from app.utils.json_utils import JsonStringFieldStream, parse_model_json
+
+# Bump whenever a prompt template changes so cached results are not reused
+PROMPT_TEMPLATE_VERSION = "3"
+
+# Every prompt template ends with its per-request part, starting here; the
+# text before it (instructions and project context) is shared by calls for the
+# same stage and project, so a micro-batch sends it once
+VARIABLE_PART_MARKER = '{static_metrics}'
+
+# Generation settings shared by every analysis stage
+JSON_GENERATION_CONFIG = {"response_mime_type": "application/json"}
+
+# Analysis stages in the order their results are combined
+ANALYSIS_STAGES = ('scores', 'reports', 'refactor')
+
+# Top-level keys each stage contributes to a consolidated single-call response
+STAGE_KEYS = {
+    'scores': ('total_score', 'reliability_score', 'mastery_score', 'explanation_summary', 'debug_prognosis'),
+    'reports': ('report',),
+    'refactor': ('refactored_code', 'project_roadmap')
+}
+
+# Keys of the flattened "report" object
+REPORT_KEYS = ('clarity', 'modularity', 'efficiency', 'security', 'documentation')
+
+# Keys each stage contributes to the combined (flattened) result
+STAGE_RESULT_KEYS = {
+    'scores': STAGE_KEYS['scores'],
+    'reports': REPORT_KEYS,
+    'refactor': STAGE_KEYS['refactor'] + ('refactored_code_truncated',)
+}
+
+# Longest refactored code the analyses collection stores (refactored_code field max)
+MAX_REFACTORED_CODE_LENGTH = 100000
+
+# Stage whose response field is forwarded to streaming clients while it is generated
+STREAMED_FIELDS = {'refactor': 'refactored_code'}
+
+# A micro-batched prompt replaces the per-request part of a stage template
+# with these instructions and one section per submission
+MICRO_BATCH_INSTRUCTIONS = (
+    "MULTIPLE SUBMISSIONS: analyze each submission below independently, following the "
+    "instructions above. Your output MUST be a JSON object mapping each submission id "
+    "(e.g. \"submission_1\") to the complete JSON object described above for that submission.\n"
+)
+MICRO_BATCH_ITEM_HEADER = "\n=== SUBMISSION {id} ===\n"
 
 
 class AIAnalysisService:
     """Service for AI-powered code analysis"""
     
     def __init__(self):
+        self._async_in_flight = 0
+        self._async_lock = threading.Lock()
+        self.provider = create_provider()
+        self.model_discovery = ModelDiscoveryCache(
+            cache_file=config.MODEL_CACHE_FILE,
+            ttl_seconds=config.MODEL_CACHE_TTL
+        )
         self.model_name = self._get_available_model()
-        self._configure_client()
-    
-    def _configure_client(self):
-        """Configure the AI client"""
-        if config.GEMINI_API_KEY:
-            genai.configure(api_key=config.GEMINI_API_KEY)
-            print(f"AI client initialized with model: {self.model_name}")
-        else:
-            raise ValueError("GEMINI_API_KEY is required but not set")
+        print(f"AI client initialized with model: {self.model_name}")
+        self.cache = AnalysisCache(
+            max_entries=config.ANALYSIS_CACHE_MAX_ENTRIES,
+            ttl_seconds=config.ANALYSIS_CACHE_TTL,
+            disk_dir=config.ANALYSIS_CACHE_DIR,
+            stale_seconds=config.ANALYSIS_CACHE_STALE_TTL,
+            max_disk_entries=config.ANALYSIS_CACHE_DISK_MAX_ENTRIES
+        ) if config.ANALYSIS_CACHE_ENABLED else None
+        self.unit_store = AnalysisCache(
+            max_entries=config.INCREMENTAL_STORE_MAX_ENTRIES,
+            ttl_seconds=config.INCREMENTAL_STORE_TTL,
+            disk_dir=config.INCREMENTAL_STORE_DIR,
+            max_disk_entries=config.INCREMENTAL_STORE_DISK_MAX_ENTRIES
+        )
+        self.executor = AIExecutor(
+            max_workers=config.AI_EXECUTOR_WORKERS,
+            max_queue=config.AI_EXECUTOR_MAX_QUEUE,
+            interactive_reserve=config.AI_INTERACTIVE_RESERVE,
+            max_tenant_queue=config.AI_TENANT_MAX_QUEUE,
+            tenant_weights=config.AI_TENANT_WEIGHTS
+        )
+        self.hedging = HedgingPolicy(
+            percentile=config.AI_HEDGE_PERCENTILE,
+            max_rate=config.AI_HEDGE_MAX_RATE,
+            min_samples=config.AI_HEDGE_MIN_SAMPLES
+        )
+        self.router = ModelRouter(
+            self.model_name,
+            fast_model=config.AI_FAST_MODEL,
+            strong_model=config.AI_STRONG_MODEL,
+            small_input_tokens=config.AI_ROUTING_SMALL_TOKENS,
+            fast_stages=config.AI_ROUTING_FAST_STAGES,
+            latency_slack=config.AI_ROUTING_LATENCY_SLACK,
+            min_samples=config.AI_ROUTING_MIN_SAMPLES
+        )
+        self.micro_batcher = MicroBatcher(
+            self._dispatch_micro_batch,
+            max_batch_size=config.AI_MICRO_BATCH_MAX_SIZE,
+            window_seconds=config.AI_MICRO_BATCH_WINDOW_MS / 1000.0
+        ) if config.AI_MICRO_BATCH_ENABLED else None
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self.in_flight = SingleFlight()
+        self._breakers_lock = threading.Lock()
     
     def _get_available_model(self) -> str:
         """Get the best available model for the current configuration"""
-        if config.FORCE_FREE_TIER:
-            return self._get_free_tier_model()
-        return self._discover_best_model()
-    
-    def _get_free_tier_model(self) -> str:
-        """Get the best free-tier model"""
-        free_tier_models = [
-            'models/gemini-1.5-flash',
-            'models/gemini-1.5-flash-latest',
-            'models/gemini-2.5-flash',
-            'models/gemini-pro'
-        ]
+        # An explicit model skips discovery entirely
+        if config.GEMINI_MODEL and self.provider.name == 'gemini':
+            return config.GEMINI_MODEL
         
-        try:
-            available_models = {m.name: m for m in genai.list_models()}
-            
-            for model_name in free_tier_models:
-                if model_name in available_models:
-                    model = available_models[model_name]
-                    if 'generateContent' in model.supported_generation_methods:
-                        return model_name
-                        
-            return 'models/gemini-pro'  # Fallback
+        mode = 'free_tier' if config.FORCE_FREE_TIER else 'best'
+        if not self.provider.cache_discovery:
+            return self.provider.discover_model(mode)
+        return self.model_discovery.get_model(mode, lambda: self.provider.discover_model(mode))
+    
+    def analyze_code(self, prompt: str, code: str, project_context: Optional[str] = None,
+                     project_id: Optional[str] = None, user_id: Optional[str] = None,
+                     priority: str = PRIORITY_INTERACTIVE,
+                     stages: Optional[Tuple[str, ...]] = None) -> Dict[str, Any]:
+        """
+        Analyze code using AI with concurrent processing and optional project context
+        
+        Args:
+            prompt: The original AI prompt
+            code: The code to analyze
+            project_context: Optional project context string with architecture info
+            project_id: Optional project id; enables incremental re-analysis
+            user_id: Optional requesting user id, used for fair scheduling
+            priority: Scheduling class, PRIORITY_INTERACTIVE or PRIORITY_BATCH
+            stages: Optional subset of ANALYSIS_STAGES to run; defaults to all
             
-        except Exception as e:
-            print(f"Error discovering models: {e}")
-            return 'models/gemini-pro'
+        Returns:
+            Dictionary containing analysis results; "stages" lists the stages
+            that completed without error
+        """
+        prompt_data = self._build_prompt_data(
+            prompt, code, project_context, project_id,
+            tenant=make_tenant(user_id, project_id), priority=priority, stages=stages
+        )
+        
+        # Serve identical or equivalent resubmissions from the result cache
+        cache_key = self._get_cache_key(prompt_data)
+        cached = self._lookup_cache(cache_key, prompt_data)
+        if cached is not None:
+            return cached
+        
+        if not config.AI_SINGLE_FLIGHT_ENABLED:
+            return self._analyze_uncached(prompt_data, cache_key)
+        
+        # Identical requests already in flight share one computation
+        try:
+            results, shared = self.in_flight.do(
+                cache_key, lambda: self._analyze_uncached(prompt_data, cache_key), timeout=self._coalesce_timeout()
+            )
+        except TimeoutError:
+            raise AIDeadlineExceededError("Identical analysis in progress did not finish in time")
+        if shared:
+            results['coalesced'] = True
+        return results
     
-    def _discover_best_model(self) -> str:
-        """Discover the best available model"""
+    def _analyze_uncached(self, prompt_data: Dict[str, str], cache_key: str) -> Dict[str, Any]:
+        """Run an analysis that missed the cache and cache its result"""
         try:
-            models = genai.list_models()
-            for model in models:
-                if 'generateContent' in model.supported_generation_methods:
-                    return model.name
-            return 'models/gemini-pro'
-        except Exception as e:
-            print(f"Error discovering models: {e}")
-            return 'models/gemini-pro'
+            results = self._run_analysis(prompt_data)
+        except CircuitOpenError:
+            stale = self._get_stale_result(cache_key)
+            if stale is None:
+                raise
+            return stale
+        
+        self._store_result(cache_key, prompt_data, results)
+        
+        results['cached'] = False
+        return results
     
-    def analyze_code(self, prompt: str, code: str, project_context: Optional[str] = None) -> Dict[str, Any]:
+    async def analyze_code_async(self, prompt: str, code: str, project_context: Optional[str] = None,
+                                 project_id: Optional[str] = None, user_id: Optional[str] = None,
+                                 stages: Optional[Tuple[str, ...]] = None) -> Dict[str, Any]:
         """
-        Analyze code using AI with concurrent processing and optional project context
+        Analyze code without blocking the event loop
+        
+        Stage calls are scheduled on the shared executor like synchronous
+        analyses; the coroutine awaits them instead of holding a thread.
         
         Args:
             prompt: The original AI prompt
             code: The code to analyze
             project_context: Optional project context string with architecture info
+            project_id: Optional project id; enables incremental re-analysis
+            user_id: Optional requesting user id, used for fair scheduling
+            stages: Optional subset of ANALYSIS_STAGES to run; defaults to all
             
         Returns:
             Dictionary containing analysis results
         """
-        prompt_data = {
-            'prompt': prompt, 
-            'code': code,
-            'project_context': project_context or ''
+        prompt_data = self._build_prompt_data(
+            prompt, code, project_context, project_id, tenant=make_tenant(user_id, project_id), stages=stages
+        )
+        
+        cache_key = self._get_cache_key(prompt_data)
+        cached = self._lookup_cache(cache_key, prompt_data)
+        if cached is not None:
+            return cached
+        
+        if not config.AI_SINGLE_FLIGHT_ENABLED:
+            return await self._analyze_uncached_async(prompt_data, cache_key)
+        
+        try:
+            results, shared = await self.in_flight.do_async(
+                cache_key, lambda: self._analyze_uncached_async(prompt_data, cache_key),
+                timeout=self._coalesce_timeout()
+            )
+        except TimeoutError:
+            raise AIDeadlineExceededError("Identical analysis in progress did not finish in time")
+        if shared:
+            results['coalesced'] = True
+        return results
+    
+    async def _analyze_uncached_async(self, prompt_data: Dict[str, str], cache_key: str) -> Dict[str, Any]:
+        """Async variant of _analyze_uncached, bounded by AI_ASYNC_MAX_IN_FLIGHT"""
+        with self._async_lock:
+            if self._async_in_flight >= config.AI_ASYNC_MAX_IN_FLIGHT:
+                raise AIExecutorSaturatedError(
+                    f"Too many async analyses in flight ({self._async_in_flight})"
+                )
+            self._async_in_flight += 1
+        
+        try:
+            units = self._get_units(prompt_data)
+            chunks = self._get_chunks(prompt_data)
+            if units:
+                stored, changed = self._lookup_units(prompt_data, units)
+                changed_results = await self._analyze_chunks_async(prompt_data, changed)
+                results = self._merge_incremental(prompt_data, units, stored, changed, changed_results)
+            elif len(chunks) > 1:
+                chunk_results = await self._analyze_chunks_async(prompt_data, chunks)
+                results = self._reduce_chunk_results(chunks, chunk_results, prompt_data['original_code'])
+            else:
+                results = await self._run_analysis_async(prompt_data)
+        except CircuitOpenError:
+            stale = self._get_stale_result(cache_key)
+            if stale is None:
+                raise
+            return stale
+        finally:
+            with self._async_lock:
+                self._async_in_flight -= 1
+        
+        self._store_result(cache_key, prompt_data, results)
+        
+        results['cached'] = False
+        return results
+    
+    def analyze_batch(self, items: List[Dict[str, Any]]) -> Iterator[Tuple[int, Any]]:
+        """
+        Analyze many submissions with bounded concurrency
+        
+        At most AI_BATCH_CONCURRENCY items of this batch run at once; their
+        stage calls are scheduled on the shared AI executor in the batch
+        priority class, so they only use capacity interactive requests leave
+        idle. Items block while their stage calls run, so each batch waits on
+        a small pool of its own rather than occupying AI workers; sharing one
+        FIFO pool would queue other tenants' batches behind this one before
+        the executor's fair queuing could see them.
+        
+        Args:
+            items: Dicts with prompt, code and optional project_context/project_id/user_id/stages
+            
+        Yields:
+            (index, result dict or Exception) tuples in completion order
+        """
+        pool = ThreadPoolExecutor(
+            max_workers=max(1, min(config.AI_BATCH_CONCURRENCY, len(items))),
+            thread_name_prefix='ai-batch'
+        )
+        futures = {
+            pool.submit(
+                self.analyze_code,
+                item['prompt'],
+                item['code'],
+                project_context=item.get('project_context'),
+                project_id=item.get('project_id'),
+                user_id=item.get('user_id'),
+                priority=PRIORITY_BATCH,
+                stages=item.get('stages')
+            ): index
+            for index, item in enumerate(items)
         }
         
-        # Use ThreadPoolExecutor for concurrent AI calls
-        with ThreadPoolExecutor(max_workers=config.MAX_CONCURRENT_AI_REQUESTS) as executor:
+        try:
+            for future in as_completed(futures):
+                try:
+                    yield futures[future], future.result()
+                except Exception as e:
+                    yield futures[future], e
+        finally:
+            # Reached early when a streaming client disconnects
+            for future in futures:
+                future.cancel()
+            pool.shutdown(wait=False)
+    
+    def _build_prompt_data(self, prompt: str, code: str, project_context: Optional[str] = None,
+                           project_id: Optional[str] = None, tenant: Optional[str] = None,
+                           priority: str = PRIORITY_INTERACTIVE,
+                           stages: Optional[Tuple[str, ...]] = None) -> Dict[str, str]:
+        """
+        Build the template data for an analysis, including token-lean code forms
+        
+        Args:
+            prompt: The original AI prompt
+            code: The code to analyze
+            project_context: Optional project context string
+            project_id: Optional project id the submission belongs to
+            tenant: Fair-scheduling key for the executor
+            priority: Scheduling class for the executor
+            stages: Optional subset of ANALYSIS_STAGES to run
+            
+        Returns:
+            Template data; 'code' is what the prompts embed and 'original_code'
+            is the submission as received
             
-            # Submit all three analysis tasks
-            future_scores = executor.submit(self._call_ai, self._get_scores_prompt(), prompt_data)
-            future_reports = executor.submit(self._call_ai, self._get_reports_prompt(), prompt_data)
-            future_refactor = executor.submit(self._call_ai, self._get_refactor_prompt(), prompt_data)
+        Raises:
+            ValueError: If stages names no known stage
+        """
+        if stages:
+            stages = tuple(stage for stage in ANALYSIS_STAGES if stage in stages)
+            if not stages:
+                raise ValueError(f"stages must include at least one of {', '.join(ANALYSIS_STAGES)}")
+        
+        tree = parse_code(code)
+        prompt_code = minify_code(code, tree=tree) if config.AI_MINIFY_WHITESPACE else code
+        scores_code = minify_code(code, strip_docs=True, tree=tree) if config.AI_MINIFY_SCORES_DOCS else prompt_code
+        
+        static_metrics = ''
+        if config.AI_STATIC_METRICS_IN_PROMPT:
+            # Measured on the code the prompts embed, so line numbers match what the model sees
+            metrics = compute_code_metrics(prompt_code, tree=tree if prompt_code is code else None)
+            static_metrics = format_metrics_for_prompt(metrics)
+        
+        return {
+            'prompt': prompt,
+            'code': prompt_code,
+            'scores_code': scores_code,
+            'static_metrics': static_metrics,
+            'original_code': code,
+            'project_context': project_context or '',
+            'project_id': project_id or '',
+            'tenant': tenant or make_tenant(project_id=project_id),
+            'priority': priority,
+            'stages': stages or ANALYSIS_STAGES
+        }
+    
+    @staticmethod
+    def _stage_prompt_data(stage: str, prompt_data: Dict[str, str]) -> Dict[str, str]:
+        """Get the template data for one stage (scores gets the docstring-free code)"""
+        if stage == 'scores':
+            return dict(prompt_data, code=prompt_data['scores_code'])
+        return prompt_data
+    
+    def _get_cache_key(self, prompt_data: Dict[str, str]) -> str:
+        """Build the content-addressed cache key for an analysis request"""
+        return make_cache_key(
+            self.router.signature(),
+            PROMPT_TEMPLATE_VERSION,
+            config.AI_ANALYSIS_MODE,
+            config.AI_MINIFY_WHITESPACE,
+            config.AI_MINIFY_SCORES_DOCS,
+            config.AI_STATIC_METRICS_IN_PROMPT,
+            prompt_data['stages'],
+            prompt_data['prompt'],
+            prompt_data['original_code'],
+            prompt_data['project_context']
+        )
+    
+    @staticmethod
+    def _coalesce_timeout() -> float:
+        """How long a coalesced request waits for the analysis it joined"""
+        return float(config.AI_ANALYSIS_DEADLINE + config.AI_REQUEST_TIMEOUT)
+    
+    def _get_equivalent_key(self, prompt_data: Dict[str, str]) -> Optional[str]:
+        """
+        Build the alternate cache key from the code's semantic fingerprint
+        
+        Submissions that differ only in formatting, comments, docstrings or
+        quote style (and, with ANALYSIS_CACHE_RENAME_LOCALS, local variable
+        names) share this key.
+        
+        Returns:
+            Cache key, or None if disabled or the code is not valid Python
+        """
+        if not config.ANALYSIS_CACHE_FINGERPRINT:
+            return None
+        fingerprint = semantic_fingerprint(prompt_data['original_code'], rename_locals=config.ANALYSIS_CACHE_RENAME_LOCALS)
+        if fingerprint is None:
+            return None
+        return make_cache_key(
+            'fingerprint',
+            config.ANALYSIS_CACHE_RENAME_LOCALS,
+            self.router.signature(),
+            PROMPT_TEMPLATE_VERSION,
+            config.AI_ANALYSIS_MODE,
+            config.AI_MINIFY_WHITESPACE,
+            config.AI_MINIFY_SCORES_DOCS,
+            config.AI_STATIC_METRICS_IN_PROMPT,
+            prompt_data['stages'],
+            prompt_data['prompt'],
+            fingerprint,
+            prompt_data['project_context']
+        )
+    
+    def _lookup_cache(self, cache_key: str, prompt_data: Dict[str, str]) -> Optional[Dict[str, Any]]:
+        """
+        Look up a cached result for an exact or equivalent earlier submission
+        
+        Args:
+            cache_key: Exact cache key from _get_cache_key
+            prompt_data: Template data of the current request
             
+        Returns:
+            Cached results marked cached=True (and equivalent_submission=True
+            when served from an equivalent submission), or None on miss
+        """
+        if self.cache is None:
+            return None
+        
+        cached = self._get_cached_entry(cache_key, prompt_data)
+        if cached is None and prompt_data['stages'] != ANALYSIS_STAGES:
+            # A full analysis of the same submission covers any subset of stages
+            full_data = dict(prompt_data, stages=ANALYSIS_STAGES)
+            cached = self._get_cached_entry(self._get_cache_key(full_data), full_data)
+            if cached is not None:
+                cached = self._select_stages(cached, prompt_data['stages'])
+        if cached is None:
+            return None
+        
+        cached['cached'] = True
+        return cached
+    
+    def _get_cached_entry(self, cache_key: str, prompt_data: Dict[str, str]) -> Optional[Dict[str, Any]]:
+        """Get the cached result under the exact key or, failing that, the semantic fingerprint key"""
+        cached = self.cache.get(cache_key)
+        if cached is None:
+            equivalent_key = self._get_equivalent_key(prompt_data)
+            cached = self.cache.get_alias(equivalent_key) if equivalent_key is not None else None
+            if cached is None:
+                return None
+            cached['equivalent_submission'] = True
+            cached['original_code'] = prompt_data['original_code']
+        return cached
+    
+    @staticmethod
+    def _select_stages(results: Dict[str, Any], stages: Tuple[str, ...]) -> Dict[str, Any]:
+        """Drop the fields of stages that were not requested from a combined result"""
+        for stage in ANALYSIS_STAGES:
+            if stage not in stages:
+                for key in STAGE_RESULT_KEYS[stage]:
+                    results.pop(key, None)
+        results['stages'] = [stage for stage in results.get('stages', ANALYSIS_STAGES) if stage in stages]
+        return results
+    
+    def _store_result(self, cache_key: str, prompt_data: Dict[str, str], results: Dict[str, Any]) -> None:
+        """Cache a successful result, with its semantic fingerprint key pointing at it"""
+        if self.cache is None or self._has_stage_errors(results):
+            return
+        self.cache.set(cache_key, results)
+        
+        # Equivalent submissions point at the result instead of duplicating it
+        equivalent_key = self._get_equivalent_key(prompt_data)
+        if equivalent_key is not None:
+            self.cache.set_alias(equivalent_key, cache_key)
+    
+    @staticmethod
+    def _has_stage_errors(results: Dict[str, Any]) -> bool:
+        """Check whether any AI stage fell back to an error payload"""
+        return 'error' in results
+    
+    def _get_stale_result(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        """Get an expired cached result to serve while the model's circuit is open"""
+        if self.cache is None:
+            return None
+        stale = self.cache.get(cache_key, allow_stale=True)
+        if stale is not None:
+            print("Serving cached analysis while the AI circuit is open")
+            stale['cached'] = True
+            stale['stale'] = True
+        return stale
+    
+    def _get_breaker(self, model_name: str) -> CircuitBreaker:
+        """Get the circuit breaker for a model"""
+        with self._breakers_lock:
+            breaker = self._breakers.get(model_name)
+            if breaker is None:
+                breaker = CircuitBreaker(
+                    model_name,
+                    failure_threshold=config.AI_CIRCUIT_FAILURE_THRESHOLD,
+                    recovery_timeout=config.AI_CIRCUIT_RECOVERY_TIMEOUT,
+                    # Enough trial calls for one analysis's fan-out
+                    half_open_max_calls=len(ANALYSIS_STAGES)
+                )
+                self._breakers[model_name] = breaker
+            return breaker
+    
+    def _is_model_available(self, model_name: str) -> bool:
+        """Check that a model's circuit is not open"""
+        return self._get_breaker(model_name).state != STATE_OPEN
+    
+    def _check_circuit(self, model_names: Iterable[str]) -> None:
+        """Fail fast before queueing any calls if a routed model's circuit is open"""
+        for model_name in sorted(set(model_names)):
+            breaker = self._get_breaker(model_name)
+            if breaker.state == STATE_OPEN:
+                raise CircuitOpenError(
+                    f"Circuit for {model_name} is open; AI calls are paused",
+                    retry_after=breaker.retry_after()
+                )
+    
+    def _route_stages(self, plan: Tuple[str, ...], prompt_data: Dict[str, str]) -> Dict[str, str]:
+        """
+        Pick the model for each call of a plan
+        
+        Args:
+            plan: Stage names to call
+            prompt_data: Data to fill the prompt templates
+            
+        Returns:
+            Mapping of stage name to model name
+        """
+        input_tokens = estimate_tokens(prompt_data['code'])
+        return {stage: self.router.route(stage, input_tokens, self._is_model_available) for stage in plan}
+    
+    def circuit_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Return circuit breaker state per model for monitoring"""
+        with self._breakers_lock:
+            breakers = list(self._breakers.values())
+        return {breaker.name: breaker.stats() for breaker in breakers}
+    
+    def _get_stage_prompt(self, stage: str) -> str:
+        """Get the prompt template for an analysis stage"""
+        return {
+            'scores': self._get_scores_prompt,
+            'reports': self._get_reports_prompt,
+            'refactor': self._get_refactor_prompt,
+            'consolidated': self._get_consolidated_prompt
+        }[stage]()
+    
+    def _get_call_plan(self, prompt_data: Dict[str, str]) -> Tuple[str, ...]:
+        """
+        Get the AI calls to make for one analysis, checking the token budget first
+        
+        Fan-out analyses whose combined input exceeds AI_FANOUT_MAX_TOKENS are
+        routed to a single consolidated call. A subset of stages is always
+        fanned out, since the consolidated prompt asks for every stage.
+        
+        Args:
+            prompt_data: Data to fill the prompt templates
+            
+        Returns:
+            Tuple of stage names to call
+            
+        Raises:
+            TokenBudgetExceededError: If any prompt exceeds AI_MAX_INPUT_TOKENS
+        """
+        plan = prompt_data['stages']
+        if plan == ANALYSIS_STAGES and config.AI_ANALYSIS_MODE == 'consolidated':
+            plan = ('consolidated',)
+        
+        tokens = self._estimate_plan_tokens(plan, prompt_data)
+        if plan == ANALYSIS_STAGES and config.AI_FANOUT_MAX_TOKENS and sum(tokens) > config.AI_FANOUT_MAX_TOKENS:
+            plan = ('consolidated',)
+            tokens = self._estimate_plan_tokens(plan, prompt_data)
+        
+        if max(tokens) > config.AI_MAX_INPUT_TOKENS:
+            raise TokenBudgetExceededError(
+                f"Input is about {max(tokens)} tokens, over the limit of {config.AI_MAX_INPUT_TOKENS}"
+            )
+        
+        return plan
+    
+    def _estimate_plan_tokens(self, plan: Tuple[str, ...], prompt_data: Dict[str, str]) -> list:
+        """Estimate input tokens for each call in a plan"""
+        return [
+            estimate_tokens(self._get_stage_prompt(stage).format(**self._stage_prompt_data(stage, prompt_data)))
+            for stage in plan
+        ]
+    
+    def _split_consolidated(self, data: Dict[str, Any]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Split a consolidated response into per-stage results
+        
+        Args:
+            data: Parsed response to the consolidated prompt
+            
+        Yields:
+            (stage, result dict) tuples shaped like fan-out stage results
+        """
+        for stage in ANALYSIS_STAGES:
+            if 'error' in data:
+                yield stage, data
+                continue
+            yield stage, {key: data[key] for key in STAGE_KEYS[stage] if key in data}
+    
+    def _expand_stage_result(self, stage: str, result: Dict[str, Any]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Yield per-stage results for a finished call, splitting consolidated responses"""
+        if stage == 'consolidated':
+            yield from self._split_consolidated(result)
+        else:
+            yield stage, result
+    
+    def _submit_stages(self, prompt_data: Dict[str, str], deadline: float,
+                       emit: Optional[Callable[[str, Dict[str, Any]], None]] = None) -> Dict[str, Future]:
+        """
+        Submit every analysis stage to the shared executor
+        
+        Args:
+            prompt_data: Data to fill the prompt templates
+            deadline: Absolute time.monotonic() deadline for the analysis
+            emit: Optional callback receiving (event, payload) for text of
+                STREAMED_FIELDS stages as it is generated
+            
+        Returns:
+            Mapping of stage name to its pending future
+        """
+        models = self._route_stages(self._get_call_plan(prompt_data), prompt_data)
+        self._check_circuit(models.values())
+        futures = {}
+        try:
+            for stage, model_name in models.items():
+                self.hedging.record_call()
+                batch_key = self._micro_batch_key(stage, prompt_data, model_name, emit)
+                if batch_key is not None:
+                    futures[stage] = self.micro_batcher.submit(batch_key, (stage, prompt_data, model_name, deadline))
+                    continue
+                futures[stage] = self.executor.submit(
+                    self._call_stage, stage, prompt_data, model_name, deadline, emit, deadline=deadline,
+                    tenant=prompt_data['tenant'], priority=prompt_data['priority']
+                )
+        except AIExecutorSaturatedError:
+            for future in futures.values():
+                future.cancel()
+            raise
+        return futures
+    
+    def _micro_batch_key(self, stage: str, prompt_data: Dict[str, str], model_name: str,
+                         emit: Optional[Callable[[str, Dict[str, Any]], None]] = None) -> Optional[str]:
+        """
+        Get the key under which a stage call may be micro-batched, or None to call it alone
+        
+        Only small submissions are batched, and only with calls for the same
+        stage, model and priority whose fixed prompt prefix (instructions and
+        project context) is identical, so the prefix is sent once per batch.
+        Streamed calls are never batched.
+        """
+        if self.micro_batcher is None or (emit is not None and stage in STREAMED_FIELDS):
+            return None
+        if estimate_tokens(prompt_data['code']) > config.AI_MICRO_BATCH_MAX_TOKENS:
+            return None
+        prompt_template = self._get_stage_prompt(stage)
+        if VARIABLE_PART_MARKER not in prompt_template:
+            return None
+        prefix = prompt_template.partition(VARIABLE_PART_MARKER)[0].format(**self._stage_prompt_data(stage, prompt_data))
+        return make_cache_key('micro-batch', stage, model_name, prompt_data['priority'], prefix)
+    
+    def _dispatch_micro_batch(self, key: str, items: List[Tuple[str, Dict[str, str], str, float]],
+                              start: Callable[[], List[bool]]) -> Future:
+        """
+        Queue a closed micro-batch on the shared executor as a single call
+        
+        The call is charged to every submitting tenant in equal shares, so a
+        batch does not count against whichever user happened to come first.
+        
+        Args:
+            key: Batch key from _micro_batch_key
+            items: (stage, prompt_data, model_name, deadline) of each batched call
+            start: MicroBatcher callback marking the items running
+            
+        Returns:
+            Future for the per-item results, in item order
+        """
+        _, prompt_data, _, _ = items[0]
+        deadline = max(item[3] for item in items)
+        return self.executor.submit(
+            self._call_stage_batch, items, start, deadline=deadline,
+            tenant=[item[1]['tenant'] for item in items], priority=prompt_data['priority']
+        )
+    
+    def _call_stage_batch(self, items: List[Tuple[str, Dict[str, str], str, float]],
+                          start: Callable[[], List[bool]]) -> List[Optional[Dict[str, Any]]]:
+        """
+        Run the same stage for several submissions in one AI call
+        
+        The stage template's fixed prefix is sent once, followed by every
+        submission's per-request part under its own id; the response is split
+        back by id. A submission missing from the response is retried alone.
+        Items cancelled while the batch was queued are left out of the call.
+        
+        Args:
+            items: (stage, prompt_data, model_name, deadline) of each batched call
+            start: MicroBatcher callback marking the items running; returns
+                which items are still wanted
+            
+        Returns:
+            Parsed response (or {"error": ...}) for each item, in item order;
+            None for items that were cancelled
+        """
+        wanted = start()
+        results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+        live = [index for index, keep in enumerate(wanted) if keep]
+        if len(live) == 1:
+            stage, prompt_data, model_name, deadline = items[live[0]]
+            results[live[0]] = self._call_stage(stage, prompt_data, model_name, deadline)
+        if len(live) <= 1:
+            return results
+        
+        stage, prompt_data, model_name, _ = items[live[0]]
+        prefix_template, marker, variable_template = self._get_stage_prompt(stage).partition(VARIABLE_PART_MARKER)
+        item_ids = {index: f"submission_{number}" for number, index in enumerate(live, 1)}
+        sections = [
+            MICRO_BATCH_ITEM_HEADER.format(id=item_ids[index])
+            + (marker + variable_template).format(**self._stage_prompt_data(stage, items[index][1]))
+            for index in live
+        ]
+        # The batch goes through the regular call path (retries, circuit
+        # breaker) with the per-request part swapped out
+        batch_data = dict(self._stage_prompt_data(stage, prompt_data),
+                          static_metrics=MICRO_BATCH_INSTRUCTIONS + ''.join(sections))
+        started_at = time.monotonic()
+        response = self._call_ai(
+            prefix_template + VARIABLE_PART_MARKER, batch_data, model_name, max(items[index][3] for index in live)
+        )
+        if 'error' in response:
+            for index in live:
+                results[index] = dict(response)
+            return results
+        elapsed = time.monotonic() - started_at
+        self.hedging.record_latency(stage, elapsed)
+        self.router.record_latency(model_name, stage, elapsed)
+        
+        for index in live:
+            result = response.get(item_ids[index])
+            if not isinstance(result, dict):
+                _, item_data, _, item_deadline = items[index]
+                result = self._call_stage(stage, item_data, model_name, item_deadline)
+            results[index] = result
+        return results
+    
+    def _call_stage(self, stage: str, prompt_data: Dict[str, str], model_name: str,
+                    deadline: Optional[float] = None,
+                    emit: Optional[Callable[[str, Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """Run one stage call and feed its latency to the hedging policy and router"""
+        on_text = None
+        if emit is not None and stage in STREAMED_FIELDS:
+            on_text = self._stream_field(stage, emit)
+        started_at = time.monotonic()
+        result = self._call_ai(
+            self._get_stage_prompt(stage), self._stage_prompt_data(stage, prompt_data), model_name, deadline,
+            on_text=on_text
+        )
+        if 'error' not in result:
+            elapsed = time.monotonic() - started_at
+            self.hedging.record_latency(stage, elapsed)
+            self.router.record_latency(model_name, stage, elapsed)
+        return result
+    
+    @staticmethod
+    def _stream_field(stage: str, emit: Callable[[str, Dict[str, Any]], None]) -> Callable[[Optional[str]], None]:
+        """
+        Build an on_text callback that forwards a stage's streamed field as events
+        
+        Emits "<stage>_delta" events with newly decoded text, and a
+        "<stage>_reset" event when a retry restarts the response, after which
+        the text streamed so far must be discarded.
+        """
+        decoder = None
+        
+        def on_text(piece: Optional[str]) -> None:
+            nonlocal decoder
+            if piece is None:
+                if decoder is not None:
+                    emit(f"{stage}_reset", {})
+                decoder = JsonStringFieldStream(STREAMED_FIELDS[stage])
+                return
+            text = decoder.feed(piece)
+            if text:
+                emit(f"{stage}_delta", {"text": text})
+        
+        return on_text
+    
+    def _iter_stage_results(self, prompt_data: Dict[str, str], deadline: float,
+                            stream_text: bool = False) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Run all stages and yield their parsed results in completion order
+        
+        When hedging is enabled, a stage still running past its rolling
+        percentile latency gets one duplicate call and the first result wins.
+        
+        Args:
+            prompt_data: Data to fill the prompt templates
+            deadline: Absolute time.monotonic() deadline for the analysis
+            stream_text: Whether to stream STREAMED_FIELDS stages and yield
+                their "<stage>_delta" / "<stage>_reset" events as text arrives
+            
+        Yields:
+            (stage, parsed response dict) tuples, interleaved with
+            (event, payload) tuples when stream_text is set
+            
+        Raises:
+            AIDeadlineExceededError: If the analysis deadline passes first
+        """
+        # Streamed text and finished-call wake-ups (None) from executor threads
+        events = queue.Queue() if stream_text else None
+        emit = (lambda event, payload: events.put((event, payload))) if stream_text else None
+        futures = self._submit_stages(prompt_data, deadline, emit)
+        pending = {future: stage for stage, future in futures.items()}
+        hedged = set()
+        
+        def hedge_candidates():
+            if not config.AI_HEDGING_ENABLED:
+                return {}
+            candidates = {}
+            for future, stage in pending.items():
+                delay = self.hedging.hedge_delay(stage)
+                # A duplicate of a streamed call would interleave its text
+                if (stage not in hedged and delay is not None
+                        and not (stream_text and stage in STREAMED_FIELDS)):
+                    # Latency percentiles are measured from call start, so
+                    # time spent queued does not count; None while queued
+                    candidates[stage] = (getattr(future, 'started_at', None), delay)
+            return candidates
+        
+        def wait_for_progress(timeout):
+            if events is None:
+                done, _ = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+                return done, []
+            received = []
+            # A call may have finished while the previous drain consumed its
+            # wake-up; it must be collected rather than waited for
+            if not any(future.done() for future in pending):
+                try:
+                    received.append(events.get(timeout=timeout))
+                except queue.Empty:
+                    return [], []
+            # Calls finished by now have queued all their text already
+            done = [future for future in pending if future.done()]
             try:
-                # Get results from all futures
-                scores_result = future_scores.result()
-                reports_result = future_reports.result()
-                refactor_result = future_refactor.result()
+                while True:
+                    received.append(events.get_nowait())
+            except queue.Empty:
+                pass
+            return done, [event for event in received if event is not None]
+        
+        if events is not None:
+            for future in pending:
+                future.add_done_callback(lambda _: events.put(None))
+        
+        try:
+            while pending:
+                now = time.monotonic()
+                if now >= deadline:
+                    raise AIDeadlineExceededError(
+                        f"AI analysis exceeded deadline of {config.AI_ANALYSIS_DEADLINE}s"
+                    )
                 
-                # Combine and process results
-                return self._combine_results(scores_result, reports_result, refactor_result, code)
+                # Wake up for the next result or the next hedge trigger
+                timeout = deadline - now
+                for started_at, delay in hedge_candidates().values():
+                    # A queued call needs a hedge no sooner than delay from now
+                    timeout = min(timeout, max(0.0, (started_at or now) + delay - now))
                 
-            except Exception as e:
-                raise Exception(f"AI analysis failed: {str(e)}")
+                done, streamed = wait_for_progress(timeout)
+                yield from streamed
+                
+                for future in done:
+                    stage = pending.pop(future, None)
+                    if stage is None:
+                        continue
+                    result = future.result()
+                    # First result wins; drop the other copy of a hedged stage
+                    for other, other_stage in list(pending.items()):
+                        if other_stage == stage:
+                            other.cancel()
+                            del pending[other]
+                    yield from self._expand_stage_result(stage, result)
+                
+                now = time.monotonic()
+                for stage, (started_at, delay) in hedge_candidates().items():
+                    if started_at is None or now - started_at < delay:
+                        continue
+                    # One decision per stage; a refused hedge is not retried in a loop
+                    hedged.add(stage)
+                    if self.hedging.try_acquire_hedge():
+                        try:
+                            model_name = self._route_stages((stage,), prompt_data)[stage]
+                            future = self.executor.submit(
+                                self._call_stage, stage, prompt_data, model_name, deadline, deadline=deadline,
+                                tenant=prompt_data['tenant'], priority=prompt_data['priority']
+                            )
+                            if events is not None:
+                                future.add_done_callback(lambda _: events.put(None))
+                            pending[future] = stage
+                        except AIExecutorSaturatedError:
+                            pass
+        finally:
+            # Also reached when a streaming client disconnects
+            for future in pending:
+                future.cancel()
     
-    def _call_ai(self, prompt_template: str, prompt_data: Dict[str, str]) -> str:
+    def _run_analysis(self, prompt_data: Dict[str, str]) -> Dict[str, Any]:
         """
-        Make a single AI API call with error handling
+        Run the three AI analysis stages and combine their results
         
         Args:
-            prompt_template: The prompt template to use
-            prompt_data: Data to fill the template
+            prompt_data: Data to fill the prompt templates
             
         Returns:
-            JSON string response from AI
+            Combined analysis results
         """
-        final_prompt = prompt_template.format(**prompt_data)
+        code = prompt_data['original_code']
+        
+        segmented = self._run_segmented_analysis(prompt_data)
+        if segmented is not None:
+            return segmented
+        
+        deadline = time.monotonic() + config.AI_ANALYSIS_DEADLINE
+        raw_results = {}
+        
+        try:
+            # Collect results from all stages within the analysis deadline
+            for stage, result in self._iter_stage_results(prompt_data, deadline):
+                raw_results[stage] = result
+        except (AIExecutorSaturatedError, AIDeadlineExceededError, TokenBudgetExceededError, CircuitOpenError):
+            raise
+        except Exception as e:
+            raise Exception(f"AI analysis failed: {str(e)}")
+        
+        # Combine and process results
+        return self._combine_results(
+            raw_results.get('scores'), raw_results.get('reports'), raw_results.get('refactor'), code
+        )
+    
+    def _get_chunks(self, prompt_data: Dict[str, str]) -> List[CodeChunk]:
+        """
+        Split the submission into chunks when chunked mode applies
+        
+        Only code longer than MAX_CODE_LENGTH, the most a single analysis
+        accepts, is chunked; anything shorter is analyzed whole as before.
+        """
+        if not config.AI_CHUNKING_ENABLED or len(prompt_data['original_code']) <= config.MAX_CODE_LENGTH:
+            return []
+        return split_code_into_chunks(prompt_data['original_code'], config.AI_CHUNK_SIZE)
+    
+    def _get_units(self, prompt_data: Dict[str, str]) -> List[CodeChunk]:
+        """
+        Split a project submission into fingerprinted units when incremental mode applies
+        
+        Every submission in this mode is analyzed per unit, including a
+        project's first: that pass stores the findings for each unit, so the
+        next resubmission only re-analyzes the units that changed.
+        """
+        if not config.AI_INCREMENTAL_ENABLED or not prompt_data['project_id']:
+            return []
+        units = split_code_into_units(prompt_data['original_code'])
+        if not 2 <= len(units) <= config.AI_INCREMENTAL_MAX_UNITS:
+            return []
+        return units
+    
+    def _run_segmented_analysis(self, prompt_data: Dict[str, str]) -> Optional[Dict[str, Any]]:
+        """
+        Run incremental or chunked analysis when either applies
+        
+        Args:
+            prompt_data: Template data for the whole submission
+            
+        Returns:
+            Combined results, or None if the submission should be analyzed whole
+        """
+        units = self._get_units(prompt_data)
+        if units:
+            stored, changed = self._lookup_units(prompt_data, units)
+            changed_results = self._analyze_chunks(prompt_data, changed)
+            return self._merge_incremental(prompt_data, units, stored, changed, changed_results)
+        
+        chunks = self._get_chunks(prompt_data)
+        if len(chunks) > 1:
+            return self._reduce_chunk_results(
+                chunks, self._analyze_chunks(prompt_data, chunks), prompt_data['original_code']
+            )
+        
+        return None
+    
+    def _analyze_chunks(self, prompt_data: Dict[str, str], chunks: List[CodeChunk]) -> List[Dict[str, Any]]:
+        """
+        Map step: analyze every chunk in parallel
+        
+        All chunk stage calls go through the shared executor, so the global
+        concurrency limit still applies.
+        
+        Args:
+            prompt_data: Template data for the whole submission
+            chunks: Code chunks or units to analyze
+            
+        Returns:
+            Combined results for each chunk, in order
+        """
+        if not chunks:
+            return []
+        
+        deadline = time.monotonic() + config.AI_ANALYSIS_DEADLINE
+        chunk_futures = []
+        
+        try:
+            for chunk in chunks:
+                chunk_data = self._build_prompt_data(
+                    prompt_data['prompt'], chunk.code, prompt_data['project_context'],
+                    tenant=prompt_data['tenant'], priority=prompt_data['priority'], stages=prompt_data['stages']
+                )
+                chunk_futures.append(self._submit_stages(chunk_data, deadline))
+        except Exception:
+            for futures in chunk_futures:
+                for future in futures.values():
+                    future.cancel()
+            raise
+        
+        all_futures = [future for futures in chunk_futures for future in futures.values()]
+        _, not_done = wait(all_futures, timeout=max(0.0, deadline - time.monotonic()))
+        if not_done:
+            for future in not_done:
+                future.cancel()
+            raise AIDeadlineExceededError(
+                f"AI analysis exceeded deadline of {config.AI_ANALYSIS_DEADLINE}s"
+            )
         
+        chunk_results = []
         try:
-            model = genai.GenerativeModel(self.model_name)
-            response = model.generate_content(
-                final_prompt,
-                generation_config=types.GenerationConfig(
-                    response_mime_type="application/json"
+            for chunk, futures in zip(chunks, chunk_futures):
+                raw_results = {}
+                for stage, future in futures.items():
+                    raw_results.update(self._expand_stage_result(stage, future.result()))
+                chunk_results.append(self._combine_results(
+                    raw_results.get('scores'), raw_results.get('reports'), raw_results.get('refactor'), chunk.code
+                ))
+        except (AIDeadlineExceededError, CircuitOpenError):
+            raise
+        except Exception as e:
+            raise Exception(f"AI analysis failed: {str(e)}")
+        
+        return chunk_results
+    
+    async def _analyze_chunks_async(self, prompt_data: Dict[str, str], chunks: List[CodeChunk]) -> List[Dict[str, Any]]:
+        """Async map step: analyze every chunk concurrently, awaiting their executor calls"""
+        results = await asyncio.gather(*(
+            self._run_analysis_async(
+                self._build_prompt_data(
+                    prompt_data['prompt'], chunk.code, prompt_data['project_context'], tenant=prompt_data['tenant'],
+                    stages=prompt_data['stages']
                 )
             )
+            for chunk in chunks
+        ))
+        return list(results)
+    
+    def _get_unit_key(self, prompt_data: Dict[str, str], unit: CodeChunk) -> str:
+        """Build the per-project store key for a unit's findings"""
+        return make_cache_key(
+            'unit',
+            prompt_data['project_id'],
+            self.router.signature(),
+            PROMPT_TEMPLATE_VERSION,
+            config.AI_ANALYSIS_MODE,
+            config.AI_MINIFY_WHITESPACE,
+            config.AI_MINIFY_SCORES_DOCS,
+            config.AI_STATIC_METRICS_IN_PROMPT,
+            prompt_data['stages'],
+            prompt_data['prompt'],
+            prompt_data['project_context'],
+            unit.fingerprint
+        )
+    
+    def _lookup_units(self, prompt_data: Dict[str, str],
+                      units: List[CodeChunk]) -> Tuple[Dict[int, Dict[str, Any]], List[CodeChunk]]:
+        """
+        Find stored findings for unchanged units
+        
+        Args:
+            prompt_data: Template data for the whole submission
+            units: Units from split_code_into_units
+            
+        Returns:
+            Tuple of (stored findings by unit index, units that need analysis)
+        """
+        stored = {}
+        changed = []
+        for index, unit in enumerate(units):
+            findings = self.unit_store.get(self._get_unit_key(prompt_data, unit))
+            if findings is not None:
+                stored[index] = findings
+            else:
+                changed.append(unit)
+        return stored, changed
+    
+    def _merge_incremental(self, prompt_data: Dict[str, str], units: List[CodeChunk],
+                           stored: Dict[int, Dict[str, Any]], changed: List[CodeChunk],
+                           changed_results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Store findings for newly analyzed units and merge them with reused ones
+        
+        Args:
+            prompt_data: Template data for the whole submission
+            units: All units of the submission
+            stored: Reused findings by unit index
+            changed: Units that were analyzed in this request
+            changed_results: Combined results for each changed unit
             
-            raw_text = response.text.strip()
+        Returns:
+            Combined analysis results for the whole submission
+        """
+        for unit, result in zip(changed, changed_results):
+            if not self._has_stage_errors(result):
+                self.unit_store.set(self._get_unit_key(prompt_data, unit), result)
+        
+        fresh = {id(unit): result for unit, result in zip(changed, changed_results)}
+        unit_results = [
+            stored[index] if index in stored else fresh[id(unit)]
+            for index, unit in enumerate(units)
+        ]
+        
+        combined = self._reduce_chunk_results(units, unit_results, prompt_data['original_code'])
+        combined['incremental'] = {
+            'reused_units': [units[index].name for index in sorted(stored)],
+            'analyzed_units': [unit.name for unit in changed]
+        }
+        return combined
+    
+    def _reduce_chunk_results(self, chunks: List[CodeChunk], chunk_results: List[Dict[str, Any]],
+                              original_code: str) -> Dict[str, Any]:
+        """
+        Merge per-chunk analyses into one result
+        
+        Scores are averaged weighted by chunk size, text fields are joined
+        with their line-range labels, and refactored chunks are concatenated.
+        Imports already emitted by an earlier chunk (every chunk after the
+        first was sent with the file's imports) are left out of later ones,
+        and merged code longer than MAX_REFACTORED_CODE_LENGTH is cut at a
+        line boundary and flagged with refactored_code_truncated.
+        
+        Args:
+            chunks: Analyzed chunks in source order
+            chunk_results: Combined results for each chunk
+            original_code: The full submission
             
-            # Clean markdown fences if present
-            if raw_text.startswith('```json'):
-                raw_text = raw_text[len('```json'):].strip()
-            if raw_text.endswith('```'):
-                raw_text = raw_text[:-3].strip()
+        Returns:
+            Combined analysis results
+        """
+        combined: Dict[str, Any] = {}
+        weights = [len(chunk.code) for chunk in chunks]
+        
+        for key in ('total_score', 'reliability_score', 'mastery_score'):
+            scored = [
+                (result[key], weight) for result, weight in zip(chunk_results, weights)
+                if isinstance(result.get(key), (int, float))
+            ]
+            if scored:
+                combined[key] = round(sum(score * weight for score, weight in scored) / sum(w for _, w in scored))
+        
+        for key in ('explanation_summary', 'debug_prognosis') + REPORT_KEYS:
+            parts = [
+                f"{chunk.label}: {result[key]}"
+                for chunk, result in zip(chunks, chunk_results) if result.get(key)
+            ]
+            if parts:
+                combined[key] = '\n\n'.join(parts)
+        
+        refactored = []
+        seen_imports = set()
+        for chunk, result in zip(chunks, chunk_results):
+            if result.get('refactored_code'):
+                code = self._drop_seen_imports(result['refactored_code'], seen_imports)
+                refactored.append(f"# --- {chunk.label} ---\n{code}")
+        if refactored:
+            merged = '\n\n'.join(refactored)
+            if len(merged) > MAX_REFACTORED_CODE_LENGTH:
+                marker = f"\n# ... truncated: refactored code exceeds {MAX_REFACTORED_CODE_LENGTH} characters"
+                cut = merged.rfind('\n', 0, MAX_REFACTORED_CODE_LENGTH - len(marker) + 1)
+                merged = merged[:max(cut, 0)] + marker
+                combined['refactored_code_truncated'] = True
+            combined['refactored_code'] = merged
+        
+        roadmap = []
+        for result in chunk_results:
+            for step in result.get('project_roadmap') or []:
+                if step not in roadmap:
+                    roadmap.append(step)
+        if roadmap:
+            combined['project_roadmap'] = roadmap
+        
+        errors = [result['error'] for result in chunk_results if 'error' in result]
+        if errors:
+            combined['error'] = errors[0]
+        
+        combined['original_code'] = original_code
+        combined['stages'] = [
+            stage for stage in ANALYSIS_STAGES
+            if all(stage in result.get('stages', ANALYSIS_STAGES) for result in chunk_results)
+        ]
+        combined['chunks'] = [
+            {'name': chunk.name, 'start_line': chunk.start_line, 'end_line': chunk.end_line} for chunk in chunks
+        ]
+        return combined
+    
+    @staticmethod
+    def _drop_seen_imports(code: str, seen_imports: set) -> str:
+        """
+        Remove leading import lines that were already emitted, recording new ones
+        
+        Only the import block at the top of the code is considered, so
+        imports inside functions are kept.
+        
+        Args:
+            code: Refactored code of one chunk
+            seen_imports: Import statements emitted so far; updated in place
             
-            # Ensure valid UTF-8
-            raw_text = raw_text.encode('utf-8', 'ignore').decode('utf-8')
+        Returns:
+            The code without repeated imports
+        """
+        lines = code.splitlines()
+        kept = []
+        index = 0
+        while index < len(lines):
+            stripped = lines[index].strip()
+            if not stripped:
+                kept.append(lines[index])
+                index += 1
+                continue
+            if not stripped.startswith(('import ', 'from ')):
+                break
+            # A parenthesized or backslash-continued import spans several lines
+            end = index + 1
+            if '(' in stripped and ')' not in stripped:
+                while end < len(lines) and ')' not in lines[end - 1]:
+                    end += 1
+            else:
+                while end < len(lines) and lines[end - 1].rstrip().endswith('\\'):
+                    end += 1
+            statement = ' '.join(line.strip() for line in lines[index:end])
+            if statement not in seen_imports:
+                seen_imports.add(statement)
+                kept.extend(lines[index:end])
+            index = end
+        return '\n'.join(kept + lines[index:]).strip('\n')
+    
+    def analyze_code_stream(self, prompt: str, code: str, project_context: Optional[str] = None,
+                            project_id: Optional[str] = None, user_id: Optional[str] = None,
+                            priority: str = PRIORITY_INTERACTIVE,
+                            stages: Optional[Tuple[str, ...]] = None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Analyze code and yield each stage as soon as it finishes
+        
+        Args:
+            prompt: The original AI prompt
+            code: The code to analyze
+            project_context: Optional project context string with architecture info
+            project_id: Optional project id; enables incremental re-analysis
+            user_id: Optional requesting user id, used for fair scheduling
+            priority: Scheduling class, PRIORITY_INTERACTIVE or PRIORITY_BATCH
+            stages: Optional subset of ANALYSIS_STAGES to run; defaults to all
             
-            # Validate JSON
+        Yields:
+            (stage, payload) tuples for the requested stages in completion
+            order, followed by ('complete', combined_results). With
+            AI_STREAM_REFACTOR_TOKENS, ('refactor_delta', {'text': ...}) tuples
+            carry the refactored code as it is generated, and ('refactor_reset',
+            {}) discards it when the call is retried; the 'refactor' payload
+            holds the final, validated text. Cached and coalesced analyses
+            send every stage's payload at once, taken from the finished result.
+        """
+        prompt_data = self._build_prompt_data(
+            prompt, code, project_context, project_id,
+            tenant=make_tenant(user_id, project_id), priority=priority, stages=stages
+        )
+        
+        cache_key = self._get_cache_key(prompt_data)
+        cached = self._lookup_cache(cache_key, prompt_data)
+        if cached is None:
             try:
-                parsed = json.loads(raw_text)
-                return json.dumps(parsed, ensure_ascii=False)
-            except json.JSONDecodeError:
-                # Try to fix common JSON issues
-                cleaned = re.sub(r'\\(?!["\\/bfnrtu])', r'\\\\', raw_text)
-                parsed = json.loads(cleaned)
-                return json.dumps(parsed, ensure_ascii=False)
+                # Routed as for a fan-out; the call plan itself is not known until segmenting
+                self._check_circuit(self._route_stages(prompt_data['stages'], prompt_data).values())
+            except CircuitOpenError:
+                # Nothing has been streamed yet, so a stale result can still stand in
+                cached = self._get_stale_result(cache_key)
+                if cached is None:
+                    raise
+        if cached is not None:
+            cached['cached'] = True
+            for stage in prompt_data['stages']:
+                yield stage, self._stage_payload(stage, cached)
+            yield 'complete', cached
+            return
+        
+        future = None
+        while config.AI_SINGLE_FLIGHT_ENABLED:
+            future, leader = self.in_flight.join(cache_key)
+            if leader:
+                break
+            # An identical analysis is already running; its stages are sent once it finishes
+            try:
+                results = self.in_flight.wait(future, timeout=self._coalesce_timeout())
+            except SingleFlightAbandonedError:
+                continue
+            except TimeoutError:
+                raise AIDeadlineExceededError("Identical analysis in progress did not finish in time")
+            results['coalesced'] = True
+            for stage in prompt_data['stages']:
+                yield stage, self._stage_payload(stage, results)
+            yield 'complete', results
+            return
+        
+        try:
+            results = self._run_segmented_analysis(prompt_data)
+            if results is not None:
+                # Segmented results only exist after the reduce step
+                for stage in prompt_data['stages']:
+                    yield stage, self._stage_payload(stage, results)
+            else:
+                deadline = time.monotonic() + config.AI_ANALYSIS_DEADLINE
+                raw_results = {}
+                
+                for stage, result in self._iter_stage_results(
+                    prompt_data, deadline, stream_text=config.AI_STREAM_REFACTOR_TOKENS
+                ):
+                    if stage not in ANALYSIS_STAGES:
+                        # Partial text of a stage still being generated
+                        yield stage, result
+                        continue
+                    raw_results[stage] = result
+                    yield stage, self._normalize_stage(stage, result)
                 
+                results = self._combine_results(
+                    raw_results.get('scores'), raw_results.get('reports'), raw_results.get('refactor'),
+                    prompt_data['original_code']
+                )
+            
+            self._store_result(cache_key, prompt_data, results)
+            results['cached'] = False
+        except BaseException as e:
+            # Includes the client disconnecting mid-stream (GeneratorExit)
+            if future is not None:
+                self.in_flight.complete(cache_key, future, error=e)
+            raise
+        
+        if future is not None:
+            self.in_flight.complete(cache_key, future, results)
+        yield 'complete', results
+    
+    def _stage_payload(self, stage: str, results: Dict[str, Any]) -> Dict[str, Any]:
+        """Take one stage's streamed payload from combined results"""
+        return {key: results[key] for key in STAGE_RESULT_KEYS[stage] if key in results}
+    
+    async def _run_analysis_async(self, prompt_data: Dict[str, str]) -> Dict[str, Any]:
+        """
+        Run the AI analysis stages without blocking the current event loop
+        
+        Stage calls run on the shared executor like every other path, so the
+        process-wide concurrency ceiling and fair queuing apply to async
+        analyses too; the coroutine only awaits their futures.
+        
+        Args:
+            prompt_data: Data to fill the prompt templates
+            
+        Returns:
+            Combined analysis results
+        """
+        deadline = time.monotonic() + config.AI_ANALYSIS_DEADLINE
+        futures = self._submit_stages(prompt_data, deadline)
+        
+        try:
+            results = await asyncio.wait_for(
+                asyncio.gather(*(asyncio.wrap_future(future) for future in futures.values())),
+                timeout=max(0.0, deadline - time.monotonic())
+            )
+            raw_results = {}
+            for stage, result in zip(futures, results):
+                raw_results.update(self._expand_stage_result(stage, result))
+        except asyncio.TimeoutError:
+            raise AIDeadlineExceededError(
+                f"AI analysis exceeded deadline of {config.AI_ANALYSIS_DEADLINE}s"
+            )
+        except (AIDeadlineExceededError, CircuitOpenError):
+            raise
+        except Exception as e:
+            raise Exception(f"AI analysis failed: {str(e)}")
+        finally:
+            # Also reached when the awaiting request is cancelled
+            for future in futures.values():
+                future.cancel()
+        
+        return self._combine_results(
+            raw_results.get('scores'), raw_results.get('reports'), raw_results.get('refactor'),
+            prompt_data['original_code']
+        )
+    
+    def _call_ai(self, prompt_template: str, prompt_data: Dict[str, str], model_name: Optional[str] = None,
+                 deadline: Optional[float] = None,
+                 on_text: Optional[Callable[[Optional[str]], None]] = None) -> Dict[str, Any]:
+        """
+        Make a single AI API call with error handling
+        
+        Args:
+            prompt_template: The prompt template to use
+            prompt_data: Data to fill the template
+            model_name: Model to call; defaults to the service's default model
+            deadline: Optional absolute time.monotonic() deadline for the analysis
+            on_text: Optional callback; when given, the response is streamed
+                and each piece of raw text is passed to it as it arrives, with
+                None at the start of every attempt
+            
+        Returns:
+            Parsed response object, or {"error": ...} if the call failed
+        """
+        final_prompt = prompt_template.format(**prompt_data)
+        model_name = model_name or self.model_name
+        breaker = self._get_breaker(model_name)
+        
+        try:
+            for attempt in Retrying(**self._retry_options(deadline)):
+                with attempt:
+                    breaker.before_call()
+                    try:
+                        if on_text is None:
+                            raw_text = self.provider.generate(
+                                model_name, final_prompt, JSON_GENERATION_CONFIG,
+                                timeout=self._get_call_timeout(deadline)
+                            )
+                        else:
+                            raw_text = self._generate_streaming(
+                                model_name, final_prompt, self._get_call_timeout(deadline), on_text
+                            )
+                    except Exception as e:
+                        self._record_error(breaker, e)
+                        raise
+                    breaker.record_success()
+            return self._parse_ai_response(raw_text)
+        
+        except CircuitOpenError:
+            raise
         except Exception as e:
             print(f"AI API call failed: {e}")
-            return json.dumps({"error": f"AI API Error: {e}"})
+            return {"error": f"AI API Error: {e}"}
+    
+    def _generate_streaming(self, model_name: str, prompt: str, timeout: float,
+                            on_text: Callable[[Optional[str]], None]) -> str:
+        """
+        Stream one response, passing each piece to on_text
+        
+        Returns:
+            The complete raw response text, to be parsed and validated as usual
+        """
+        on_text(None)
+        pieces = []
+        for piece in self.provider.generate_stream(model_name, prompt, JSON_GENERATION_CONFIG, timeout=timeout):
+            pieces.append(piece)
+            on_text(piece)
+        return ''.join(pieces)
+    
+    def _record_error(self, breaker: CircuitBreaker, error: Exception) -> None:
+        """
+        Report a failed provider call to the model's circuit breaker
+        
+        Only transient errors count as failures; an error caused by the
+        request itself still means the upstream answered.
+        """
+        if self.provider.is_transient(error):
+            breaker.record_failure()
+        else:
+            breaker.record_success()
     
-    def _combine_results(self, scores: str, reports: str, refactor: str, original_code: str) -> Dict[str, Any]:
+    def _retry_options(self, deadline: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Retry policy for a single AI call
+        
+        Transient errors are retried with full-jitter exponential backoff, so
+        requests that failed together do not retry in lockstep. Retrying stops
+        once the attempts run out or the analysis deadline has passed, and
+        never retries a call the circuit breaker refused.
+        
+        Args:
+            deadline: Optional absolute time.monotonic() deadline for the analysis
+            
+        Returns:
+            Keyword arguments for tenacity's Retrying
+        """
+        stop = stop_after_attempt(config.AI_RETRY_ATTEMPTS)
+        if deadline is not None:
+            stop = stop | (lambda retry_state: time.monotonic() >= deadline)
+        
+        def should_retry(error: BaseException) -> bool:
+            return not isinstance(error, CircuitOpenError) and self.provider.is_transient(error)
+        
+        def log_retry(retry_state) -> None:
+            print(f"AI API call failed (attempt {retry_state.attempt_number}), retrying in "
+                  f"{retry_state.next_action.sleep:.1f}s: {retry_state.outcome.exception()}")
+        
+        return {
+            'stop': stop,
+            'wait': wait_random_exponential(multiplier=config.AI_RETRY_BASE_DELAY, max=config.AI_RETRY_MAX_DELAY),
+            'retry': retry_if_exception(should_retry),
+            'before_sleep': log_retry,
+            'reraise': True
+        }
+    
+    @staticmethod
+    def _get_call_timeout(deadline: Optional[float] = None) -> float:
+        """Per-call timeout, clipped to whatever remains of the analysis deadline"""
+        timeout = float(config.AI_REQUEST_TIMEOUT)
+        if deadline is not None:
+            timeout = min(timeout, max(1.0, deadline - time.monotonic()))
+        return timeout
+    
+    def _parse_ai_response(self, raw_text: str) -> Dict[str, Any]:
+        """
+        Parse the raw text returned by the model
+        
+        The response is parsed once here and passed on as an object; later
+        stages never re-serialize or re-parse it.
+        
+        Args:
+            raw_text: Model response text
+            
+        Returns:
+            Parsed response object
+            
+        Raises:
+            ValueError: If the response holds no JSON object
+        """
+        parsed = parse_model_json(raw_text)
+        if not isinstance(parsed, dict):
+            raise ValueError(f"Expected a JSON object, got {type(parsed).__name__}")
+        return parsed
+    
+    def _normalize_stage(self, stage: str, raw: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Reshape a single stage result into the flat shape used by the frontend
+        
+        Args:
+            stage: Stage name from ANALYSIS_STAGES
+            raw: Parsed response returned by _call_ai (not modified)
+            
+        Returns:
+            Flattened stage fields
+        """
+        data = dict(raw)
+        
+        if stage == 'reports':
+            # Flatten nested report structure, keeping any stage error visible
+            normalized = {}
+            if 'report' in data and isinstance(data['report'], dict):
+                normalized.update(data['report'])
+            if 'error' in data:
+                normalized['error'] = data['error']
+            data = normalized
+        
+        # Process project roadmap (convert string to array)
+        if 'project_roadmap' in data and isinstance(data['project_roadmap'], str):
+            data['project_roadmap'] = [
+                step.strip() for step in data['project_roadmap'].split('\n') 
+                if step.strip()
+            ]
+        
+        # Ensure explanation_summary exists (frontend compatibility)
+        if 'explanation' in data and 'explanation_summary' not in data:
+            data['explanation_summary'] = data.pop('explanation')
+        
+        return data
+    
+    def _combine_results(self, scores: Optional[Dict[str, Any]], reports: Optional[Dict[str, Any]],
+                         refactor: Optional[Dict[str, Any]], original_code: str) -> Dict[str, Any]:
         """
         Combine results from all AI analysis calls
         
         Args:
-            scores: JSON string with scores and explanations
-            reports: JSON string with detailed reports
-            refactor: JSON string with refactored code and roadmap
+            scores: Parsed response with scores and explanations, or None if not requested
+            reports: Parsed response with detailed reports, or None if not requested
+            refactor: Parsed response with refactored code and roadmap, or None if not requested
             original_code: Original code for comparison
             
         Returns:
-            Combined analysis results
+            Combined analysis results, with "stages" listing the stages that
+            completed without error
         """
         combined = {}
+        present = []
         
         try:
-            # Parse and merge scores
-            scores_data = json.loads(scores)
-            combined.update(scores_data)
-            
-            # Parse and merge reports (flatten nested structure)
-            reports_data = json.loads(reports)
-            if 'report' in reports_data and isinstance(reports_data['report'], dict):
-                combined.update(reports_data['report'])
-            
-            # Parse and merge refactor results
-            refactor_data = json.loads(refactor)
-            combined.update(refactor_data)
-            
-            # Process project roadmap (convert string to array)
-            if 'project_roadmap' in combined and isinstance(combined['project_roadmap'], str):
-                roadmap_steps = [
-                    step.strip() for step in combined['project_roadmap'].split('\n') 
-                    if step.strip()
-                ]
-                combined['project_roadmap'] = roadmap_steps
+            for stage, raw in zip(ANALYSIS_STAGES, (scores, reports, refactor)):
+                if raw is None:
+                    continue
+                combined.update(self._normalize_stage(stage, raw))
+                if 'error' not in raw:
+                    present.append(stage)
             
             # Add original code for comparison
             combined['original_code'] = original_code
-            
-            # Ensure explanation_summary exists (frontend compatibility)
-            if 'explanation' in combined and 'explanation_summary' not in combined:
-                combined['explanation_summary'] = combined.pop('explanation')
+            combined['stages'] = present
             
             return combined
             
-        except json.JSONDecodeError as e:
-            raise Exception(f"Failed to parse AI response: {e}")
         except Exception as e:
             raise Exception(f"Failed to combine AI results: {e}")
     
@@ -223,6 +1652,8 @@ Your output MUST be a JSON object with the following five keys:
 
 The CODE to analyze is provided below. Ensure your output is ONLY the raw JSON object.
 
+{static_metrics}
+
 ORIGINAL AI PROMPT: {prompt}
 CODE: {code}
 """
@@ -243,6 +1674,8 @@ Your output MUST be a JSON object with a single key, "report", which is an objec
 
 The CODE to analyze is provided below. Ensure your output is ONLY the raw JSON object.
 
+{static_metrics}
+
 CODE: {code}
 """
     
@@ -259,6 +1692,33 @@ Your output MUST be a JSON object with the following two keys:
 
 The CODE to analyze is provided below. Ensure your output is ONLY the raw JSON object.
 
+{static_metrics}
+
 ORIGINAL AI PROMPT: {prompt}
 CODE: {code}
-"""
\ No newline at end of file
+"""
+    
+    def _get_consolidated_prompt(self) -> str:
+        """Get the prompt template that requests scores, reports and refactor in one call"""
+        return """
+You are an expert team of Code Review specialists and a Software Architect. Your task is to analyze the provided AI-generated CODE based on the ORIGINAL AI PROMPT.
+
+{project_context}
+
+Your output MUST be a single JSON object with the following keys:
+1.  "total_score" (INTEGER out of 25)
+2.  "reliability_score" (INTEGER out of 10)
+3.  "mastery_score" (INTEGER out of 15)
+4.  "explanation_summary" (STRING, a high-level overview of the code's logic, data structures, and time complexity.)
+5.  "debug_prognosis" (STRING, the single most likely logic error or bug the user will face, why it fails, and the EXACT FIX.)
+6.  "report" (OBJECT with five STRING keys: "clarity" (variable naming, casing, readability), "modularity" (function breakdown and reusability), "efficiency" (algorithm choice and complexity), "security" (Security Analyst perspective), "documentation" (Documentation Specialist perspective).)
+7.  "refactored_code" (STRING, the complete, production-ready, refactored Python code that solves all major issues from the report, including security and file handling where applicable. The code MUST be ready to copy-paste.)
+8.  "project_roadmap" (STRING, a 3-5 step architectural plan for the developer to scale this code into a larger project, focusing on module separation, external configuration, and system initialization. Start with 'Your Architectural Next Steps:').
+
+The CODE to analyze is provided below. Ensure your output is ONLY the raw JSON object.
+
+{static_metrics}
+
+ORIGINAL AI PROMPT: {prompt}
+CODE: {code}
+"""
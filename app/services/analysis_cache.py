@@ -0,0 +1,312 @@
+"""
+Analysis Result Cache
+
+This module provides a content-addressed cache for combined AI analysis results.
+Entries live in an in-memory LRU tier with TTL expiry and can optionally be
+persisted to a disk tier so they survive process restarts; the disk tier is
+capped at a file count and pruned oldest first, sweeping expired files. Alias keys (e.g. a
+semantic fingerprint of the submission) point at entries from a separate
+bounded map, so they never take result slots.
+"""
+import copy
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+
+def make_cache_key(*parts: Any) -> str:
+    """
+    Build a stable content hash from the given key parts
+
+    Args:
+        parts: JSON-serializable values that identify an analysis
+
+    Returns:
+        Hex SHA-256 digest of the serialized parts
+    """
+    payload = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class AnalysisCache:
+    """Thread-safe LRU + TTL cache with an optional disk-backed tier"""
+
+    def __init__(self, max_entries: int = 512, ttl_seconds: int = 3600, disk_dir: Optional[str] = None,
+                 stale_seconds: int = 0, max_aliases: Optional[int] = None,
+                 max_disk_entries: Optional[int] = None):
+        self.max_entries = max(1, max_entries)
+        # Each entry has at most one alias worth keeping, so by default the
+        # alias map is as large as the entry map
+        self.max_aliases = max(1, max_aliases or self.max_entries)
+        self.ttl_seconds = ttl_seconds
+        # Expired entries are kept this much longer for get(allow_stale=True)
+        self.stale_seconds = max(0, stale_seconds)
+        self.disk_dir = disk_dir or None
+        # The disk tier outlives the process, so by default it may hold a few
+        # generations of the memory tier
+        self.max_disk_entries = max(1, max_disk_entries or self.max_entries * 4)
+        # Pruning goes down to this many files so it does not run on every write
+        self._disk_low_water = max(1, self.max_disk_entries * 9 // 10)
+        self._disk_files = 0
+        self._prune_lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple[float, Dict[str, Any]]]" = OrderedDict()
+        # alias key -> entry key
+        self._aliases: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.equivalent_hits = 0
+
+        if self.disk_dir:
+            try:
+                os.makedirs(self.disk_dir, exist_ok=True)
+            except OSError as e:
+                print(f"Analysis cache disk tier disabled: {e}")
+                self.disk_dir = None
+            else:
+                # Counts the files left by earlier runs and sweeps expired ones
+                self._prune_disk(self.max_disk_entries)
+
+    def get(self, key: str, allow_stale: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Look up a cached result
+
+        Args:
+            key: Cache key from make_cache_key
+            allow_stale: Also return entries that expired less than
+                stale_seconds ago (used when fresh results cannot be produced)
+
+        Returns:
+            Deep copy of the cached result, or None on miss/expiry
+        """
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now or (allow_stale and expires_at + self.stale_seconds > now):
+                    self._entries.move_to_end(key)
+                    self._count_hit(expires_at, now)
+                    return copy.deepcopy(value)
+                if expires_at + self.stale_seconds <= now:
+                    del self._entries[key]
+
+        entry = self._read_disk(key, now, allow_stale)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            self._store_memory(key, value, expires_at)
+            self._count_hit(expires_at, now)
+        return copy.deepcopy(value)
+
+    def _count_hit(self, expires_at: float, now: float) -> None:
+        """Update hit counters (lock must be held)"""
+        self.hits += 1
+        if expires_at <= now:
+            self.stale_hits += 1
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        """
+        Store a result in the memory tier and, if enabled, the disk tier
+
+        Args:
+            key: Cache key from make_cache_key
+            value: Combined analysis result
+        """
+        expires_at = time.time() + self.ttl_seconds
+        value = copy.deepcopy(value)
+
+        with self._lock:
+            self._store_memory(key, value, expires_at)
+
+        self._write_disk(key, value, expires_at)
+
+    def set_alias(self, alias_key: str, key: str) -> None:
+        """
+        Point an alias key at an entry, evicting the least recently used alias if full
+
+        Args:
+            alias_key: Alternative key for the same result
+            key: Cache key the result is stored under
+        """
+        with self._lock:
+            self._aliases[alias_key] = key
+            self._aliases.move_to_end(alias_key)
+            while len(self._aliases) > self.max_aliases:
+                self._aliases.popitem(last=False)
+
+    def get_alias(self, alias_key: str, allow_stale: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Look up a cached result through an alias key
+
+        Args:
+            alias_key: Key passed to set_alias
+            allow_stale: As for get
+
+        Returns:
+            Deep copy of the cached result the alias points at, or None
+        """
+        with self._lock:
+            key = self._aliases.get(alias_key)
+            if key is None:
+                return None
+            self._aliases.move_to_end(alias_key)
+
+        value = self.get(key, allow_stale)
+        with self._lock:
+            if value is None:
+                # The entry is gone, so the alias is useless
+                if self._aliases.get(alias_key) == key:
+                    del self._aliases[alias_key]
+            else:
+                self.equivalent_hits += 1
+        return value
+
+    def clear(self) -> None:
+        """Drop every entry and alias from the memory tier"""
+        with self._lock:
+            self._entries.clear()
+            self._aliases.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters for monitoring"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "aliases": len(self._aliases),
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "equivalent_hits": self.equivalent_hits,
+                "misses": self.misses,
+                "disk_tier": bool(self.disk_dir),
+                "disk_entries": self._disk_files,
+                "max_disk_entries": self.max_disk_entries
+            }
+
+    def _store_memory(self, key: str, value: Dict[str, Any], expires_at: float) -> None:
+        """Insert into the LRU tier, evicting the oldest entries (lock must be held)"""
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _read_disk(self, key: str, now: float, allow_stale: bool = False) -> Optional[tuple]:
+        """Load an unexpired (or, if allowed, stale) entry from the disk tier as (expires_at, value)"""
+        if not self.disk_dir:
+            return None
+
+        path = self._disk_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            print(f"Analysis cache read failed for {key}: {e}")
+            return None
+
+        expires_at = entry.get('expires_at', 0)
+        if expires_at + self.stale_seconds <= now:
+            self._remove_disk_file(path)
+            return None
+        if expires_at <= now and not allow_stale:
+            return None
+
+        value = entry.get('value')
+        return (expires_at, value) if value is not None else None
+
+    def _write_disk(self, key: str, value: Dict[str, Any], expires_at: float) -> None:
+        """Atomically persist an entry to the disk tier"""
+        if not self.disk_dir:
+            return
+
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        is_new = not os.path.exists(path)
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'expires_at': expires_at, 'value': value}, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"Analysis cache write failed for {key}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+
+        if is_new:
+            with self._lock:
+                self._disk_files += 1
+                over_limit = self._disk_files > self.max_disk_entries
+            if over_limit:
+                self._prune_disk(self._disk_low_water)
+
+    def _remove_disk_file(self, path: str) -> None:
+        """Delete a disk tier file and keep the file count in step"""
+        try:
+            os.remove(path)
+        except OSError:
+            return
+        with self._lock:
+            self._disk_files = max(0, self._disk_files - 1)
+
+    def _prune_disk(self, keep: int) -> None:
+        """
+        Remove expired disk tier files, then the oldest until at most keep remain
+
+        Expiry is judged from the file's modification time, which is when the
+        entry was written, so no file has to be opened.
+
+        Args:
+            keep: Number of files to leave in the disk tier
+        """
+        # Another thread is already pruning
+        if not self._prune_lock.acquire(blocking=False):
+            return
+
+        try:
+            now = time.time()
+            max_age = self.ttl_seconds + self.stale_seconds
+            files = []
+            expired = []
+            try:
+                with os.scandir(self.disk_dir) as entries:
+                    for entry in entries:
+                        if not entry.name.endswith('.json'):
+                            continue
+                        try:
+                            mtime = entry.stat().st_mtime
+                        except OSError:
+                            continue
+                        (expired if mtime + max_age <= now else files).append((mtime, entry.path))
+            except OSError as e:
+                print(f"Analysis cache prune failed: {e}")
+                return
+
+            files.sort()
+            doomed = expired + files[:max(0, len(files) - keep)]
+            removed = 0
+            for _, path in doomed:
+                try:
+                    os.remove(path)
+                    removed += 1
+                except OSError:
+                    pass
+
+            with self._lock:
+                self._disk_files = len(expired) + len(files) - removed
+        finally:
+            self._prune_lock.release()
@@ -0,0 +1,123 @@
+"""
+Circuit Breaker
+
+This module tracks the health of an upstream AI model and stops sending it
+requests after repeated transient failures. While the circuit is open, calls
+fail immediately; after a recovery timeout a few trial calls are let
+through, and their outcome decides whether the circuit closes again.
+"""
+import threading
+import time
+from typing import Any, Dict
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is refused because the model's circuit is open"""
+
+    def __init__(self, message: str, retry_after: float = 0.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Closed / open / half-open circuit breaker for one upstream model"""
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 30.0,
+                 half_open_max_calls: int = 1):
+        """
+        Args:
+            name: Upstream name, used in errors and logs
+            failure_threshold: Consecutive transient failures that open the circuit
+            recovery_timeout: Seconds the circuit stays open before allowing trial calls
+            half_open_max_calls: Trial calls allowed at once while half-open
+        """
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = max(1, half_open_max_calls)
+        self._lock = threading.Lock()
+        self._state = STATE_CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trials_in_flight = 0
+        self.times_opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        """Current state, moving open to half-open once the recovery timeout passes"""
+        with self._lock:
+            return self._current_state(time.monotonic())
+
+    def _current_state(self, now: float) -> str:
+        """State at time now (lock must be held)"""
+        if self._state == STATE_OPEN and now - self._opened_at >= self.recovery_timeout:
+            self._state = STATE_HALF_OPEN
+            self._trials_in_flight = 0
+        return self._state
+
+    def retry_after(self) -> float:
+        """Seconds until the circuit will let a trial call through"""
+        with self._lock:
+            if self._state != STATE_OPEN:
+                return 0.0
+            return max(0.0, self.recovery_timeout - (time.monotonic() - self._opened_at))
+
+    def before_call(self) -> None:
+        """
+        Reserve permission for one call
+
+        Raises:
+            CircuitOpenError: If the circuit is open, or half-open with all
+                of its trial calls already in flight
+        """
+        with self._lock:
+            now = time.monotonic()
+            state = self._current_state(now)
+            if state == STATE_CLOSED:
+                return
+            if state == STATE_HALF_OPEN and self._trials_in_flight < self.half_open_max_calls:
+                self._trials_in_flight += 1
+                return
+
+            self.rejected += 1
+            retry_after = max(0.0, self.recovery_timeout - (now - self._opened_at)) if state == STATE_OPEN else 1.0
+            raise CircuitOpenError(
+                f"Circuit for {self.name} is {state}; AI calls are paused",
+                retry_after=retry_after
+            )
+
+    def record_success(self) -> None:
+        """Record a call the upstream answered; closes a half-open circuit"""
+        with self._lock:
+            self._state = STATE_CLOSED
+            self._failures = 0
+            self._trials_in_flight = 0
+
+    def record_failure(self) -> None:
+        """Record a transient upstream failure; may open the circuit"""
+        with self._lock:
+            now = time.monotonic()
+            state = self._current_state(now)
+            self._failures += 1
+            if state == STATE_HALF_OPEN or self._failures >= self.failure_threshold:
+                if state != STATE_OPEN:
+                    self.times_opened += 1
+                    print(f"Circuit for {self.name} opened after {self._failures} failures")
+                self._state = STATE_OPEN
+                self._opened_at = now
+                self._trials_in_flight = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the breaker state for monitoring"""
+        with self._lock:
+            return {
+                "state": self._current_state(time.monotonic()),
+                "consecutive_failures": self._failures,
+                "times_opened": self.times_opened,
+                "rejected": self.rejected
+            }
@@ -0,0 +1,75 @@
+"""
+Request Hedging Policy
+
+This module tracks rolling per-stage AI call latency and decides when a slow
+call deserves a duplicate ("hedged") request. Hedges are capped to a fraction
+of total calls so they cannot amplify load during an upstream slowdown.
+"""
+import threading
+from collections import deque
+from typing import Any, Dict, Optional
+
+
+class HedgingPolicy:
+    """Rolling latency percentiles per stage plus a hedge-rate budget"""
+
+    def __init__(self, percentile: float = 0.95, max_rate: float = 0.1,
+                 min_samples: int = 20, window: int = 200):
+        self.percentile = min(max(percentile, 0.0), 1.0)
+        self.max_rate = max(0.0, max_rate)
+        self.min_samples = max(1, min_samples)
+        self._latencies: Dict[str, deque] = {}
+        self._window = window
+        # True for hedged calls, False for primary calls
+        self._calls: deque = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.hedges_fired = 0
+
+    def record_latency(self, stage: str, seconds: float) -> None:
+        """Record the duration of a successful call for a stage"""
+        with self._lock:
+            self._latencies.setdefault(stage, deque(maxlen=self._window)).append(seconds)
+
+    def record_call(self) -> None:
+        """Count a primary call toward the hedge-rate denominator"""
+        with self._lock:
+            self._calls.append(False)
+
+    def hedge_delay(self, stage: str) -> Optional[float]:
+        """
+        Get how long a stage call may run before it should be hedged
+
+        Args:
+            stage: Stage name
+
+        Returns:
+            Rolling percentile latency in seconds, or None without enough samples
+        """
+        with self._lock:
+            samples = self._latencies.get(stage)
+            if not samples or len(samples) < self.min_samples:
+                return None
+            ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile))]
+
+    def try_acquire_hedge(self) -> bool:
+        """Reserve a hedge if the recent hedge rate is below the cap"""
+        with self._lock:
+            hedges = sum(1 for hedged in self._calls if hedged)
+            if not self._calls or (hedges + 1) / (len(self._calls) + 1) > self.max_rate:
+                return False
+            self._calls.append(True)
+            self.hedges_fired += 1
+            return True
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the current hedge thresholds for monitoring"""
+        with self._lock:
+            stages = list(self._latencies)
+            hedges_fired = self.hedges_fired
+        delays = {}
+        for stage in stages:
+            delay = self.hedge_delay(stage)
+            delays[stage] = round(delay * 1000, 2) if delay is not None else None
+
+        return {"hedges_fired": hedges_fired, "hedge_delay_ms": delays}
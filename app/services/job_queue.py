@@ -0,0 +1,253 @@
+"""
+Durable Analysis Job Queue
+
+This module provides a SQLite-backed job queue with a small worker pool so
+long AI analyses can run outside the HTTP request. Jobs survive client
+disconnects and process restarts: a job whose worker died is picked up again
+once its lease expires, up to a maximum number of attempts.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple, Type
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_SUCCEEDED = 'succeeded'
+JOB_FAILED = 'failed'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS analysis_jobs (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    analysis_id TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    available_at REAL NOT NULL,
+    lease_expires_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_analysis_jobs_claim ON analysis_jobs (status, available_at);
+"""
+
+
+class AnalysisJobQueue:
+    """SQLite-backed job queue with lease-based crash recovery"""
+
+    def __init__(self, db_path: str, handler: Callable[[Dict[str, Any]], Tuple[Dict[str, Any], Optional[str]]],
+                 workers: int = 2, lease_seconds: float = 300, max_attempts: int = 3,
+                 retention_seconds: float = 86400, retry_on: Tuple[Type[BaseException], ...] = (),
+                 retry_delay: float = 5.0, poll_interval: float = 1.0):
+        """
+        Args:
+            db_path: SQLite database file, shared by every process using the queue
+            handler: Runs one job payload; returns (result, analysis_id)
+            workers: Number of worker threads in this process
+            lease_seconds: How long a claimed job may run before another worker may retake it
+            max_attempts: Attempts (including crash recoveries) before a job fails
+            retention_seconds: How long finished jobs are kept
+            retry_on: Exception types that requeue the job instead of failing it
+            retry_delay: Base delay before a retried job becomes available again
+            poll_interval: Idle worker polling interval in seconds
+        """
+        self.db_path = db_path
+        self.handler = handler
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max(1, max_attempts)
+        self.retention_seconds = retention_seconds
+        self.retry_on = retry_on
+        self.retry_delay = retry_delay
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._last_cleanup = 0.0
+
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(_SCHEMA)
+
+        self._workers = [
+            threading.Thread(target=self._work, name=f'analysis-job-worker_{index}', daemon=True)
+            for index in range(max(1, workers))
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Open an autocommit connection; sqlite3 connections are not shared between threads"""
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def enqueue(self, user_id: str, payload: Dict[str, Any]) -> str:
+        """
+        Add a job to the queue
+
+        Args:
+            user_id: Owner of the job
+            payload: JSON-serializable job input passed to the handler
+
+        Returns:
+            New job id
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT INTO analysis_jobs (id, user_id, status, payload, created_at, updated_at, available_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (job_id, user_id, JOB_QUEUED, json.dumps(payload, ensure_ascii=False), now, now, now)
+            )
+        self._wakeup.set()
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a job's status
+
+        Args:
+            job_id: Job id from enqueue
+
+        Returns:
+            Job dict (without its payload), or None if unknown or expired
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT id, user_id, status, result, error, analysis_id, attempts, created_at, updated_at '
+                'FROM analysis_jobs WHERE id = ?',
+                (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+
+        job = dict(row)
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def stats(self) -> Dict[str, int]:
+        """Return job counts by status"""
+        with self._connect() as conn:
+            rows = conn.execute('SELECT status, COUNT(*) FROM analysis_jobs GROUP BY status').fetchall()
+        return {status: count for status, count in rows}
+
+    def _claim(self) -> Optional[sqlite3.Row]:
+        """Atomically claim the oldest available job, recovering expired leases"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                # Jobs whose worker died mid-run and have no attempts left
+                conn.execute(
+                    'UPDATE analysis_jobs SET status = ?, error = ?, updated_at = ?, lease_expires_at = NULL '
+                    'WHERE status = ? AND lease_expires_at < ? AND attempts >= ?',
+                    (JOB_FAILED, 'Job abandoned after repeated worker failures', now,
+                     JOB_RUNNING, now, self.max_attempts)
+                )
+                row = conn.execute(
+                    'SELECT * FROM analysis_jobs '
+                    'WHERE (status = ? AND available_at <= ?) OR (status = ? AND lease_expires_at < ?) '
+                    'ORDER BY available_at LIMIT 1',
+                    (JOB_QUEUED, now, JOB_RUNNING, now)
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        'UPDATE analysis_jobs SET status = ?, attempts = attempts + 1, '
+                        'updated_at = ?, lease_expires_at = ? WHERE id = ?',
+                        (JOB_RUNNING, now, now + self.lease_seconds, row['id'])
+                    )
+                conn.execute('COMMIT')
+            except sqlite3.Error:
+                conn.execute('ROLLBACK')
+                raise
+        return row
+
+    def _finish(self, job_id: str, status: str, result: Optional[Dict[str, Any]] = None,
+                error: Optional[str] = None, analysis_id: Optional[str] = None) -> None:
+        """Record the outcome of a job"""
+        with self._connect() as conn:
+            conn.execute(
+                'UPDATE analysis_jobs SET status = ?, result = ?, error = ?, analysis_id = ?, '
+                'updated_at = ?, lease_expires_at = NULL WHERE id = ?',
+                (status, json.dumps(result, ensure_ascii=False) if result is not None else None,
+                 error, analysis_id, time.time(), job_id)
+            )
+
+    def _requeue(self, job_id: str, attempts: int, error: str) -> None:
+        """Put a job back in the queue after a retryable failure, with backoff"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                'UPDATE analysis_jobs SET status = ?, error = ?, updated_at = ?, available_at = ?, '
+                'lease_expires_at = NULL WHERE id = ?',
+                (JOB_QUEUED, error, now, now + self.retry_delay * attempts, job_id)
+            )
+
+    def _run(self, row: sqlite3.Row) -> None:
+        """Run one claimed job through the handler"""
+        job_id = row['id']
+        attempts = row['attempts'] + 1
+        try:
+            result, analysis_id = self.handler(json.loads(row['payload']))
+        except self.retry_on as e:
+            if attempts < self.max_attempts:
+                print(f"Analysis job {job_id} will retry (attempt {attempts}): {str(e)}")
+                self._requeue(job_id, attempts, str(e))
+                return
+            self._finish(job_id, JOB_FAILED, error=str(e))
+        except Exception as e:
+            print(f"Analysis job {job_id} failed: {str(e)}")
+            self._finish(job_id, JOB_FAILED, error=str(e))
+        else:
+            self._finish(job_id, JOB_SUCCEEDED, result=result, analysis_id=analysis_id)
+
+    def _cleanup(self) -> None:
+        """Delete finished jobs past the retention period, at most once a minute"""
+        now = time.time()
+        if now - self._last_cleanup < 60:
+            return
+        self._last_cleanup = now
+        with self._connect() as conn:
+            conn.execute(
+                'DELETE FROM analysis_jobs WHERE status IN (?, ?) AND updated_at < ?',
+                (JOB_SUCCEEDED, JOB_FAILED, now - self.retention_seconds)
+            )
+
+    def _work(self) -> None:
+        """Worker loop: claim and run jobs until stopped"""
+        while not self._stopping.is_set():
+            try:
+                self._cleanup()
+                row = self._claim()
+            except sqlite3.Error as e:
+                print(f"Analysis job queue error: {str(e)}")
+                row = None
+
+            if row is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            self._run(row)
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop the workers after their current job"""
+        self._stopping.set()
+        self._wakeup.set()
+        if wait:
+            for worker in self._workers:
+                worker.join()
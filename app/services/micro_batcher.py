@@ -0,0 +1,152 @@
+"""
+Cross-Request Micro-Batching
+
+This module holds small, compatible AI calls for a short window so several
+of them, possibly from different users, can be sent upstream as one
+request. Callers get a future per item right away; when a batch fills up or
+its window closes, it is handed over as a whole to be run (on the shared AI
+executor) and its results are split back onto the item futures.
+"""
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+
+class _Batch:
+    """Items collected under one key and the time their window closes"""
+    __slots__ = ('items', 'futures', 'closes_at')
+
+    def __init__(self, closes_at: float):
+        self.items: List[Any] = []
+        self.futures: List[Future] = []
+        self.closes_at = closes_at
+
+
+class MicroBatcher:
+    """Groups items by key into batches bounded by size and wait time"""
+
+    def __init__(self, dispatch: Callable[[Hashable, List[Any], Callable[[], List[bool]]], Future],
+                 max_batch_size: int = 8, window_seconds: float = 0.02):
+        """
+        Args:
+            dispatch: Starts running a batch for (key, items, start) and
+                returns a future for the list of per-item results, in item
+                order; may raise. The batch call must invoke start() when it
+                actually begins: that marks the item futures running and
+                returns which items are still wanted (False for cancelled ones)
+            max_batch_size: Items at which a batch is dispatched without waiting
+            window_seconds: Longest time the first item of a batch waits for company
+        """
+        self._dispatch = dispatch
+        self.max_batch_size = max(1, max_batch_size)
+        self.window_seconds = max(0.0, window_seconds)
+        self._open: Dict[Hashable, _Batch] = {}
+        self._lock = threading.Lock()
+        self._window_closed = threading.Condition(self._lock)
+        self.batches = 0
+        self.items = 0
+        self.largest = 0
+
+        self._flusher = threading.Thread(target=self._flush_expired, name='ai-micro-batcher', daemon=True)
+        self._flusher.start()
+
+    def submit(self, key: Hashable, item: Any) -> Future:
+        """
+        Add an item to the open batch for its key
+
+        Args:
+            key: Batch compatibility key; only items with equal keys are combined
+            item: Item passed to dispatch
+
+        Returns:
+            Future for the item's own result
+        """
+        future: Future = Future()
+        with self._lock:
+            batch = self._open.get(key)
+            if batch is None:
+                batch = self._open[key] = _Batch(time.monotonic() + self.window_seconds)
+                self._window_closed.notify()
+            batch.items.append(item)
+            batch.futures.append(future)
+            full = len(batch.items) >= self.max_batch_size
+            if full:
+                del self._open[key]
+
+        if full:
+            self._run(key, batch)
+        return future
+
+    def _flush_expired(self) -> None:
+        """Flusher loop: dispatch batches whose window has closed"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                expired = [key for key, batch in self._open.items() if batch.closes_at <= now]
+                if not expired:
+                    next_close = min((batch.closes_at for batch in self._open.values()), default=None)
+                    self._window_closed.wait(None if next_close is None else next_close - now)
+                    continue
+                batches = [(key, self._open.pop(key)) for key in expired]
+
+            for key, batch in batches:
+                self._run(key, batch)
+
+    def _run(self, key: Hashable, batch: _Batch) -> None:
+        """Dispatch a closed batch and route its results to the item futures"""
+        # Items whose caller already gave up (cancelled future) are left out;
+        # the rest stay pending, so they can still be cancelled while queued
+        live = [
+            (item, future) for item, future in zip(batch.items, batch.futures)
+            if not future.cancelled()
+        ]
+        if not live:
+            return
+        items = [item for item, _ in live]
+        futures = [future for _, future in live]
+        with self._lock:
+            self.batches += 1
+            self.items += len(items)
+            self.largest = max(self.largest, len(items))
+
+        def start() -> List[bool]:
+            wanted = []
+            for future in futures:
+                running = future.set_running_or_notify_cancel()
+                if running:
+                    future.started_at = time.monotonic()
+                wanted.append(running)
+            return wanted
+
+        try:
+            batch_future = self._dispatch(key, items, start)
+        except Exception as e:
+            for future in futures:
+                if not future.cancelled():
+                    future.set_exception(e)
+            return
+
+        def settle(done: Future) -> None:
+            error = done.exception() if not done.cancelled() else RuntimeError("Micro-batch was cancelled")
+            if error is not None:
+                for future in futures:
+                    if not future.cancelled():
+                        future.set_exception(error)
+                return
+            for future, result in zip(futures, done.result()):
+                if not future.cancelled():
+                    future.set_result(result)
+
+        batch_future.add_done_callback(settle)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return batching counters for monitoring"""
+        with self._lock:
+            return {
+                "open": len(self._open),
+                "batches": self.batches,
+                "items": self.items,
+                "largest": self.largest,
+                "avg_size": round(self.items / self.batches, 2) if self.batches else None
+            }
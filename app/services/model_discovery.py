@@ -0,0 +1,112 @@
+"""
+Model Discovery Cache
+
+This module persists the result of AI model discovery to a local file so
+worker processes can start without a network round trip. Stale entries are
+served immediately while a background thread refreshes them.
+"""
+import json
+import os
+import threading
+import time
+from typing import Callable, Optional
+
+FALLBACK_MODEL = 'models/gemini-pro'
+
+
+class ModelDiscoveryCache:
+    """File-backed, TTL-based cache for the discovered model name"""
+
+    def __init__(self, cache_file: str, ttl_seconds: int = 86400):
+        self.cache_file = cache_file
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def get_model(self, mode: str, discover: Callable[[], str]) -> str:
+        """
+        Resolve the model for a discovery mode, using the cache file when possible
+
+        Args:
+            mode: Discovery strategy name, part of the cache identity
+            discover: Callable performing the (network) discovery; may raise
+
+        Returns:
+            Model name, or FALLBACK_MODEL if discovery fails with no cached entry
+        """
+        entry = self._read(mode)
+
+        if entry is None:
+            # Cold cache: this is the only path that blocks on the network
+            return self._refresh(mode, discover) or FALLBACK_MODEL
+
+        if time.time() - entry['discovered_at'] > self.ttl_seconds:
+            self._refresh_in_background(mode, discover)
+
+        return entry['model']
+
+    def _refresh(self, mode: str, discover: Callable[[], str]) -> Optional[str]:
+        """Run discovery and persist the result"""
+        try:
+            model_name = discover()
+        except Exception as e:
+            print(f"Error discovering models: {e}")
+            return None
+
+        self._write(mode, model_name)
+        return model_name
+
+    def _refresh_in_background(self, mode: str, discover: Callable[[], str]) -> None:
+        """Start a single background refresh if one is not already running"""
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self._refresh(mode, discover)
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        threading.Thread(target=run, name='model-discovery-refresh', daemon=True).start()
+
+    def _read(self, mode: str) -> Optional[dict]:
+        """Load the cached entry for a mode, if present and well-formed"""
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                entry = json.load(f).get(mode)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, AttributeError) as e:
+            print(f"Ignoring unreadable model cache {self.cache_file}: {e}")
+            return None
+
+        if not isinstance(entry, dict) or not entry.get('model') or 'discovered_at' not in entry:
+            return None
+        return entry
+
+    def _write(self, mode: str, model_name: str) -> None:
+        """Atomically update the cache entry for a mode"""
+        with self._lock:
+            try:
+                try:
+                    with open(self.cache_file, 'r', encoding='utf-8') as f:
+                        data = json.load(f)
+                    if not isinstance(data, dict):
+                        data = {}
+                except (OSError, ValueError):
+                    data = {}
+
+                data[mode] = {'model': model_name, 'discovered_at': time.time()}
+
+                directory = os.path.dirname(self.cache_file)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                tmp_path = f"{self.cache_file}.{os.getpid()}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(data, f)
+                os.replace(tmp_path, self.cache_file)
+            except OSError as e:
+                print(f"Failed to write model cache {self.cache_file}: {e}")
@@ -0,0 +1,136 @@
+"""
+Adaptive Model Routing
+
+This module picks the model for each analysis call from the stage and the
+size of the submitted code: small inputs to light stages go to a fast model,
+everything else to a strong one. Observed per-model latency can override the
+size rule, and a model whose circuit is open is routed around.
+"""
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+
+class ModelRouter:
+    """Per-stage, per-input model selection with rolling latency feedback"""
+
+    def __init__(self, default_model: str, fast_model: str = '', strong_model: str = '',
+                 small_input_tokens: int = 1500, fast_stages: Iterable[str] = ('scores', 'reports'),
+                 latency_slack: float = 1.5, min_samples: int = 10, explore_every: int = 20,
+                 window: int = 100):
+        """
+        Args:
+            default_model: Model used when routing is not configured
+            fast_model: Model for light stages on small inputs; empty disables routing to it
+            strong_model: Model for everything else; empty means default_model
+            small_input_tokens: Largest code size, in estimated tokens, sent to the fast model
+            fast_stages: Stages eligible for the fast model
+            latency_slack: Factor by which the fast model's median latency for a
+                stage may exceed the strong model's before the strong model is used
+            min_samples: Latency samples per model and stage needed before comparing
+            explore_every: While a model is passed over for latency, every Nth
+                call still goes to it so its figures stay current
+            window: Latency samples kept per model and stage
+        """
+        self.default_model = default_model
+        self.fast_model = fast_model
+        self.strong_model = strong_model or default_model
+        self.small_input_tokens = small_input_tokens
+        self.fast_stages = frozenset(fast_stages)
+        self.latency_slack = max(1.0, latency_slack)
+        self.min_samples = max(1, min_samples)
+        self.explore_every = max(2, explore_every)
+        self._window = window
+        self._latencies: Dict[Tuple[str, str], deque] = {}
+        self._passed_over: Dict[str, int] = {}
+        self._routed: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        """Whether any call can go to a model other than the default"""
+        return bool(self.fast_model) or self.strong_model != self.default_model
+
+    def route(self, stage: str, input_tokens: int,
+              is_available: Optional[Callable[[str], bool]] = None) -> str:
+        """
+        Pick the model for one stage call
+
+        Args:
+            stage: Stage name; 'consolidated' calls include refactor and
+                are never fast-eligible unless listed in fast_stages
+            input_tokens: Estimated size of the submitted code
+            is_available: Optional check that a model's circuit is not open
+
+        Returns:
+            Model name
+        """
+        if not self.enabled:
+            return self.default_model
+
+        preferred, alternative = self.strong_model, self.fast_model
+        if self.fast_model and stage in self.fast_stages and input_tokens <= self.small_input_tokens:
+            preferred, alternative = self.fast_model, self.strong_model
+            if self._is_slower(preferred, alternative, stage) and not self._explore(stage):
+                preferred, alternative = alternative, preferred
+
+        model = preferred
+        # Answering from the other model beats failing fast on an open circuit
+        if is_available is not None and alternative and not is_available(preferred) and is_available(alternative):
+            model = alternative
+
+        with self._lock:
+            self._routed[model] = self._routed.get(model, 0) + 1
+        return model
+
+    def record_latency(self, model_name: str, stage: str, seconds: float) -> None:
+        """Record the duration of a successful call"""
+        with self._lock:
+            self._latencies.setdefault((model_name, stage), deque(maxlen=self._window)).append(seconds)
+
+    def signature(self) -> Any:
+        """
+        Identify the routing configuration for cache keys
+
+        Latency-driven choices are not part of it: both models answer the
+        same prompt, so a cached result stays valid whichever one served it.
+        """
+        if not self.enabled:
+            return self.default_model
+        return [self.default_model, self.fast_model, self.strong_model,
+                self.small_input_tokens, sorted(self.fast_stages)]
+
+    def _median(self, model_name: str, stage: str) -> Optional[float]:
+        """Rolling median latency of a model for a stage, or None without enough samples"""
+        with self._lock:
+            samples = self._latencies.get((model_name, stage))
+            if not samples or len(samples) < self.min_samples:
+                return None
+            ordered = sorted(samples)
+        return ordered[len(ordered) // 2]
+
+    def _is_slower(self, model_name: str, other: str, stage: str) -> bool:
+        """Whether model_name has been clearly slower than other for a stage"""
+        median, other_median = self._median(model_name, stage), self._median(other, stage)
+        if median is None or other_median is None:
+            return False
+        return median > other_median * self.latency_slack
+
+    def _explore(self, stage: str) -> bool:
+        """Let every Nth passed-over call through to refresh the slower model's figures"""
+        with self._lock:
+            count = self._passed_over.get(stage, 0) + 1
+            self._passed_over[stage] = count
+        return count % self.explore_every == 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Return routing counts and per-model median latency for monitoring"""
+        with self._lock:
+            routed = dict(self._routed)
+            keys = list(self._latencies)
+        medians = {}
+        for model_name, stage in keys:
+            median = self._median(model_name, stage)
+            medians.setdefault(model_name, {})[stage] = round(median * 1000, 2) if median is not None else None
+
+        return {"enabled": self.enabled, "routed": routed, "median_latency_ms": medians}
@@ -238,6 +238,120 @@ class PocketBaseService:
         except Exception as e:
             return {"status": "error", "error": str(e)}
     
+    def create_records(self, collection: str, records: List[Dict[str, Any]], token: str = None) -> List[Optional[str]]:
+        """
+        Create several records over the pooled session
+        
+        The PocketBase version this app targets has no batch API, so records
+        are created one request at a time; a failed record does not stop the
+        rest.
+        
+        Args:
+            collection: Collection name
+            records: Record bodies to create
+            token: Optional user auth token to create the records as
+            
+        Returns:
+            Created record ids in input order (None for records that failed)
+        """
+        ids = []
+        for record in records:
+            try:
+                ids.append(self.create_record(collection, record, token=token)["id"])
+            except Exception as e:
+                print(f"Failed to create {collection} record: {e}")
+                ids.append(None)
+        return ids
+    
+    def create_record(self, collection: str, data: Dict[str, Any], token: str = None) -> Dict[str, Any]:
+        """
+        Create a single record
+        
+        Args:
+            collection: Collection name
+            data: Record body
+            token: Optional user auth token to create the record as
+            
+        Returns:
+            Created record data
+            
+        Raises:
+            Exception: If the create fails
+        """
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        try:
+            response = self.session.post(
+                f"{self.base_url}/api/collections/{collection}/records",
+                json=data,
+                headers=headers
+            )
+        except Exception as e:
+            raise Exception(f"PocketBase error: {str(e)}")
+        
+        if response.status_code == 200:
+            return response.json()
+        raise Exception(f"PocketBase error: Failed to create {collection} record: {response.text}")
+    
+    def get_record(self, collection: str, record_id: str, token: str = None) -> Optional[Dict[str, Any]]:
+        """
+        Get a single record by ID
+        
+        Args:
+            collection: Collection name
+            record_id: Record ID
+            token: Optional user auth token to read the record as
+            
+        Returns:
+            Record data, or None if it does not exist (or is not visible to the token)
+            
+        Raises:
+            Exception: If PocketBase cannot be reached or returns another error
+        """
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        try:
+            response = self.session.get(
+                f"{self.base_url}/api/collections/{collection}/records/{record_id}",
+                headers=headers
+            )
+        except Exception as e:
+            raise Exception(f"PocketBase error: {str(e)}")
+        
+        if response.status_code == 200:
+            return response.json()
+        if response.status_code == 404:
+            return None
+        raise Exception(f"PocketBase error: Failed to get {collection} record: {response.text}")
+    
+    def update_record(self, collection: str, record_id: str, data: Dict[str, Any], token: str = None) -> Dict[str, Any]:
+        """
+        Update fields of a single record
+        
+        Args:
+            collection: Collection name
+            record_id: Record ID
+            data: Fields to change
+            token: Optional user auth token to update the record as
+            
+        Returns:
+            Updated record data
+            
+        Raises:
+            Exception: If the update fails
+        """
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        try:
+            response = self.session.patch(
+                f"{self.base_url}/api/collections/{collection}/records/{record_id}",
+                json=data,
+                headers=headers
+            )
+        except Exception as e:
+            raise Exception(f"PocketBase error: {str(e)}")
+        
+        if response.status_code == 200:
+            return response.json()
+        raise Exception(f"PocketBase error: Failed to update {collection} record: {response.text}")
+    
     # Authentication Methods
     
     def create_user(self, email: str, password: str, password_confirm: str, name: str = "") -> Dict[str, Any]:
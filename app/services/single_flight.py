@@ -0,0 +1,158 @@
+"""
+Single-Flight Request Coalescing
+
+This module lets concurrent callers asking for the same key share one
+computation: the first caller (the leader) runs it, and callers arriving
+while it is in flight wait for its result instead of starting their own.
+Threads and event-loop coroutines coalesce with each other, since the
+rendezvous is a concurrent.futures.Future.
+"""
+import asyncio
+import copy
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+
+class SingleFlightAbandonedError(Exception):
+    """Raised to waiters when the leader stopped without producing a result"""
+    pass
+
+
+class SingleFlight:
+    """Registry of in-flight computations keyed by request identity"""
+
+    def __init__(self):
+        # key -> [future, number of waiters]
+        self._calls: Dict[str, list] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+
+    def join(self, key: str) -> Tuple[Future, bool]:
+        """
+        Join the computation for a key, becoming its leader if none is running
+
+        Args:
+            key: Request identity (e.g. the analysis cache key)
+
+        Returns:
+            Tuple of (future, is_leader); a leader must call complete()
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call[1] += 1
+                self.coalesced += 1
+                return call[0], False
+            future: Future = Future()
+            self._calls[key] = [future, 0]
+            self.leaders += 1
+            return future, True
+
+    def complete(self, key: str, future: Future, result: Any = None,
+                 error: Optional[BaseException] = None) -> None:
+        """
+        Publish the leader's outcome to every waiter and retire the key
+
+        Args:
+            key: Key passed to join
+            future: Future returned by join
+            result: Result to share (waiters receive deep copies)
+            error: Exception to raise in waiters instead
+        """
+        with self._lock:
+            _, waiters = self._calls.pop(key, (None, 0))
+        if error is not None:
+            if not isinstance(error, Exception):
+                # Cancellation or generator close of the leader
+                error = SingleFlightAbandonedError("The request running this analysis was cancelled")
+            future.set_exception(error)
+        elif waiters:
+            # Snapshot so the leader may keep mutating its own copy
+            future.set_result(copy.deepcopy(result))
+        else:
+            future.set_result(None)
+
+    @staticmethod
+    def wait(future: Future, timeout: Optional[float] = None) -> Any:
+        """
+        Wait for a leader's result
+
+        Raises:
+            TimeoutError: If no result arrives within timeout
+        """
+        return copy.deepcopy(future.result(timeout=timeout))
+
+    @staticmethod
+    async def wait_async(future: Future, timeout: Optional[float] = None) -> Any:
+        """
+        Await a leader's result without blocking the event loop
+
+        Raises:
+            TimeoutError: If no result arrives within timeout
+        """
+        # Shielded so a cancelled waiter does not cancel the shared future
+        try:
+            result = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"Coalesced analysis did not finish within {timeout}s")
+        return copy.deepcopy(result)
+
+    def do(self, key: str, fn: Callable[[], Any], timeout: Optional[float] = None) -> Tuple[Any, bool]:
+        """
+        Run fn once for all concurrent callers with the same key
+
+        Args:
+            key: Request identity
+            fn: Computation to run if this caller leads
+            timeout: Maximum time a waiter blocks for the leader's result
+
+        Returns:
+            Tuple of (result, shared); shared is True for waiters
+        """
+        while True:
+            future, leader = self.join(key)
+            if leader:
+                break
+            try:
+                return self.wait(future, timeout), True
+            except SingleFlightAbandonedError:
+                continue  # The leader went away; run it ourselves (or join a new leader)
+
+        try:
+            result = fn()
+        except BaseException as e:
+            self.complete(key, future, error=e)
+            raise
+        self.complete(key, future, result)
+        return result, False
+
+    async def do_async(self, key: str, fn: Callable[[], Awaitable[Any]],
+                       timeout: Optional[float] = None) -> Tuple[Any, bool]:
+        """Async variant of do; fn returns the awaitable to run if this caller leads"""
+        while True:
+            future, leader = self.join(key)
+            if leader:
+                break
+            try:
+                return await self.wait_async(future, timeout), True
+            except SingleFlightAbandonedError:
+                continue
+
+        try:
+            result = await fn()
+        except BaseException as e:
+            self.complete(key, future, error=e)
+            raise
+        self.complete(key, future, result)
+        return result, False
+
+    def stats(self) -> Dict[str, int]:
+        """Return coalescing counters for monitoring"""
+        with self._lock:
+            return {
+                "in_flight": len(self._calls),
+                "leaders": self.leaders,
+                "coalesced": self.coalesced
+            }
@@ -0,0 +1,161 @@
+"""
+Code Chunking Utilities
+
+This module splits large Python files at top-level function/class boundaries
+so each piece can be analyzed independently and the results merged, and
+fingerprints top-level units so unchanged ones can be recognized on resubmission.
+"""
+import ast
+import hashlib
+from dataclasses import dataclass
+from typing import List, Optional
+
+from app.utils.code_minifier import parse_code
+
+
+@dataclass
+class CodeChunk:
+    """A contiguous slice of a source file"""
+    start_line: int
+    end_line: int
+    code: str
+    name: str = ''
+    fingerprint: str = ''
+
+    @property
+    def label(self) -> str:
+        """Human-readable name and line range, used when merging chunk reports"""
+        if self.name:
+            return f"{self.name} (lines {self.start_line}-{self.end_line})"
+        return f"Lines {self.start_line}-{self.end_line}"
+
+
+def split_code_into_chunks(code: str, max_chars: int, tree: Optional[ast.Module] = None) -> List[CodeChunk]:
+    """
+    Split code into chunks of at most max_chars at top-level definition boundaries
+
+    Top-level imports are prepended to every chunk after the first so each
+    chunk still shows which names are in scope. A single definition larger
+    than max_chars becomes its own oversized chunk. Code that does not parse
+    is split on line boundaries instead.
+
+    Args:
+        code: Python source
+        max_chars: Target maximum characters per chunk
+        tree: Optional pre-parsed AST of code
+
+    Returns:
+        List of chunks in source order
+    """
+    lines = code.splitlines()
+    if len(code) <= max_chars or not lines:
+        return [CodeChunk(1, max(1, len(lines)), code)]
+
+    tree = tree or parse_code(code)
+    if tree is None or not tree.body:
+        boundaries = list(range(len(lines)))
+        header = ''
+    else:
+        boundaries = [_node_start(node) - 1 for node in tree.body]
+        boundaries[0] = 0
+        header = '\n'.join(
+            ast.get_source_segment(code, node) or ''
+            for node in tree.body
+            if isinstance(node, (ast.Import, ast.ImportFrom))
+        )
+
+    # Segments run from one top-level statement to the next
+    segments = [
+        (start, end)
+        for start, end in zip(boundaries, boundaries[1:] + [len(lines)])
+        if end > start
+    ]
+
+    chunks = []
+    chunk_start, chunk_end, size = None, None, 0
+    for start, end in segments:
+        segment_size = sum(len(line) + 1 for line in lines[start:end])
+        if chunk_start is not None and size + segment_size > max_chars:
+            chunks.append(_make_chunk(lines, chunk_start, chunk_end, header if chunks else ''))
+            chunk_start, size = None, 0
+        if chunk_start is None:
+            chunk_start = start
+        chunk_end = end
+        size += segment_size
+
+    if chunk_start is not None:
+        chunks.append(_make_chunk(lines, chunk_start, chunk_end, header if chunks else ''))
+
+    return chunks
+
+
+def split_code_into_units(code: str, tree: Optional[ast.Module] = None) -> List[CodeChunk]:
+    """
+    Split code into top-level units with normalized AST fingerprints
+
+    Each top-level function or class is one unit; all remaining module-level
+    statements form a single "<module>" unit. Fingerprints hash the AST dump,
+    so whitespace, comment and line-number changes do not alter them. Function
+    and class units carry the module's imports as a header for context, which
+    is part of their fingerprint since it is part of the code analyzed.
+
+    Args:
+        code: Python source
+        tree: Optional pre-parsed AST of code
+
+    Returns:
+        Units in source order (module unit first), or [] if the code does not parse
+    """
+    tree = tree or parse_code(code)
+    if tree is None or not tree.body:
+        return []
+
+    lines = code.splitlines()
+    definitions = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+    module_nodes = [node for node in tree.body if not isinstance(node, definitions)]
+    import_nodes = [node for node in module_nodes if isinstance(node, (ast.Import, ast.ImportFrom))]
+    header = '\n'.join('\n'.join(lines[node.lineno - 1:node.end_lineno]) for node in import_nodes)
+
+    units = []
+    if module_nodes:
+        units.append(CodeChunk(
+            start_line=module_nodes[0].lineno,
+            end_line=module_nodes[-1].end_lineno,
+            code='\n'.join('\n'.join(lines[node.lineno - 1:node.end_lineno]) for node in module_nodes),
+            name='<module>',
+            fingerprint=_fingerprint(module_nodes)
+        ))
+
+    for node in tree.body:
+        if not isinstance(node, definitions):
+            continue
+        start = _node_start(node)
+        body = '\n'.join(lines[start - 1:node.end_lineno])
+        units.append(CodeChunk(
+            start_line=start,
+            end_line=node.end_lineno,
+            code=f"{header}\n\n{body}" if header else body,
+            name=node.name,
+            fingerprint=_fingerprint(import_nodes + [node])
+        ))
+
+    return units
+
+
+def _fingerprint(nodes: List[ast.stmt]) -> str:
+    """Hash of the position-free AST dump of some statements"""
+    dump = '\n'.join(ast.dump(node) for node in nodes)
+    return hashlib.sha256(dump.encode('utf-8')).hexdigest()
+
+
+def _node_start(node: ast.stmt) -> int:
+    """First line of a top-level statement, including decorators"""
+    decorators = getattr(node, 'decorator_list', [])
+    return min([node.lineno] + [d.lineno for d in decorators])
+
+
+def _make_chunk(lines: List[str], start: int, end: int, header: str) -> CodeChunk:
+    """Build a chunk from a 0-based, end-exclusive line range"""
+    body = '\n'.join(lines[start:end])
+    code = f"{header}\n\n{body}" if header else body
+    return CodeChunk(start + 1, end, code)
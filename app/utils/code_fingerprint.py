@@ -0,0 +1,145 @@
+"""
+Semantic Code Fingerprinting
+
+This module reduces Python source to a canonical form, so that submissions
+differing only in whitespace, comments, docstrings, quote style or
+(optionally) local variable names get the same fingerprint. The fingerprint
+is used as an alternate analysis cache key.
+"""
+import ast
+import hashlib
+from typing import Dict, List, Optional, Set, Tuple
+
+from app.utils.code_minifier import _is_docstring, parse_code
+
+_SCOPE_NODES = (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda, ast.ClassDef)
+
+
+def semantic_fingerprint(code: str, rename_locals: bool = False) -> Optional[str]:
+    """
+    Compute a fingerprint of code that ignores formatting and documentation
+
+    Args:
+        code: Python source
+        rename_locals: Also rename function-local variables to positional
+            placeholders, so consistently renamed locals match
+
+    Returns:
+        Hex digest of the canonical AST, or None if the code does not parse
+    """
+    # Parsed here rather than shared, since canonicalization rewrites the tree
+    tree = parse_code(code)
+    if tree is None:
+        return None
+
+    _strip_docstrings(tree)
+    if rename_locals:
+        tree = _LocalRenamer().visit(tree)
+
+    return hashlib.sha256(ast.dump(tree).encode('utf-8')).hexdigest()
+
+
+def _strip_docstrings(tree: ast.Module) -> None:
+    """Remove docstrings from the module, classes and functions in place"""
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Module, ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+            if node.body and _is_docstring(node.body[0]):
+                node.body = node.body[1:]
+
+
+class _LocalRenamer(ast.NodeTransformer):
+    """
+    Rename variables assigned inside functions to placeholders numbered by first use
+
+    Parameters keep their names since callers may pass them by keyword;
+    nested function and class names, and names declared global, are left
+    alone too. Placeholders contain a character that cannot appear in an
+    identifier, so they never collide with real names.
+    """
+
+    def __init__(self):
+        self._mapping: Dict[str, str] = {}
+        self._depth = 0
+
+    def visit_FunctionDef(self, node: ast.AST) -> ast.AST:
+        return self._visit_scope(node, node.args, node.body)
+
+    def visit_AsyncFunctionDef(self, node: ast.AST) -> ast.AST:
+        return self._visit_scope(node, node.args, node.body)
+
+    def visit_Lambda(self, node: ast.Lambda) -> ast.AST:
+        return self._visit_scope(node, node.args, [node.body])
+
+    def visit_ClassDef(self, node: ast.ClassDef) -> ast.AST:
+        # Class attributes are not locals; methods open their own scopes
+        outer, self._mapping = self._mapping, {}
+        self.generic_visit(node)
+        self._mapping = outer
+        return node
+
+    def visit_Name(self, node: ast.Name) -> ast.AST:
+        node.id = self._mapping.get(node.id, node.id)
+        return node
+
+    def visit_Nonlocal(self, node: ast.Nonlocal) -> ast.AST:
+        node.names = [self._mapping.get(name, name) for name in node.names]
+        return node
+
+    def visit_ExceptHandler(self, node: ast.ExceptHandler) -> ast.AST:
+        if node.name:
+            node.name = self._mapping.get(node.name, node.name)
+        self.generic_visit(node)
+        return node
+
+    def _visit_scope(self, node: ast.AST, args: ast.arguments, body: list) -> ast.AST:
+        """Rename the locals of one function scope, inheriting enclosing renames"""
+        params = {arg.arg for arg in ast.walk(args) if isinstance(arg, ast.arg)}
+        assigned, global_names = _scope_names(body)
+        local_names = [name for name in assigned if name not in params]
+
+        outer = self._mapping
+        self._depth += 1
+        # Parameters and globals shadow enclosing renames; new locals get fresh placeholders
+        self._mapping = {
+            name: renamed for name, renamed in outer.items()
+            if name not in params and name not in global_names
+        }
+        for index, name in enumerate(local_names):
+            self._mapping[name] = f"{self._depth}.{index}"
+
+        self.generic_visit(node)
+
+        self._depth -= 1
+        self._mapping = outer
+        return node
+
+
+def _scope_names(body: list) -> Tuple[List[str], Set[str]]:
+    """
+    Collect the names a function body binds, without entering nested scopes
+
+    Returns:
+        (local names in first-binding order, names declared global)
+    """
+    global_names: Set[str] = set()
+    nonlocal_names: Set[str] = set()
+    names: Dict[str, None] = {}
+
+    stack = list(reversed(body))
+    while stack:
+        node = stack.pop()
+        if isinstance(node, ast.Global):
+            global_names.update(node.names)
+        elif isinstance(node, ast.Nonlocal):
+            nonlocal_names.update(node.names)
+        elif isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+            names.setdefault(node.id, None)
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            names.setdefault(node.name, None)
+
+        # Nested functions, lambdas and classes are separate scopes
+        if not isinstance(node, _SCOPE_NODES):
+            stack.extend(reversed(list(ast.iter_child_nodes(node))))
+
+    declared = global_names | nonlocal_names
+    return [name for name in names if name not in declared], global_names
@@ -0,0 +1,307 @@
+"""
+Static Code Metrics
+
+This module computes cheap, local quality metrics for Python code from its
+AST: cyclomatic complexity, nesting depth, function length, duplicate
+blocks, naming-convention violations and dangerous-pattern hits. They serve
+the quick analysis mode directly and are fed into the AI prompts as
+pre-computed facts.
+"""
+import ast
+import re
+from typing import Any, Dict, List, Optional
+
+from app.utils.code_minifier import parse_code
+from app.utils.validation import DANGEROUS_CODE_PATTERNS
+
+# Thresholds above which a metric is reported as a finding
+COMPLEXITY_THRESHOLD = 10
+NESTING_THRESHOLD = 4
+FUNCTION_LENGTH_THRESHOLD = 50
+# Minimum size of a repeated block, in non-blank lines and characters
+DUPLICATE_BLOCK_LINES = 4
+DUPLICATE_BLOCK_MIN_CHARS = 60
+MAX_FINDINGS = 12
+
+SNAKE_CASE = re.compile(r'^_{0,2}[a-z][a-z0-9_]*$|^__[a-z][a-z0-9_]*__$|^_$')
+UPPER_CASE = re.compile(r'^_?[A-Z][A-Z0-9_]*$')
+CAP_WORDS = re.compile(r'^_?[A-Z][a-zA-Z0-9]*$')
+
+# One alternation of the validation patterns, anchored at word boundaries so
+# e.g. load_file( or import osmium do not match
+_DANGEROUS_PATTERN = re.compile(r'\b(?:' + '|'.join(
+    pattern + (r'\b' if pattern[-1].isalnum() else '')
+    for pattern in DANGEROUS_CODE_PATTERNS
+) + ')', re.IGNORECASE)
+
+# Node types are matched with set lookups; this runs on every node of the tree
+_FUNCTION_TYPES = {ast.FunctionDef, ast.AsyncFunctionDef}
+_BLOCK_TYPES = {
+    ast.If, ast.For, ast.AsyncFor, ast.While, ast.With, ast.AsyncWith, ast.Try,
+    getattr(ast, 'Match', ast.Try), getattr(ast, 'TryStar', ast.Try)
+}
+_BRANCH_TYPES = {
+    ast.If, ast.For, ast.AsyncFor, ast.While, ast.IfExp, ast.ExceptHandler,
+    getattr(ast, 'match_case', ast.If)
+}
+_CONTEXT_TYPES = {ast.Load, ast.Store, ast.Del}
+
+
+def compute_code_metrics(code: str, tree: Optional[ast.Module] = None) -> Dict[str, Any]:
+    """
+    Compute static metrics for a code submission
+
+    Args:
+        code: Python source
+        tree: Optional pre-parsed AST of code
+
+    Returns:
+        Metrics dict; AST-based metrics are omitted when the code does not
+        parse, but line counts, duplicates and dangerous patterns are always
+        present
+    """
+    lines = code.splitlines()
+    metrics: Dict[str, Any] = {
+        'parsed': False,
+        'lines': len(lines),
+        'code_lines': sum(1 for line in lines if line.strip() and not line.lstrip().startswith('#')),
+        'duplicate_blocks': _find_duplicate_blocks(lines),
+        'dangerous_patterns': find_dangerous_patterns(code)
+    }
+
+    tree = tree or parse_code(code)
+    if tree is not None:
+        collector = _MetricsCollector()
+        collector.visit_body(tree.body, function=None, depth=0, module_level=True)
+        functions = sorted(collector.functions, key=lambda function: function['lineno'])
+        complexities = [function['complexity'] for function in functions]
+        metrics.update({
+            'parsed': True,
+            'functions': functions,
+            'classes': collector.classes,
+            'max_complexity': max(complexities, default=0),
+            'average_complexity': round(sum(complexities) / len(complexities), 1) if complexities else 0,
+            'max_nesting': collector.max_nesting,
+            'longest_function': max((function['length'] for function in functions), default=0),
+            'naming_violations': sorted(collector.naming_violations, key=lambda violation: violation['line'])
+        })
+
+    metrics['findings'] = _summarize_findings(metrics)
+    return metrics
+
+
+def format_metrics_for_prompt(metrics: Dict[str, Any]) -> str:
+    """
+    Render metrics as a compact block of facts for the AI prompts
+
+    Args:
+        metrics: Result of compute_code_metrics
+
+    Returns:
+        Prompt text
+    """
+    facts = [f"- Code lines: {metrics['code_lines']}"]
+    if metrics['parsed']:
+        facts[0] += (
+            f"; functions: {len(metrics['functions'])}; classes: {metrics['classes']}; "
+            f"max cyclomatic complexity: {metrics['max_complexity']}; max nesting depth: {metrics['max_nesting']}; "
+            f"longest function: {metrics['longest_function']} lines"
+        )
+    else:
+        facts[0] += "; the code does not parse as Python"
+    facts.extend(f"- {finding}" for finding in metrics['findings'])
+
+    return (
+        "STATIC METRICS (measured by a local analyzer; treat these as facts and do not contradict them):\n"
+        + '\n'.join(facts)
+    )
+
+
+def find_dangerous_patterns(code: str) -> List[Dict[str, Any]]:
+    """
+    Locate dangerous-pattern hits (the same patterns input validation warns about)
+
+    Args:
+        code: Source text
+
+    Returns:
+        List of {"pattern", "line"} hits in source order
+    """
+    return [
+        {'pattern': match.group(0), 'line': code.count('\n', 0, match.start()) + 1}
+        for match in _DANGEROUS_PATTERN.finditer(code)
+    ]
+
+
+class _MetricsCollector:
+    """
+    Single-pass AST traversal collecting per-function and naming metrics
+
+    Nesting counts control-flow blocks (an elif chain is one level), and
+    nested functions and classes start a fresh count of their own.
+    """
+
+    def __init__(self):
+        self.functions: List[Dict[str, Any]] = []
+        self.classes = 0
+        self.max_nesting = 0
+        self.naming_violations: List[Dict[str, Any]] = []
+        self._reported = set()
+
+    def visit_body(self, body: List[ast.AST], function: Optional[Dict[str, Any]], depth: int,
+                   module_level: bool = False) -> None:
+        for node in body:
+            self.visit(node, function, depth, module_level)
+
+    def visit(self, node: ast.AST, function: Optional[Dict[str, Any]], depth: int,
+              module_level: bool = False) -> None:
+        node_type = type(node)
+
+        if node_type is ast.Name:
+            # Module-level names may also be UPPER_CASE constants
+            if type(node.ctx) is ast.Store and not (module_level and UPPER_CASE.match(node.id)):
+                self._check_name(node.id, 'variable', node.lineno)
+            return
+
+        if node_type in _FUNCTION_TYPES:
+            self._visit_function(node, function, depth)
+            return
+
+        if node_type is ast.ClassDef:
+            self.classes += 1
+            self._check_name(node.name, 'class', node.lineno, 'CapWords')
+            self.visit_body(node.decorator_list + node.bases, function, depth)
+            self.visit_body(node.body, None, 0)
+            return
+
+        if function is not None:
+            if node_type in _BRANCH_TYPES:
+                function['complexity'] += 1
+            elif node_type is ast.BoolOp:
+                function['complexity'] += len(node.values) - 1
+            elif node_type is ast.comprehension:
+                function['complexity'] += 1 + len(node.ifs)
+
+        elif_node = None
+        if node_type in _BLOCK_TYPES:
+            depth += 1
+            self.max_nesting = max(self.max_nesting, depth)
+            if function is not None:
+                function['max_nesting'] = max(function['max_nesting'], depth)
+            # An elif is written at the same level as its if
+            if node_type is ast.If and len(node.orelse) == 1 and type(node.orelse[0]) is ast.If:
+                elif_node = node.orelse[0]
+
+        for field in node._fields:
+            value = getattr(node, field, None)
+            if type(value) is list:
+                for child in value:
+                    if isinstance(child, ast.AST):
+                        self.visit(child, function, depth - 1 if child is elif_node else depth, module_level)
+            elif isinstance(value, ast.AST) and type(value) not in _CONTEXT_TYPES:
+                self.visit(value, function, depth, module_level)
+
+    def _visit_function(self, node: ast.AST, function: Optional[Dict[str, Any]], depth: int) -> None:
+        """Record one function and visit its body as a fresh scope"""
+        arguments = node.args
+        self._check_name(node.name, 'function', node.lineno)
+        for arg in arguments.posonlyargs + arguments.args + arguments.kwonlyargs:
+            self._check_name(arg.arg, 'argument', arg.lineno)
+        for arg in (arguments.vararg, arguments.kwarg):
+            if arg is not None:
+                self._check_name(arg.arg, 'argument', arg.lineno)
+
+        record = {
+            'name': node.name,
+            'lineno': node.lineno,
+            'length': node.end_lineno - node.lineno + 1,
+            'complexity': 1,
+            'max_nesting': 0
+        }
+        self.functions.append(record)
+        self.visit_body(node.decorator_list, function, depth)
+        self.visit_body(node.body, record, 0)
+
+    def _check_name(self, name: str, kind: str, lineno: int, expected: str = 'snake_case') -> None:
+        """Record a naming violation once per (name, kind)"""
+        pattern = CAP_WORDS if expected == 'CapWords' else SNAKE_CASE
+        if pattern.match(name) or (name, kind) in self._reported:
+            return
+        self._reported.add((name, kind))
+        self.naming_violations.append({'name': name, 'kind': kind, 'line': lineno, 'expected': expected})
+
+
+def _find_duplicate_blocks(lines: List[str]) -> List[Dict[str, Any]]:
+    """
+    Find repeated runs of at least DUPLICATE_BLOCK_LINES non-blank lines
+
+    Lines are compared with surrounding whitespace and comment-only lines
+    removed; overlapping matches are merged into one block.
+    """
+    significant = [
+        (number, line.strip()) for number, line in enumerate(lines, start=1)
+        if line.strip() and not line.lstrip().startswith('#')
+    ]
+
+    first_seen: Dict[str, int] = {}
+    blocks: List[Dict[str, Any]] = []
+    last = None
+    for index in range(len(significant) - DUPLICATE_BLOCK_LINES + 1):
+        window = [text for _, text in significant[index:index + DUPLICATE_BLOCK_LINES]]
+        if sum(len(text) for text in window) < DUPLICATE_BLOCK_MIN_CHARS:
+            continue
+        original = first_seen.setdefault('\n'.join(window), index)
+        if original == index or index - original < DUPLICATE_BLOCK_LINES:
+            continue
+
+        # Extend the previous block when this window continues it
+        if last is not None and last['index'] + 1 == index and last['original'] + 1 == original:
+            last['index'], last['original'] = index, original
+            last['block']['length'] += 1
+            continue
+        block = {
+            'lines': [significant[original][0], significant[index][0]],
+            'length': DUPLICATE_BLOCK_LINES
+        }
+        blocks.append(block)
+        last = {'index': index, 'original': original, 'block': block}
+
+    return blocks
+
+
+def _summarize_findings(metrics: Dict[str, Any]) -> List[str]:
+    """Human-readable findings for the metrics that cross their thresholds"""
+    findings = []
+
+    for function in metrics.get('functions', []):
+        if function['complexity'] > COMPLEXITY_THRESHOLD:
+            findings.append(
+                f"{function['name']} (line {function['lineno']}) has cyclomatic complexity "
+                f"{function['complexity']} (threshold {COMPLEXITY_THRESHOLD})"
+            )
+        if function['max_nesting'] > NESTING_THRESHOLD:
+            findings.append(
+                f"{function['name']} (line {function['lineno']}) nests blocks {function['max_nesting']} deep "
+                f"(threshold {NESTING_THRESHOLD})"
+            )
+        if function['length'] > FUNCTION_LENGTH_THRESHOLD:
+            findings.append(
+                f"{function['name']} (line {function['lineno']}) is {function['length']} lines long "
+                f"(threshold {FUNCTION_LENGTH_THRESHOLD})"
+            )
+
+    for block in metrics['duplicate_blocks']:
+        findings.append(
+            f"{block['length']} lines starting at line {block['lines'][1]} duplicate line {block['lines'][0]}"
+        )
+
+    violations = metrics.get('naming_violations', [])
+    if violations:
+        names = ', '.join(f"{violation['name']} ({violation['kind']})" for violation in violations[:5])
+        more = f" and {len(violations) - 5} more" if len(violations) > 5 else ''
+        findings.append(f"Names not following PEP 8: {names}{more}")
+
+    for hit in metrics['dangerous_patterns']:
+        findings.append(f"Potentially dangerous call or import '{hit['pattern']}' at line {hit['line']}")
+
+    return findings[:MAX_FINDINGS]
@@ -0,0 +1,163 @@
+"""
+Code Minification and Token Budgeting Utilities
+
+This module produces token-lean forms of submitted code before it is embedded
+in AI prompts, and provides a cheap pre-flight token estimate so oversized
+inputs can be routed or rejected before spending an API call.
+"""
+import ast
+import io
+import tokenize
+from typing import Optional
+
+# Average characters per token for code-heavy prompts (Gemini tokenizer ballpark)
+CHARS_PER_TOKEN = 4
+
+
+class TokenBudgetExceededError(Exception):
+    """Raised when a prompt would exceed the configured input token budget"""
+    pass
+
+
+def parse_code(code: str) -> Optional[ast.Module]:
+    """
+    Parse code into an AST, tolerating syntax errors
+
+    Args:
+        code: Python source
+
+    Returns:
+        Parsed module, or None if the code does not parse
+    """
+    try:
+        return ast.parse(code)
+    except (SyntaxError, ValueError):
+        return None
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of tokens in a prompt without calling the API
+
+    Args:
+        text: Prompt text
+
+    Returns:
+        Approximate token count
+    """
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def normalize_whitespace(code: str) -> str:
+    """
+    Strip trailing whitespace and trailing blank lines
+
+    Every other line is kept, so line numbers still match the submission,
+    and lines ending inside a multi-line string are left untouched because
+    their trailing whitespace is part of the value.
+
+    Args:
+        code: Python source
+
+    Returns:
+        Whitespace-normalized source
+    """
+    lines = code.splitlines()
+    in_string = set()
+    try:
+        for token in tokenize.generate_tokens(io.StringIO(code).readline):
+            if token.type != tokenize.NL and token.start[0] != token.end[0]:
+                in_string.update(range(token.start[0], token.end[0]))
+    except (tokenize.TokenError, IndentationError, SyntaxError):
+        pass
+
+    normalized = [line if row in in_string else line.rstrip() for row, line in enumerate(lines, 1)]
+    return '\n'.join(normalized).rstrip('\n')
+
+
+def strip_comments_and_docstrings(code: str, tree: Optional[ast.Module] = None) -> str:
+    """
+    Remove comments and docstrings from Python source
+
+    Args:
+        code: Python source
+        tree: Optional pre-parsed AST of code
+
+    Returns:
+        Source without comments/docstrings, or the input unchanged if it
+        cannot be parsed or tokenized
+    """
+    tree = tree or parse_code(code)
+    if tree is None:
+        return code
+
+    lines = code.splitlines()
+
+    # Docstrings: cut out exactly their source span, leaving a placeholder when
+    # the docstring is a block's only statement so the block stays valid
+    docstrings = []
+    for node in ast.walk(tree):
+        if not isinstance(node, (ast.Module, ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+            continue
+        body = node.body
+        if body and _is_docstring(body[0]):
+            docstrings.append((body[0], len(body) == 1 and not isinstance(node, ast.Module)))
+
+    # Right to left, so earlier spans keep their offsets
+    for doc, only_statement in sorted(docstrings, key=lambda item: (item[0].lineno, item[0].col_offset), reverse=True):
+        first, last = doc.lineno - 1, doc.end_lineno - 1
+        before = _byte_slice(lines[first], 0, doc.col_offset)
+        after = _byte_slice(lines[last], doc.end_col_offset)
+        if only_statement:
+            text = before + '...' + after
+        else:
+            # Drop the separator before statements that follow on the same line
+            after = after.lstrip()
+            if after.startswith(';'):
+                after = after[1:].lstrip()
+            text = before + after if after else before.rstrip()
+        lines[first:last + 1] = [text] + [''] * (last - first)
+
+    # Comments: drop COMMENT tokens using their exact positions
+    try:
+        tokens = list(tokenize.generate_tokens(io.StringIO('\n'.join(lines) + '\n').readline))
+    except (tokenize.TokenError, IndentationError, SyntaxError):
+        return '\n'.join(lines)
+
+    for token in reversed(tokens):
+        if token.type == tokenize.COMMENT:
+            row, col = token.start
+            lines[row - 1] = lines[row - 1][:col].rstrip()
+
+    return '\n'.join(lines)
+
+
+def minify_code(code: str, strip_docs: bool = False, tree: Optional[ast.Module] = None) -> str:
+    """
+    Produce a token-lean form of code for prompting
+
+    Args:
+        code: Python source
+        strip_docs: Also remove comments and docstrings
+        tree: Optional pre-parsed AST of code
+
+    Returns:
+        Minified source
+    """
+    if strip_docs:
+        code = strip_comments_and_docstrings(code, tree)
+    return normalize_whitespace(code)
+
+
+def _byte_slice(line: str, start: int, end: Optional[int] = None) -> str:
+    """Slice a line by UTF-8 byte offsets, as used by AST column offsets"""
+    return line.encode('utf-8')[start:end].decode('utf-8')
+
+
+def _is_docstring(node: ast.stmt) -> bool:
+    """Check whether a statement is a bare string literal"""
+    return (
+        isinstance(node, ast.Expr)
+        and isinstance(node.value, ast.Constant)
+        and isinstance(node.value.value, str)
+    )
@@ -0,0 +1,300 @@
+"""
+JSON Utilities
+
+This module wraps JSON decoding/encoding with an optional fast backend
+(orjson, used when installed) and provides a tolerant parser for model
+responses, which are sometimes fenced in markdown, surrounded by prose, or
+contain invalid backslash escapes inside code strings. It can also decode
+one string field of a JSON response incrementally, while it is streamed.
+"""
+import json
+import re
+from typing import Any, List, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:  # Optional dependency; fall back to the standard library
+    orjson = None
+
+JSON_BACKEND = 'orjson' if orjson is not None else 'json'
+
+# An escaped backslash, or a backslash that does not start a valid JSON escape
+_ESCAPE_REPAIR_PATTERN = re.compile(r'\\\\|\\(?![\\"/bfnrt]|u[0-9a-fA-F]{4})')
+_LENIENT_DECODER = json.JSONDecoder(strict=False)
+_UNICODE_ESCAPE_PATTERN = re.compile(r'\\u[0-9a-fA-F]{4}')
+_SIMPLE_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+
+def loads(text: str) -> Any:
+    """
+    Decode JSON with the fastest available backend
+
+    Args:
+        text: JSON document
+
+    Returns:
+        Decoded value
+
+    Raises:
+        ValueError: If text is not valid JSON
+    """
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+def dumps(value: Any) -> str:
+    """
+    Encode a value as compact JSON text, keeping non-ASCII characters as-is
+
+    Args:
+        value: JSON-serializable value
+
+    Returns:
+        JSON string
+    """
+    if orjson is not None:
+        return orjson.dumps(value).decode('utf-8')
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+
+def parse_model_json(text: str) -> Any:
+    """
+    Parse the JSON value in a model response, tolerating common defects
+
+    The strict fast path handles well-formed responses in a single pass.
+    Otherwise the value is decoded with raw_decode from the first '{' or '['
+    of the response (ignoring markdown fences and surrounding prose),
+    allowing raw control characters in strings. Only when the decoder
+    rejects an invalid backslash escape are escapes repaired, from that
+    position on, and the value decoded once more.
+
+    Args:
+        text: Raw model response text
+
+    Returns:
+        Decoded value
+
+    Raises:
+        ValueError: If no JSON value can be recovered
+    """
+    text = _strip_fences(text.strip())
+    try:
+        return loads(text)
+    except ValueError:
+        pass
+
+    starts = [index for index in (text.find('{'), text.find('[')) if index != -1]
+    if not starts:
+        raise ValueError("No JSON object found in model response")
+    start = min(starts)
+
+    # Drops lone surrogates and other unencodable characters
+    text = text[start:].encode('utf-8', 'ignore').decode('utf-8')
+    try:
+        value, _ = _LENIENT_DECODER.raw_decode(text)
+        return value
+    except json.JSONDecodeError as e:
+        # Any other defect is not repairable
+        if not e.msg.startswith('Invalid \\'):
+            raise
+        # "Invalid \escape" points at the backslash, "Invalid \uXXXX escape" just after it
+        position = e.pos if text[e.pos] == '\\' else e.pos - 1
+
+    # Everything before the first invalid escape decoded cleanly
+    value, _ = _LENIENT_DECODER.raw_decode(text[:position] + _repair_escapes(text[position:]))
+    return value
+
+
+def _strip_fences(text: str) -> str:
+    """Remove a surrounding ```json ... ``` markdown fence"""
+    if text.startswith('```'):
+        newline = text.find('\n')
+        text = text[newline + 1:] if newline != -1 else text[3:]
+        if text.rstrip().endswith('```'):
+            text = text.rstrip()[:-3]
+    return text.strip()
+
+
+def _repair_escapes(text: str) -> str:
+    """
+    Double backslashes that do not start a valid JSON escape
+
+    Escaped backslashes are matched as pairs and written back unchanged,
+    so already valid escapes are never altered.
+    """
+    return _ESCAPE_REPAIR_PATTERN.sub(r'\\\\', text)
+
+
+class JsonStringFieldStream:
+    """
+    Decode the value of one top-level string field while a JSON response streams in
+
+    The response is scanned with its nesting depth and string state tracked,
+    so only a key of the outermost object matches, not the same name in a
+    nested object or inside another string value. Text is released as soon
+    as it is unambiguous; an escape sequence split across chunks, or a high
+    surrogate escape whose pair has not arrived yet, is held back until it is
+    complete. The full response must still be parsed once it has arrived,
+    since this does not validate it.
+    """
+
+    def __init__(self, field: str):
+        """
+        Args:
+            field: Name of the string field to decode
+        """
+        self._field = field
+        self._buffer = ''
+        # Index of the next undecoded value character, once the key was seen
+        self._position = None
+        # Scanner state until then
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        # Raw text of the outermost-object key being read, if any
+        self._key = None
+        # What the outermost object expects next: 'key', 'colon', 'value' or 'comma'
+        self._expect = None
+        self._matched = False
+        self.done = False
+
+    def feed(self, chunk: str) -> str:
+        """
+        Add a chunk of the raw response
+
+        Args:
+            chunk: Next piece of response text
+
+        Returns:
+            Newly decoded text of the field value (possibly empty)
+        """
+        if self.done:
+            return ''
+        self._buffer += chunk
+
+        if self._position is None:
+            self._position = self._find_value()
+            if self._position is None:
+                # Everything scanned so far is reflected in the scanner state
+                self._buffer = ''
+                return ''
+
+        decoded: List[str] = []
+        buffer, position = self._buffer, self._position
+        while position < len(buffer):
+            char = buffer[position]
+            if char == '"':
+                self.done = True
+                break
+            if char != '\\':
+                end = position + 1
+                while end < len(buffer) and buffer[end] not in '"\\':
+                    end += 1
+                decoded.append(buffer[position:end])
+                position = end
+                continue
+
+            escape = buffer[position + 1:position + 2]
+            if not escape:
+                break
+            if escape != 'u':
+                # Models sometimes emit invalid escapes; keep them verbatim
+                decoded.append(_SIMPLE_ESCAPES.get(escape, '\\' + escape))
+                position += 2
+                continue
+            text, length = _decode_unicode_escapes(buffer[position:position + 12])
+            if length == 0:
+                break
+            decoded.append(text)
+            position += length
+
+        # Keep only what is still needed to decode the rest
+        self._buffer, self._position = buffer[position:], 0
+        return ''.join(decoded)
+
+    def _find_value(self) -> Optional[int]:
+        """Scan the buffer for the field's value, returning the index after its opening quote"""
+        for index, char in enumerate(self._buffer):
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._key is not None:
+                        self._matched = _decode_json_string(self._key) == self._field
+                        self._key = None
+                        self._expect = 'colon'
+                    continue
+                if self._key is not None:
+                    self._key += char
+            elif self._depth == 0:
+                # Prose or a markdown fence before the JSON value
+                if char in '{[':
+                    self._depth = 1
+                    self._expect = 'key' if char == '{' else None
+            elif char == '"':
+                self._in_string = True
+                if self._depth == 1 and self._expect == 'key':
+                    self._key = ''
+                elif self._depth == 1 and self._expect == 'value':
+                    if self._matched:
+                        return index + 1
+                    self._expect = 'comma'
+            elif char in '{[':
+                if self._depth == 1 and self._expect == 'value':
+                    self._expect = 'comma'
+                self._depth += 1
+            elif char in '}]':
+                self._depth -= 1
+            elif self._depth == 1:
+                if char == ':' and self._expect == 'colon':
+                    self._expect = 'value'
+                elif char == ',':
+                    self._expect = 'key'
+                elif self._expect == 'value' and not char.isspace():
+                    # Number, true, false or null
+                    self._expect = 'comma'
+        return None
+
+
+def _decode_unicode_escapes(sequence: str) -> Tuple[str, int]:
+    """
+    Decode the \\uXXXX escape at the start of sequence, with its surrogate pair
+
+    Args:
+        sequence: Text starting with a \\u escape; up to 12 characters are read
+
+    Returns:
+        Tuple of (decoded text, characters consumed); ('', 0) means more input
+        is needed. Unpaired surrogates decode to U+FFFD, and the \\u of an
+        invalid escape is kept verbatim.
+    """
+    if len(sequence) < 6:
+        return '', 0
+    if not _UNICODE_ESCAPE_PATTERN.match(sequence):
+        return sequence[:2], 2
+    char = _decode_json_string(sequence[:6])
+    if '\udc00' <= char <= '\udfff':
+        return '\ufffd', 6
+    if not '\ud800' <= char <= '\udbff':
+        return char, 6
+
+    # High surrogate: decode it with its pair, or wait until that can be told
+    rest = sequence[6:]
+    if rest[:2] in ('', '\\') or (len(rest) < 6 and rest.startswith('\\u')):
+        return '', 0
+    pair = _decode_json_string(sequence[:12]) if rest.startswith('\\u') else None
+    if pair is not None and len(pair) == 1:
+        return pair, 12
+    return '\ufffd', 6
+
+
+def _decode_json_string(text: str) -> Optional[str]:
+    """Decode the contents of a JSON string literal, or None if invalid"""
+    try:
+        return json.loads('"%s"' % text)
+    except ValueError:
+        return None
@@ -15,13 +15,29 @@ class ValidationError(Exception):
     pass
 
 
-def validate_code_input(code: str, max_length: int = 10000) -> str:
+# Code patterns that are logged as warnings (and reported by the static metrics)
+DANGEROUS_CODE_PATTERNS = [
+    r'import\s+os',
+    r'import\s+subprocess',
+    r'import\s+sys',
+    r'__import__',
+    r'eval\s*\(',
+    r'exec\s*\(',
+    r'compile\s*\(',
+    r'open\s*\(',
+    r'file\s*\(',
+]
+
+
+def validate_code_input(code: str, max_length: int = 10000, check_syntax: bool = True) -> str:
     """
     Validate and sanitize code input
     
     Args:
         code: The code string to validate
         max_length: Maximum allowed length
+        check_syntax: Parse the code to note syntax errors; callers that parse
+            it themselves can skip this
         
     Returns:
         Cleaned code string
@@ -39,29 +55,18 @@ def validate_code_input(code: str, max_length: int = 10000) -> str:
         raise ValidationError(f"Code exceeds maximum length of {max_length} characters")
     
     # Check for potentially dangerous patterns
-    dangerous_patterns = [
-        r'import\s+os',
-        r'import\s+subprocess',
-        r'import\s+sys',
-        r'__import__',
-        r'eval\s*\(',
-        r'exec\s*\(',
-        r'compile\s*\(',
-        r'open\s*\(',
-        r'file\s*\(',
-    ]
-    
-    for pattern in dangerous_patterns:
+    for pattern in DANGEROUS_CODE_PATTERNS:
         if re.search(pattern, code, re.IGNORECASE):
             print(f"Warning: Potentially dangerous code pattern detected: {pattern}")
             # Log but don't block - let AI analysis proceed with warnings
     
     # Validate Python syntax (basic check)
-    try:
-        ast.parse(code)
-    except SyntaxError:
-        # Don't block invalid syntax - AI can analyze broken code too
-        print("Note: Code has syntax errors, but proceeding with analysis")
+    if check_syntax:
+        try:
+            ast.parse(code)
+        except SyntaxError:
+            # Don't block invalid syntax - AI can analyze broken code too
+            print("Note: Code has syntax errors, but proceeding with analysis")
     
     return code.strip()
 
@@ -109,6 +114,40 @@ def validate_prompt_input(prompt: str, max_length: int = 1000) -> str:
     return prompt.strip()
 
 
+def validate_stages_input(stages: Union[str, List[str], None], allowed: tuple) -> tuple:
+    """
+    Validate a requested subset of analysis stages
+    
+    Args:
+        stages: List of stage names or a comma-separated string; empty means all
+        allowed: All stage names, in canonical order
+        
+    Returns:
+        Requested stages in canonical order, without duplicates
+        
+    Raises:
+        ValidationError: If validation fails
+    """
+    if stages is None or stages == '' or stages == []:
+        return allowed
+    
+    if isinstance(stages, str):
+        stages = stages.split(',')
+    if not isinstance(stages, list) or not all(isinstance(stage, str) for stage in stages):
+        raise ValidationError("Stages must be a list of stage names")
+    
+    requested = {stage.strip().lower() for stage in stages if stage.strip()}
+    unknown = requested - set(allowed)
+    if unknown:
+        raise ValidationError(
+            f"Unknown stages: {', '.join(sorted(unknown))} (expected any of {', '.join(allowed)})"
+        )
+    if not requested:
+        return allowed
+    
+    return tuple(stage for stage in allowed if stage in requested)
+
+
 def validate_project_idea_data(data: Dict[str, Any]) -> Dict[str, Any]:
     """
     Validate project idea creation/update data
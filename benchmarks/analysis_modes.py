@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Benchmark: fan-out vs consolidated analysis mode
+
+Compares the input tokens each mode sends per analysis and, with --live,
+the end-to-end latency of real analyses against the configured model.
+
+Usage:
+    python benchmarks/analysis_modes.py [--file PATH] [--live RUNS]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+# Add project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config import config
+from app.services.ai_service import AIAnalysisService
+from app.utils.code_minifier import estimate_tokens
+
+MODES = ('fanout', 'consolidated')
+DEFAULT_SAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app', 'utils', 'validation.py')
+SAMPLE_PROMPT = "Write input validation helpers for a Flask API"
+SAMPLE_CONTEXT = """
+Project Context:
+- Name: Benchmark Project
+- Description: Sample project used for benchmarking
+- Stack: Python, Flask
+- Architecture: Monolith
+- Code Style Preferences: PEP 8
+
+Given this project context, please provide analysis that aligns with the project's architecture and coding patterns.
+"""
+
+
+def render_prompts(service, mode, prompt_data):
+    """Render every prompt one analysis sends in the given mode"""
+    config.AI_ANALYSIS_MODE = mode
+    return [
+        service._get_stage_prompt(stage).format(**service._stage_prompt_data(stage, prompt_data))
+        for stage in service._get_call_plan(prompt_data)
+    ]
+
+
+def count_tokens(service, prompts, live):
+    """Count input tokens with the model tokenizer when live, else estimate"""
+    if live:
+        return sum(service.provider.count_tokens(service.model_name, p) for p in prompts)
+    return sum(estimate_tokens(p) for p in prompts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--file', default=DEFAULT_SAMPLE, help='Python file to analyze')
+    parser.add_argument('--live', type=int, default=0, metavar='RUNS',
+                        help='Run RUNS real analyses per mode (requires GEMINI_API_KEY, '
+                             'or AI_PROVIDER=stub for an offline run)')
+    args = parser.parse_args()
+
+    with open(args.file, 'r', encoding='utf-8') as f:
+        code = f.read()[:config.MAX_CODE_LENGTH]
+
+    if args.live:
+        config.ANALYSIS_CACHE_ENABLED = False
+        service = AIAnalysisService()
+    else:
+        # Prompt templates do not need a configured client
+        service = AIAnalysisService.__new__(AIAnalysisService)
+
+    prompt_data = service._build_prompt_data(SAMPLE_PROMPT, code, SAMPLE_CONTEXT)
+
+    print(f"Sample: {args.file} ({len(code)} characters)")
+    print(f"Token counts: {'model tokenizer' if args.live else 'estimated (~4 chars/token)'}")
+    print("-" * 60)
+    print(f"{'mode':<14}{'calls':>6}{'input tokens':>16}{'p50 s':>10}{'max s':>10}")
+
+    for mode in MODES:
+        prompts = render_prompts(service, mode, prompt_data)
+        tokens = count_tokens(service, prompts, args.live)
+
+        latencies = []
+        for _ in range(args.live):
+            started = time.perf_counter()
+            service._run_analysis(prompt_data)
+            latencies.append(time.perf_counter() - started)
+
+        p50 = f"{statistics.median(latencies):.2f}" if latencies else '-'
+        worst = f"{max(latencies):.2f}" if latencies else '-'
+        print(f"{mode:<14}{len(prompts):>6}{tokens:>16}{p50:>10}{worst:>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Benchmark: AI response JSON handling
+
+Times the per-stage response path on representative 50-100 KB refactor
+responses: the previous parse -> serialize -> parse round trip against the
+current single parse into an object, with the standard library backend and,
+when installed, orjson. Also times responses that need escape repair.
+
+Usage:
+    python benchmarks/json_path.py [--iterations N]
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+# Add project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils import json_utils
+
+SIZES_KB = (50, 100)
+
+CODE_BLOCK = '''def parse_record(line: str) -> dict:
+    """Parse one "key=value" record, e.g. 'name=Zoë\\tage=30'."""
+    fields = {}
+    for part in re.split(r"\\t+", line.strip()):
+        key, _, value = part.partition("=")
+        fields[key] = value.replace("\\\\n", "\\n")
+    return fields
+
+'''
+
+
+def make_response(size_kb, broken_escapes=False):
+    """Build a refactor-stage response of about size_kb kilobytes"""
+    code = CODE_BLOCK * (size_kb * 1024 // len(CODE_BLOCK) + 1)
+    text = json.dumps({
+        'refactored_code': code[:size_kb * 1024],
+        'project_roadmap': "Your Architectural Next Steps:\n1. Split modules.\n2. Add configuration.\n3. Add tests."
+    }, ensure_ascii=False)
+    if broken_escapes:
+        # Models sometimes emit regex escapes like \d unescaped inside strings
+        text = text.replace('\\\\t+', '\\d+')
+    return f"```json\n{text}\n```"
+
+
+def legacy_path(raw_text):
+    """The previous path: clean, parse, re-serialize, then parse again to normalize"""
+    raw_text = raw_text.strip()
+    if raw_text.startswith('```json'):
+        raw_text = raw_text[len('```json'):].strip()
+    if raw_text.endswith('```'):
+        raw_text = raw_text[:-3].strip()
+    raw_text = raw_text.encode('utf-8', 'ignore').decode('utf-8')
+    try:
+        serialized = json.dumps(json.loads(raw_text), ensure_ascii=False)
+    except json.JSONDecodeError:
+        cleaned = re.sub(r'\\(?!["\\/bfnrtu])', r'\\\\', raw_text)
+        serialized = json.dumps(json.loads(cleaned), ensure_ascii=False)
+    data = json.loads(serialized)
+    data['project_roadmap'] = [step.strip() for step in data['project_roadmap'].split('\n') if step.strip()]
+    return data
+
+
+def current_path(raw_text):
+    """The current path: one tolerant parse, then a shallow normalize"""
+    data = dict(json_utils.parse_model_json(raw_text))
+    data['project_roadmap'] = [step.strip() for step in data['project_roadmap'].split('\n') if step.strip()]
+    return data
+
+
+def time_call(fn, arg, iterations):
+    """Median-of-5 mean time per call in milliseconds"""
+    samples = []
+    for _ in range(5):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            fn(arg)
+        samples.append((time.perf_counter() - started) / iterations * 1000)
+    return sorted(samples)[2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=50, help='Calls per timing sample')
+    args = parser.parse_args()
+
+    fast_backend = json_utils.orjson
+    print(f"Fast JSON backend: {'orjson' if fast_backend is not None else 'not installed'}")
+    print("-" * 72)
+    print(f"{'response':<22}{'legacy ms':>12}{'json ms':>12}{'orjson ms':>12}{'speedup':>12}")
+
+    for size_kb in SIZES_KB:
+        for broken in (False, True):
+            raw = make_response(size_kb, broken_escapes=broken)
+            label = f"{size_kb} KB{' bad escapes' if broken else ''}"
+
+            if not broken:
+                assert legacy_path(raw) == current_path(raw)
+            legacy_ms = time_call(legacy_path, raw, args.iterations)
+
+            json_utils.orjson = None
+            stdlib_ms = time_call(current_path, raw, args.iterations)
+            json_utils.orjson = fast_backend
+
+            fast_ms = time_call(current_path, raw, args.iterations) if fast_backend is not None else None
+            best_ms = fast_ms if fast_ms is not None else stdlib_ms
+
+            fast_column = f"{fast_ms:.3f}" if fast_ms is not None else '-'
+            print(f"{label:<22}{legacy_ms:>12.3f}{stdlib_ms:>12.3f}{fast_column:>12}{legacy_ms / best_ms:>11.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Load test: concurrent analyses against the local stub provider
+
+Runs many analyses through AIAnalysisService with AI_PROVIDER=stub, so
+executor sizing, caching and scheduling changes can be compared offline.
+Stub latency and failures are seeded, so repeated runs with the same
+settings send the same calls.
+
+Usage:
+    python benchmarks/load_test.py [--requests N] [--clients N] [--workers N]
+                                   [--latency-ms MS] [--error-rate R] [--unique N]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Add project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config import config
+from app.services.ai_service import AIAnalysisService
+
+SAMPLE_PROMPT = "Write a function that sums the even numbers in a list"
+SAMPLE_CODE = """def sum_even(numbers):
+    total = 0
+    for n in numbers:
+        if n % 2 == 0:
+            total += n
+    return total
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=100, help='Total analyses to run')
+    parser.add_argument('--clients', type=int, default=20, help='Concurrent client threads')
+    parser.add_argument('--workers', type=int, default=config.AI_EXECUTOR_WORKERS, help='AI executor workers')
+    parser.add_argument('--latency-ms', type=float, default=config.AI_STUB_LATENCY_MS, help='Median stub latency')
+    parser.add_argument('--error-rate', type=float, default=config.AI_STUB_ERROR_RATE, help='Stub failure rate')
+    parser.add_argument('--unique', type=int, default=0,
+                        help='Distinct submissions (0 = all distinct); lower values exercise the cache')
+    args = parser.parse_args()
+
+    config.AI_PROVIDER = 'stub'
+    config.AI_STUB_LATENCY_MS = args.latency_ms
+    config.AI_STUB_ERROR_RATE = args.error_rate
+    config.AI_EXECUTOR_WORKERS = args.workers
+    config.AI_EXECUTOR_MAX_QUEUE = max(config.AI_EXECUTOR_MAX_QUEUE, args.requests * 3)
+    config.AI_TENANT_MAX_QUEUE = 0
+    config.ANALYSIS_CACHE_DIR = ''
+    config.AI_INCREMENTAL_ENABLED = False
+    service = AIAnalysisService()
+
+    def run(index):
+        variant = index % args.unique if args.unique else index
+        code = f"{SAMPLE_CODE}\nLIMIT = {variant}\n"
+        started = time.perf_counter()
+        try:
+            result = service.analyze_code(SAMPLE_PROMPT, code, user_id=f"user-{index % 10}")
+            ok = not service._has_stage_errors(result)
+        except Exception:
+            ok = False
+        return time.perf_counter() - started, ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.clients) as clients:
+        outcomes = list(clients.map(run, range(args.requests)))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for latency, _ in outcomes)
+    failures = sum(1 for _, ok in outcomes if not ok)
+    metrics = service.executor.metrics()
+
+    print(f"Requests: {args.requests}  clients: {args.clients}  workers: {args.workers}  "
+          f"stub latency: {args.latency_ms:.0f}ms  error rate: {args.error_rate}")
+    print("-" * 60)
+    print(f"Throughput:      {args.requests / elapsed:.2f} analyses/s ({elapsed:.1f}s total)")
+    print(f"Latency p50:     {statistics.median(latencies):.2f}s")
+    print(f"Latency p95:     {latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]:.2f}s")
+    print(f"Failures:        {failures}")
+    print(f"Cache:           {service.cache.stats() if service.cache else 'disabled'}")
+    print(f"Queue wait (ms): {metrics['wait_ms']}")
+    service.executor.shutdown()
+
+
+if __name__ == '__main__':
+    main()
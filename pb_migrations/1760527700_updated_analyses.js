@@ -0,0 +1,89 @@
+/// <reference path="../pb_data/types.d.ts" />
+migrate((db) => {
+  const dao = new Dao(db)
+  const collection = dao.findCollectionByNameOrId("analyses_collection")
+
+  collection.updateRule = "@request.auth.id = user_id"
+
+  // update
+  collection.schema.addField(new SchemaField({
+    "system": false,
+    "id": "analysis_scores",
+    "name": "scores",
+    "type": "json",
+    "required": false,
+    "presentable": false,
+    "unique": false,
+    "options": {
+      "maxSize": 10000
+    }
+  }))
+
+  // update
+  collection.schema.addField(new SchemaField({
+    "system": false,
+    "id": "analysis_reports",
+    "name": "reports",
+    "type": "json",
+    "required": false,
+    "presentable": false,
+    "unique": false,
+    "options": {
+      "maxSize": 500000
+    }
+  }))
+
+  // add
+  collection.schema.addField(new SchemaField({
+    "system": false,
+    "id": "analysis_stages",
+    "name": "stages",
+    "type": "json",
+    "required": false,
+    "presentable": false,
+    "unique": false,
+    "options": {
+      "maxSize": 1000
+    }
+  }))
+
+  return dao.saveCollection(collection)
+}, (db) => {
+  const dao = new Dao(db)
+  const collection = dao.findCollectionByNameOrId("analyses_collection")
+
+  collection.updateRule = null
+
+  // update
+  collection.schema.addField(new SchemaField({
+    "system": false,
+    "id": "analysis_scores",
+    "name": "scores",
+    "type": "json",
+    "required": true,
+    "presentable": false,
+    "unique": false,
+    "options": {
+      "maxSize": 10000
+    }
+  }))
+
+  // update
+  collection.schema.addField(new SchemaField({
+    "system": false,
+    "id": "analysis_reports",
+    "name": "reports",
+    "type": "json",
+    "required": true,
+    "presentable": false,
+    "unique": false,
+    "options": {
+      "maxSize": 500000
+    }
+  }))
+
+  // remove
+  collection.schema.removeField("analysis_stages")
+
+  return dao.saveCollection(collection)
+})
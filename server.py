@@ -21,7 +21,8 @@ if __name__ == '__main__':
     print("🚀 Starting Code Critique Engine (Development)")
     print(f"• Config: {type(config).__name__}")
     print(f"• Debug: {config.DEBUG}")
-    print(f"• AI Model: {config.GEMINI_MODEL}")
+    print(f"• AI Provider: {config.AI_PROVIDER}")
+    print(f"• AI Model: {config.GEMINI_MODEL or 'auto-discover'}")
     print(f"• PocketBase URL: {config.POCKETBASE_URL}")
     print(f"• GEMINI_API_KEY: {'✅ Set' if config.GEMINI_API_KEY else '❌ Missing'}")
     print("----------------------------------------")
@@ -88,6 +88,79 @@ class APIClient {
         });
     }
 
+    /**
+     * Stream an analysis over Server-Sent Events.
+     * Calls onEvent(eventName, data) for each stage as it completes (and for
+     * "refactor_delta" / "refactor_reset" text events while the refactored
+     * code is generated) and resolves with the final "complete" payload.
+     */
+    async analyzeCodeStream(prompt, code, projectId = null, onEvent = () => {}) {
+        const payload = { prompt, code };
+        if (projectId) {
+            payload.project_id = projectId;
+        }
+
+        const token = authService.getToken();
+        const response = await fetch(`${this.baseURL}/analyze/stream`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                ...(token ? { 'Authorization': `Bearer ${token}` } : {})
+            },
+            body: JSON.stringify(payload)
+        });
+
+        if (response.status === 401) {
+            authService.clearAuth();
+            router.navigate('/auth');
+            throw new Error('Session expired');
+        }
+
+        if (!response.ok) {
+            const data = await response.json();
+            throw new Error(data.error || data.details || 'API request failed');
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let finalResults = null;
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            // SSE messages are separated by a blank line
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const message = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+
+                let eventName = 'message';
+                let dataText = '';
+                for (const line of message.split('\n')) {
+                    if (line.startsWith('event: ')) eventName = line.slice(7);
+                    else if (line.startsWith('data: ')) dataText += line.slice(6);
+                }
+                const data = dataText ? JSON.parse(dataText) : {};
+
+                if (eventName === 'error') {
+                    throw new Error(data.error || data.details || 'Analysis failed');
+                }
+                if (eventName === 'complete') {
+                    finalResults = data;
+                }
+                onEvent(eventName, data);
+            }
+        }
+
+        if (!finalResults) {
+            throw new Error('Analysis stream ended unexpectedly');
+        }
+        return finalResults;
+    }
+
     async getAnalyses(projectId = null, page = 1, perPage = 20) {
         let url = `/api/analyses?page=${page}&per_page=${perPage}`;
         if (projectId) {
@@ -79,14 +79,23 @@ function setupAnalyzeForm() {
         btn.disabled = true;
 
         try {
-            const results = await apiClient.analyzeCode(prompt, code, projectId);
-            
-            // Display results
-            displayResults(results);
+            // Show section placeholders and fill them as stages stream in
+            displayPendingResults();
             resultsDiv.style.display = 'block';
-            
-            // Scroll to results
             resultsDiv.scrollIntoView({ behavior: 'smooth' });
+
+            const results = await apiClient.analyzeCodeStream(prompt, code, projectId, (stage, data) => {
+                if (stage === 'refactor_delta') {
+                    appendRefactorText(data.text);
+                } else if (stage === 'refactor_reset') {
+                    clearRefactorText();
+                } else if (STAGE_RENDERERS[stage]) {
+                    document.getElementById(`${stage}Section`).innerHTML = STAGE_RENDERERS[stage](data);
+                }
+            });
+            
+            // Render the combined results once every stage has arrived
+            displayResults(results);
             
         } catch (error) {
             errorDiv.textContent = `Analysis failed: ${error.message}`;
@@ -97,70 +106,128 @@ function setupAnalyzeForm() {
     });
 }
 
-function displayResults(results) {
+const STAGE_RENDERERS = {
+    scores: renderScoresSection,
+    reports: renderReportsSection,
+    refactor: renderRefactorSection
+};
+
+function displayPendingResults() {
     const resultsDiv = document.getElementById('analysisResults');
     
     resultsDiv.innerHTML = `
         <div class="results-container">
             <h2>Analysis Results</h2>
-            
-            <!-- Scores -->
-            <div class="scores-grid">
-                <div class="score-card">
-                    <h3>${results.total_score}</h3>
-                    <p>Total Score (out of 25)</p>
-                </div>
-                <div class="score-card">
-                    <h3>${results.reliability_score}</h3>
-                    <p>Reliability (out of 10)</p>
-                </div>
-                <div class="score-card">
-                    <h3>${results.mastery_score}</h3>
-                    <p>Mastery (out of 15)</p>
+            ${Object.keys(STAGE_RENDERERS).map(stage => `
+                <div id="${stage}Section">
+                    <div class="result-section"><p>Analyzing ${stage}...</p></div>
                 </div>
-            </div>
+            `).join('')}
+        </div>
+    `;
+}
 
-            <!-- Explanation -->
+// Refactored code is shown as it streams in, then replaced by the validated "refactor" result
+function appendRefactorText(text) {
+    let codeElement = document.getElementById('refactorStreamCode');
+    if (!codeElement) {
+        document.getElementById('refactorSection').innerHTML = `
             <div class="result-section">
-                <h3>Summary</h3>
-                <p>${escapeHtml(results.explanation_summary)}</p>
+                <h3>Refactored Code</h3>
+                <pre><code id="refactorStreamCode"></code></pre>
             </div>
+        `;
+        codeElement = document.getElementById('refactorStreamCode');
+    }
+    codeElement.append(text);
+}
 
-            <!-- Debug Prognosis -->
-            ${results.debug_prognosis ? `
-                <div class="result-section alert-warning">
-                    <h3>⚠️ Debug Prognosis</h3>
-                    <p>${escapeHtml(results.debug_prognosis)}</p>
-                </div>
-            ` : ''}
-
-            <!-- Reports -->
-            <div class="reports-grid">
-                ${renderReport('Clarity', results.clarity)}
-                ${renderReport('Modularity', results.modularity)}
-                ${renderReport('Efficiency', results.efficiency)}
-                ${renderReport('Security', results.security)}
-                ${renderReport('Documentation', results.documentation)}
+function clearRefactorText() {
+    const codeElement = document.getElementById('refactorStreamCode');
+    if (codeElement) {
+        codeElement.textContent = '';
+    }
+}
+
+function displayResults(results) {
+    const resultsDiv = document.getElementById('analysisResults');
+    
+    resultsDiv.innerHTML = `
+        <div class="results-container">
+            <h2>Analysis Results</h2>
+            <div id="scoresSection">${renderScoresSection(results)}</div>
+            <div id="reportsSection">${renderReportsSection(results)}</div>
+            <div id="refactorSection">${renderRefactorSection(results)}</div>
+        </div>
+    `;
+}
+
+function renderScoresSection(results) {
+    return `
+        <!-- Scores -->
+        <div class="scores-grid">
+            <div class="score-card">
+                <h3>${results.total_score}</h3>
+                <p>Total Score (out of 25)</p>
+            </div>
+            <div class="score-card">
+                <h3>${results.reliability_score}</h3>
+                <p>Reliability (out of 10)</p>
             </div>
+            <div class="score-card">
+                <h3>${results.mastery_score}</h3>
+                <p>Mastery (out of 15)</p>
+            </div>
+        </div>
 
-            <!-- Refactored Code -->
-            ${results.refactored_code ? `
-                <div class="result-section">
-                    <h3>Refactored Code</h3>
-                    <pre><code>${escapeHtml(results.refactored_code)}</code></pre>
-                </div>
-            ` : ''}
-
-            <!-- Roadmap -->
-            ${results.project_roadmap && results.project_roadmap.length > 0 ? `
-                <div class="result-section">
-                    <h3>Architectural Roadmap</h3>
-                    <ol class="roadmap-list">
-                        ${results.project_roadmap.map(step => `<li>${escapeHtml(step)}</li>`).join('')}
-                    </ol>
-                </div>
-            ` : ''}
+        <!-- Explanation -->
+        <div class="result-section">
+            <h3>Summary</h3>
+            <p>${escapeHtml(results.explanation_summary)}</p>
         </div>
+
+        <!-- Debug Prognosis -->
+        ${results.debug_prognosis ? `
+            <div class="result-section alert-warning">
+                <h3>⚠️ Debug Prognosis</h3>
+                <p>${escapeHtml(results.debug_prognosis)}</p>
+            </div>
+        ` : ''}
+    `;
+}
+
+function renderReportsSection(results) {
+    return `
+        <!-- Reports -->
+        <div class="reports-grid">
+            ${renderReport('Clarity', results.clarity)}
+            ${renderReport('Modularity', results.modularity)}
+            ${renderReport('Efficiency', results.efficiency)}
+            ${renderReport('Security', results.security)}
+            ${renderReport('Documentation', results.documentation)}
+        </div>
+    `;
+}
+
+function renderRefactorSection(results) {
+    return `
+        <!-- Refactored Code -->
+        ${results.refactored_code ? `
+            <div class="result-section">
+                <h3>Refactored Code</h3>
+                <pre><code>${escapeHtml(results.refactored_code)}</code></pre>
+            </div>
+        ` : ''}
+
+        <!-- Roadmap -->
+        ${results.project_roadmap && results.project_roadmap.length > 0 ? `
+            <div class="result-section">
+                <h3>Architectural Roadmap</h3>
+                <ol class="roadmap-list">
+                    ${results.project_roadmap.map(step => `<li>${escapeHtml(step)}</li>`).join('')}
+                </ol>
+            </div>
+        ` : ''}
     `;
 }
 
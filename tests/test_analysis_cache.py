@@ -0,0 +1,47 @@
+"""
+Tests for the analysis cache disk tier
+
+Run with: python -m unittest discover tests
+"""
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from app.services.analysis_cache import AnalysisCache
+
+
+class DiskTierLimitTest(unittest.TestCase):
+    """The disk tier must stay under its file cap, dropping the oldest files"""
+
+    def setUp(self):
+        self.disk_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.disk_dir)
+
+    def test_oldest_files_are_pruned(self):
+        cache = AnalysisCache(max_entries=1, ttl_seconds=100, disk_dir=self.disk_dir, max_disk_entries=10)
+        now = time.time()
+        for index in range(25):
+            cache.set(f'k{index}', {'index': index})
+            os.utime(os.path.join(self.disk_dir, f'k{index}.json'), (now, now - 50 + index))
+
+        self.assertLessEqual(len(os.listdir(self.disk_dir)), 10)
+        self.assertEqual(cache.stats()['disk_entries'], len(os.listdir(self.disk_dir)))
+        cache.clear()
+        self.assertEqual(cache.get('k24'), {'index': 24})
+        self.assertIsNone(cache.get('k14'))
+
+    def test_expired_files_are_swept_at_startup(self):
+        cache = AnalysisCache(ttl_seconds=100, disk_dir=self.disk_dir)
+        cache.set('old', {'a': 1})
+        cache.set('new', {'a': 2})
+        os.utime(os.path.join(self.disk_dir, 'old.json'), (0, 0))
+
+        cache = AnalysisCache(ttl_seconds=100, disk_dir=self.disk_dir)
+        self.assertEqual(os.listdir(self.disk_dir), ['new.json'])
+        self.assertEqual(cache.stats()['disk_entries'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+"""
+Tests for the code minifier
+
+Run with: python -m unittest discover tests
+"""
+import ast
+import unittest
+
+from app.utils.code_minifier import normalize_whitespace, strip_comments_and_docstrings
+
+
+class StripCommentsAndDocstringsTest(unittest.TestCase):
+    """Docstring removal must keep the code valid and every other statement"""
+
+    def assertStrips(self, code, expected):
+        stripped = strip_comments_and_docstrings(code)
+        ast.parse(stripped)
+        self.assertEqual(stripped, expected)
+
+    def test_docstring_on_def_line_becomes_placeholder(self):
+        self.assertStrips('def f(): "doc"\n', 'def f(): ...')
+
+    def test_statement_after_docstring_on_same_line_is_kept(self):
+        self.assertStrips('def f():\n    """doc"""; return 1\n', 'def f():\n    return 1')
+
+    def test_statement_after_multiline_docstring_is_kept(self):
+        self.assertStrips('def f():\n    """a\n    b"""; return 2\n', 'def f():\n    return 2\n')
+
+    def test_docstring_lines_are_blanked(self):
+        self.assertStrips('def f():\n    """a\n    b"""\n    return 1\n', 'def f():\n\n\n    return 1')
+
+    def test_only_docstring_in_class_becomes_placeholder(self):
+        self.assertStrips('class A:\n    """doc"""\n', 'class A:\n    ...')
+
+    def test_module_docstring_is_removed(self):
+        self.assertStrips('"""mod"""\nx = 1\n', '\nx = 1')
+
+    def test_offsets_are_utf8_bytes(self):
+        self.assertStrips('def g():\n    "é"; x = "é"  # c\n    return x\n', 'def g():\n    x = "é"\n    return x')
+
+    def test_comments_are_removed(self):
+        self.assertStrips('x = 1  # one\n# alone\ny = "# kept"\n', 'x = 1\n\ny = "# kept"')
+
+    def test_unparseable_code_is_unchanged(self):
+        self.assertEqual(strip_comments_and_docstrings('def f(:\n'), 'def f(:\n')
+
+
+class NormalizeWhitespaceTest(unittest.TestCase):
+    """Whitespace normalization must not change program text"""
+
+    def test_multiline_string_contents_are_kept(self):
+        code = 'x = """a  \n\n\n b"""\n'
+        self.assertEqual(ast.literal_eval(normalize_whitespace(code)[4:]), 'a  \n\n\n b')
+
+
+if __name__ == '__main__':
+    unittest.main()
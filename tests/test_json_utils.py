@@ -0,0 +1,77 @@
+"""
+Tests for the JSON utilities
+
+Run with: python -m unittest discover tests
+"""
+import json
+import unittest
+
+from app.utils.json_utils import JsonStringFieldStream, parse_model_json
+
+
+def stream(text, field='refactored_code', size=1):
+    """Feed text to a JsonStringFieldStream in chunks of size characters"""
+    decoder = JsonStringFieldStream(field)
+    return ''.join(decoder.feed(text[index:index + size]) for index in range(0, len(text), size))
+
+
+class JsonStringFieldStreamTest(unittest.TestCase):
+    """Streamed decoding must match the final parse of the same field"""
+
+    def test_matches_full_parse_for_any_chunking(self):
+        value = 'def f():\n    return "a\\\\b"\té \U0001F600'
+        text = json.dumps({'project_roadmap': 'x', 'refactored_code': value})
+        for size in range(1, 15):
+            self.assertEqual(stream(text, size=size), value)
+
+    def test_surrogate_pair_split_across_chunks(self):
+        text = '{"refactored_code": "a\\uD83D\\uDE00b"}'
+        for split in range(len(text)):
+            decoder = JsonStringFieldStream('refactored_code')
+            out = decoder.feed(text[:split]) + decoder.feed(text[split:])
+            self.assertEqual(out, 'a\U0001F600b')
+
+    def test_unpaired_surrogates_are_replaced(self):
+        self.assertEqual(stream('{"refactored_code": "\\uD83Dx\\uDE00"}'), '�x�')
+        self.assertEqual(stream('{"refactored_code": "\\uD83D\\n"}'), '�\n')
+
+    def test_nested_key_is_ignored(self):
+        text = '{"report": {"refactored_code": "nested"}, "refactored_code": "top"}'
+        self.assertEqual(stream(text), 'top')
+
+    def test_key_inside_string_value_is_ignored(self):
+        text = '{"summary": "\\"refactored_code\\": \\"fake\\"", "refactored_code": "real"}'
+        self.assertEqual(stream(text), 'real')
+
+    def test_key_as_value_is_ignored(self):
+        text = '{"name": "refactored_code", "refactored_code": "real"}'
+        self.assertEqual(stream(text), 'real')
+
+    def test_prose_before_json(self):
+        self.assertEqual(stream('Here it is:\n```json\n{"refactored_code": "x = 1"}\n```'), 'x = 1')
+
+    def test_non_string_value_is_skipped(self):
+        self.assertEqual(stream('{"refactored_code": null, "other": "x"}'), '')
+
+    def test_invalid_escapes_are_kept(self):
+        self.assertEqual(stream('{"refactored_code": "a\\d\\uZZ"}'), 'a\\d\\uZZ')
+
+
+
+class ParseModelJsonTest(unittest.TestCase):
+    """Escape repair must only touch text the decoder rejected"""
+
+    def test_invalid_escapes_are_kept_literally(self):
+        text = '{"a": "\\" \\u00e9 x\\dy \\\\d", "b": "\\uZZ"}'
+        self.assertEqual(parse_model_json(text), {'a': '" é x\\dy \\d', 'b': '\\uZZ'})
+
+    def test_prose_and_fences_are_skipped(self):
+        self.assertEqual(parse_model_json('Sure:\n```json\n{"a": [1, 2]}\n```'), {'a': [1, 2]})
+
+    def test_other_defects_are_not_repaired(self):
+        with self.assertRaises(ValueError):
+            parse_model_json('{"a": 1,,}')
+
+
+if __name__ == '__main__':
+    unittest.main()